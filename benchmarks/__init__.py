@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for sfdata-stream-parser.
+
+These are not part of the test suite. Run the scenarios with ``python -m benchmarks``, and the individual
+micro-benchmarks with ``python -m benchmarks.<module>``.
+"""
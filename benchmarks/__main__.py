@@ -0,0 +1,46 @@
+"""
+    python -m benchmarks [--scale 0.1] [--output results.json] [--baseline baseline.json] [--threshold 0.1] [names...]
+
+Exits with status 1 if any scenario is slower than the baseline by more than the threshold.
+"""
+import argparse
+import sys
+
+from benchmarks import runner
+from benchmarks.scenarios import SCENARIOS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Runs the performance benchmarks")
+    parser.add_argument("names", nargs="*", help=f"Scenarios to run, out of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the size of the generated inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs, of which the best is kept")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the results with this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="The largest drop in events/sec accepted, as a fraction of the baseline")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = runner.run(args.names, scale=args.scale, repeat=args.repeat)
+    if args.output:
+        runner.save(results, args.output)
+
+    if args.baseline:
+        baseline = runner.load(args.baseline)["results"]
+        for name, result in results["results"].items():
+            if name in baseline:
+                change = result["events_per_sec"] / baseline[name]["events_per_sec"] - 1
+                print(f"{name:>20}: {change:+8.1%} events/sec vs baseline")
+        regressions = runner.compare(results["results"], baseline, threshold=args.threshold)
+        if regressions:
+            print(f"Throughput dropped by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
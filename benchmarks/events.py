@@ -0,0 +1,73 @@
+"""
+Measures the per-event memory footprint and attribute access speed of the event classes.
+
+    python -m benchmarks.events
+"""
+import timeit
+import tracemalloc
+
+from sfdata_stream_parser import events
+
+
+def event_memory(count=100_000):
+    """ Returns the average number of bytes allocated per Cell event """
+    tracemalloc.start()
+    try:
+        cells = [events.Cell(value="value", column_index=ix) for ix in range(count)]
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(cells) == count
+    return current / count
+
+
+def _wide_cell():
+    return events.Cell(value="value", column_index=1, excel_type="s", excel_location="B2", excel_number_format="General")
+
+
+def derive_memory(count=50_000, changed=("value",)):
+    """ Returns the average number of bytes allocated by from_event on a wide cell when changing the given fields """
+    cell = _wide_cell()
+    kwargs = {name: "new" for name in changed}
+    with events.provenance(events.PROVENANCE_NONE):
+        tracemalloc.start()
+        try:
+            derived = [events.Cell.from_event(cell, **kwargs) for _ in range(count)]
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    assert len(derived) == count
+    return current / count
+
+
+def _time_per_call(stmt, namespace, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5, globals=namespace)) / number * 1e9
+
+
+def event_timings(number=200_000):
+    """ Returns nanoseconds per operation for the common event operations """
+    cell = events.Cell(value="value", column_index=1, excel_type="s")
+    namespace = dict(events=events, cell=cell, wide_cell=_wide_cell())
+    return {
+        "create": _time_per_call("events.Cell(value='value', column_index=1)", namespace, number),
+        "attribute": _time_per_call("cell.value", namespace, number),
+        "extra_attribute": _time_per_call("cell.excel_type", namespace, number),
+        "get": _time_per_call("cell.get('value')", namespace, number),
+        "as_dict": _time_per_call("cell.as_dict()", namespace, number),
+        "from_event": _time_per_call("events.Cell.from_event(cell, value='new')", namespace, number // 4),
+        "from_event_wide": _time_per_call("events.Cell.from_event(wide_cell, value='new')", namespace, number // 4),
+        "from_event_extra": _time_per_call("events.Cell.from_event(wide_cell, column_header='new')", namespace,
+                                           number // 4),
+    }
+
+
+def main():
+    print(f"bytes per cell: {event_memory():.1f}")
+    print(f"bytes per derived cell (core field changed): {derive_memory():.1f}")
+    print(f"bytes per derived cell (extra field added): {derive_memory(changed=('column_header',)):.1f}")
+    for name, value in event_timings().items():
+        print(f"{name:>16}: {value:8.1f} ns")
+
+
+if __name__ == "__main__":
+    main()
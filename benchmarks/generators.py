@@ -0,0 +1,101 @@
+"""
+Deterministic generators for large synthetic inputs. The same arguments always produce the same document, so
+results can be compared between runs.
+"""
+import csv
+import datetime
+import io
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet", "kilo", "lima",
+         "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango", "uniform", "victor")
+
+
+def _value(rnd: random.Random, col_ix: int):
+    """ A mix of the kinds of value found in real data: text, integers, decimals, dates, blanks and quoted text """
+    kind = col_ix % 6
+    if kind == 0:
+        return rnd.choice(WORDS)
+    if kind == 1:
+        return rnd.randint(0, 100_000)
+    if kind == 2:
+        return round(rnd.uniform(-1000, 1000), 2)
+    if kind == 3:
+        return datetime.date(2000, 1, 1) + datetime.timedelta(days=rnd.randint(0, 9000))
+    if kind == 4:
+        return None if rnd.random() < 0.3 else rnd.choice(WORDS).upper()
+    return f'{rnd.choice(WORDS)}, "{rnd.choice(WORDS)}"'
+
+
+def table_rows(rows: int, columns: int, seed: int = 0, header=True):
+    """ Yields rows of values, starting with a header row if header is set """
+    rnd = random.Random(seed)
+    if header:
+        yield [f"Column {col_ix}" for col_ix in range(columns)]
+    for _ in range(rows):
+        yield [_value(rnd, col_ix) for col_ix in range(columns)]
+
+
+def csv_text(rows: int, columns: int, seed: int = 0) -> str:
+    """ Returns a CSV document with a header row followed by the given number of rows """
+    output = io.StringIO(newline='')
+    writer = csv.writer(output)
+    for row in table_rows(rows, columns, seed):
+        writer.writerow(['' if value is None else value for value in row])
+    return output.getvalue()
+
+
+def wide_csv(scale=1.0, seed: int = 0) -> str:
+    return csv_text(max(1, int(2_000 * scale)), 200, seed)
+
+
+def tall_csv(scale=1.0, seed: int = 0) -> str:
+    return csv_text(max(1, int(50_000 * scale)), 8, seed)
+
+
+def xlsx_bytes(sheets: int, rows: int, columns: int, seed: int = 0) -> bytes:
+    """ Returns an XLSX workbook with the given number of sheets, each with a header row and rows of values """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet_ix in range(sheets):
+        sheet = workbook.create_sheet(f"Sheet{sheet_ix + 1}")
+        for row in table_rows(rows, columns, seed + sheet_ix):
+            sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def multi_sheet_xlsx(scale=1.0, seed: int = 0) -> bytes:
+    return xlsx_bytes(3, max(1, int(3_000 * scale)), 12, seed)
+
+
+def xml_bytes(records: int, depth: int, breadth: int = 2, seed: int = 0) -> bytes:
+    """
+    Returns an XML document with the given number of records under the root element. Each record is a tree of nested
+    elements the given number of levels deep, with breadth children at each level and attributes and text on each.
+    """
+    rnd = random.Random(seed)
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<root>']
+
+    def _element(level):
+        tag = f"level{level}"
+        parts.append(f'<{tag} id={quoteattr(str(rnd.randint(0, 10_000)))} kind={quoteattr(rnd.choice(WORDS))}>')
+        parts.append(escape(f"{rnd.choice(WORDS)} & {rnd.choice(WORDS)}"))
+        if level < depth:
+            for _ in range(breadth):
+                _element(level + 1)
+        parts.append(f'</{tag}>')
+
+    for record_ix in range(records):
+        parts.append(f'<record index="{record_ix}">')
+        _element(1)
+        parts.append('</record>')
+    parts.append('</root>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def nested_xml(scale=1.0, seed: int = 0) -> bytes:
+    return xml_bytes(max(1, int(500 * scale)), depth=6, seed=seed)
@@ -0,0 +1,44 @@
+"""
+Measures how much memory is kept alive by events that have passed through a deep pipeline, for each provenance mode.
+
+    python -m benchmarks.provenance
+"""
+import tracemalloc
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.filters.generic import filter_stream
+from sfdata_stream_parser.stream import with_provenance
+
+
+def _source(count):
+    for ix in range(count):
+        yield events.Cell(value=str(ix), column_index=ix % 20, excel_type="s", excel_location=f"A{ix}")
+
+
+def _pipeline(count, depth):
+    stream = _source(count)
+    for level in range(depth):
+        stream = filter_stream(stream, pass_function=lambda event, _level=level: event.from_event(event, level=_level))
+    return stream
+
+
+def retained_memory(mode, count=5_000, depth=5):
+    """ Returns the number of bytes per event retained after collecting the output of a pipeline """
+    tracemalloc.start()
+    try:
+        kept = list(with_provenance(_pipeline(count, depth), mode))
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(kept) == count
+    return current / count
+
+
+def main():
+    for depth in (1, 5, 10):
+        for mode in events.PROVENANCE_MODES:
+            print(f"depth {depth:>2} {mode:>12}: {retained_memory(mode, depth=depth):8.1f} bytes/event")
+
+
+if __name__ == "__main__":
+    main()
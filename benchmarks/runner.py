@@ -0,0 +1,103 @@
+"""
+Runs the benchmark scenarios, writes the results as JSON and compares them with a baseline.
+"""
+import datetime
+import gc
+import json
+import platform
+import time
+import tracemalloc
+from typing import Dict, Iterable, List
+
+from sfdata_stream_parser import __version__, events
+
+from benchmarks.scenarios import SCENARIOS, StreamFactory
+
+
+def _consume(stream):
+    count = cells = 0
+    for event in stream:
+        count += 1
+        if isinstance(event, events.Cell):
+            cells += 1
+        elif isinstance(event, events.Row):
+            cells += len(event.values)
+    return count, cells
+
+
+def measure(factory: StreamFactory, repeat=3) -> dict:
+    """
+    Consumes the streams created by factory and returns the event and cell counts, the best time of repeat runs,
+    and the peak memory allocated while consuming a stream. Memory is traced in a separate run, as tracing slows
+    everything down.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        count, cells = _consume(factory())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _consume(factory())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "events": count,
+        "cells": cells,
+        "seconds": best,
+        "events_per_sec": count / best,
+        "cells_per_sec": cells / best,
+        "peak_memory": peak,
+    }
+
+
+def run(names: Iterable[str] = None, scale=1.0, repeat=3, log=print) -> dict:
+    """ Runs the named scenarios, or all of them, and returns the results with some details of the environment """
+    results = {}
+    for name in names or SCENARIOS:
+        factory = SCENARIOS[name](scale)
+        results[name] = result = measure(factory, repeat=repeat)
+        log(f"{name:>20}: {result['events_per_sec']:12,.0f} events/sec {result['cells_per_sec']:12,.0f} cells/sec "
+            f"{result['peak_memory'] / 1024:10,.0f} KiB peak")
+    return {
+        "meta": {
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "repeat": repeat,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold=0.1) -> List[str]:
+    """
+    Returns the names of the scenarios whose throughput dropped by more than threshold (a fraction) from the
+    baseline. Scenarios missing from either side are ignored.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result["events_per_sec"] / baseline[name]["events_per_sec"] - 1
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def load(filename) -> dict:
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save(results: dict, filename):
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,251 @@
+"""
+Benchmark scenarios. Each scenario prepares its input once and returns a function that creates a fresh event
+stream over it, so only parsing and filtering are measured.
+"""
+import atexit
+import functools
+import io
+import os
+import tempfile
+from typing import Callable, Dict, Iterator
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import type_check
+from sfdata_stream_parser.collectors import collector, block_check
+from sfdata_stream_parser.filters.column_headers import promote_first_row
+from sfdata_stream_parser.filters.generic import filter_stream, streamfilter, pass_event
+from sfdata_stream_parser.filters.pipeline import Pipeline
+from sfdata_stream_parser.filters.rows import rowfilter
+from sfdata_stream_parser.filters.types import integer_converter, float_converter, date_converter
+from sfdata_stream_parser.parser import xml
+from sfdata_stream_parser.parser.csv import parse_csv, parse_csv_fast, parse_csv_parallel
+from sfdata_stream_parser.stream import skip_subtree
+
+from benchmarks import generators
+
+StreamFactory = Callable[[], Iterator[events.ParseEvent]]
+
+SCENARIOS: Dict[str, Callable[[float], StreamFactory]] = {}
+
+
+def scenario(name: str):
+    """ Registers a scenario. The decorated function takes the scale and returns a stream factory. """
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def _materialise(stream) -> list:
+    """ Parses the input once so that filters can be measured without the parser """
+    return list(stream)
+
+
+def _cells(rows=10_000, columns=10, value=str):
+    stream = [events.StartContainer(), events.StartTable()]
+    for row_ix in range(rows):
+        stream.append(events.StartRow(row_index=row_ix))
+        stream.extend(events.Cell(value=value(row_ix * columns + col_ix), column_index=col_ix)
+                      for col_ix in range(columns))
+        stream.append(events.EndRow(row_index=row_ix))
+    stream += [events.EndTable(), events.EndContainer()]
+    return stream
+
+
+@scenario("parse_csv_wide")
+def parse_csv_wide(scale):
+    data = generators.wide_csv(scale)
+    return lambda: parse_csv(io.StringIO(data, newline=''))
+
+
+@scenario("parse_csv_tall")
+def parse_csv_tall(scale):
+    data = generators.tall_csv(scale)
+    return lambda: parse_csv(io.StringIO(data, newline=''))
+
+
+@scenario("parse_csv_fast_wide")
+def parse_csv_fast_wide(scale):
+    data = generators.wide_csv(scale).encode('utf-8')
+    return lambda: parse_csv_fast(io.BytesIO(data))
+
+
+@scenario("parse_csv_fast_tall")
+def parse_csv_fast_tall(scale):
+    data = generators.tall_csv(scale).encode('utf-8')
+    return lambda: parse_csv_fast(io.BytesIO(data))
+
+
+@scenario("parse_csv_fast_rows")
+def parse_csv_fast_rows(scale):
+    data = generators.tall_csv(scale).encode('utf-8')
+    return lambda: parse_csv_fast(io.BytesIO(data), row_events=True)
+
+
+def _temp_file(data: bytes) -> str:
+    """ Writes data to a temporary file that is removed on exit, for parsers that need a path """
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as f:
+        f.write(data)
+    atexit.register(os.unlink, f.name)
+    return f.name
+
+
+@scenario("parse_csv_parallel")
+def parse_csv_parallel_tall(scale):
+    filename = _temp_file(generators.tall_csv(scale).encode('utf-8'))
+    return lambda: parse_csv_parallel(filename, chunk_size=1 << 20)
+
+
+@scenario("parse_sheets")
+def parse_sheets_multi(scale):
+    from sfdata_stream_parser.parser.openpyxl import parse_sheets
+
+    data = generators.multi_sheet_xlsx(scale)
+    return lambda: parse_sheets(io.BytesIO(data))
+
+
+@scenario("parse_sheets_values")
+def parse_sheets_values_only(scale):
+    from sfdata_stream_parser.parser.openpyxl import parse_sheets
+
+    data = generators.multi_sheet_xlsx(scale)
+    return lambda: parse_sheets(io.BytesIO(data), metadata=())
+
+
+@scenario("parse_sheets_parallel")
+def parse_sheets_parallel_multi(scale):
+    from sfdata_stream_parser.parser.openpyxl import parse_sheets_parallel
+
+    data = generators.multi_sheet_xlsx(scale)
+    return lambda: parse_sheets_parallel(data)
+
+
+@scenario("parse_xlsx")
+def parse_xlsx_multi(scale):
+    from sfdata_stream_parser.parser.xlsx import parse_xlsx
+
+    data = generators.multi_sheet_xlsx(scale)
+    return lambda: parse_xlsx(io.BytesIO(data))
+
+
+@scenario("xml_parse")
+def xml_parse(scale):
+    data = generators.nested_xml(scale)
+    return lambda: xml.parse(io.BytesIO(data))
+
+
+@scenario("xml_parse_pulldom")
+def xml_parse_pulldom(scale):
+    data = generators.nested_xml(scale)
+    return lambda: xml.parse(io.BytesIO(data), engine=xml.ENGINE_PULLDOM)
+
+
+def _skip_level2(stream):
+    for event in stream:
+        yield event
+        if type(event) is events.StartElement and event.tag == "level2":
+            skip_subtree(stream)
+
+
+@scenario("xml_skip_subtree")
+def xml_skip_subtree(scale):
+    data = generators.nested_xml(scale)
+    return lambda: _skip_level2(xml.parse(io.BytesIO(data)))
+
+
+@scenario("promote_first_row")
+def promote_first_row_tall(scale):
+    source = _materialise(parse_csv(io.StringIO(generators.tall_csv(scale), newline='')))
+    return lambda: promote_first_row(iter(source))
+
+
+@scenario("promote_first_row_rows")
+def promote_first_row_rows_only(scale):
+    source = _materialise(parse_csv(io.StringIO(generators.tall_csv(scale), newline='')))
+    return lambda: promote_first_row(iter(source), cell_headers=False)
+
+
+@collector(check=block_check(events.StartRow), receive_stream=True)
+def _row_collector(stream):
+    yield from stream
+
+
+@scenario("collector")
+def collector_rows(scale):
+    source = _materialise(parse_csv(io.StringIO(generators.tall_csv(scale), newline='')))
+    return lambda: _row_collector(iter(source))
+
+
+@collector(check=block_check(events.StartRow))
+def _indexed_collector(event, event_index, last_event):
+    return event
+
+
+@scenario("collector_events")
+def collector_events(scale):
+    source = _materialise(parse_csv(io.StringIO(generators.tall_csv(scale), newline='')))
+    return lambda: _indexed_collector(iter(source))
+
+
+def _converter_scenario(converter, value, scale):
+    source = _cells(rows=max(1, int(10_000 * scale)), value=value)
+    return lambda: filter_stream(iter(source), check=type_check(events.Cell), pass_function=lambda event: converter(event))
+
+
+@scenario("integer_converter")
+def integer_converter_cells(scale):
+    return _converter_scenario(integer_converter, lambda ix: f"{ix:,}", scale)
+
+
+@scenario("float_converter")
+def float_converter_cells(scale):
+    return _converter_scenario(float_converter, lambda ix: f"{ix / 100:.2f}", scale)
+
+
+@scenario("date_converter")
+def date_converter_cells(scale):
+    return _converter_scenario(date_converter, lambda ix: f"{ix % 28 + 1:02}/{ix % 12 + 1:02}/{1950 + ix % 70}", scale)
+
+
+@scenario("filter_stream")
+def filter_stream_cells(scale):
+    source = _cells(rows=max(1, int(10_000 * scale)))
+    return lambda: filter_stream(iter(source), check=type_check(events.Cell), pass_function=pass_event,
+                                 fail_function=pass_event)
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event)
+def _strip(event):
+    return event
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event)
+def _with_kwarg(event, suffix="!"):
+    return event
+
+
+@scenario("streamfilter")
+def streamfilter_cells(scale):
+    source = _cells(rows=max(1, int(10_000 * scale)))
+    return lambda: _with_kwarg(_strip(_strip(iter(source))), suffix="?")
+
+
+@rowfilter
+def _strip_row(row):
+    values = row.values
+    for ix, value in enumerate(values):
+        values[ix] = value.strip()
+    return row
+
+
+@scenario("rowfilter")
+def rowfilter_rows(scale):
+    source = _cells(rows=max(1, int(10_000 * scale)))
+    return lambda: _strip_row(iter(source))
+
+
+@scenario("pipeline")
+def pipeline_cells(scale):
+    source = _cells(rows=max(1, int(10_000 * scale)))
+    pipeline = Pipeline([_strip, _strip, functools.partial(_with_kwarg, suffix="?")])
+    return lambda: pipeline(iter(source))
@@ -0,0 +1,321 @@
+"""
+Asyncio counterparts of filter_stream, streamfilter and collector, for pipelines fed from async sources such as
+uploads read off a socket or a queue. Streams are async iterables of events, and these stages take sync streams
+too. The checks and the pass, fail and error functions are the same as for the sync versions. The functions can
+also be coroutine functions, which are awaited one event at a time.
+
+The parsers have async versions that read async byte sources: parser.csv.parse_csv_async and
+parser.xml.parse_async. They parse a chunk at a time, and give the event loop a turn after each chunk, so many
+uploads can be parsed on one loop without any of them blocking it for long.
+
+    stream = filter_stream(parse_csv_async(reader), check=type_check(events.Cell), pass_function=strip_value,
+                           fail_function=pass_event)
+    async for event in stream:
+        ...
+"""
+import asyncio
+import functools
+import inspect
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Union
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import EventCheck
+from sfdata_stream_parser.events import ParseEvent
+from sfdata_stream_parser.function_helpers import FunctionCaller, call_plan
+from sfdata_stream_parser.functions import pass_event, block_event, raise_error
+from sfdata_stream_parser.types import EventFilter, FilterErrorHandler
+
+AnyEventStream = Union[AsyncIterable[events.ParseEvent], Iterable[events.ParseEvent], events.ParseEvent]
+ByteSource = Union[AsyncIterable[bytes], "asyncio.StreamReader"]
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# The number of events taken from a sync stream between turns of the event loop
+SYNC_BATCH_SIZE = 1000
+
+
+async def aiter_events(stream: AnyEventStream) -> AsyncIterator[events.ParseEvent]:
+    """
+    Iterates over an async stream, a sync stream or a single event. A sync stream is read in batches of
+    SYNC_BATCH_SIZE events, giving the event loop a turn after each batch.
+    """
+    if isinstance(stream, ParseEvent):
+        yield stream
+    elif hasattr(stream, '__aiter__'):
+        async for event in stream:
+            yield event
+    else:
+        for ix, event in enumerate(stream, start=1):
+            yield event
+            if ix % SYNC_BATCH_SIZE == 0:
+                await asyncio.sleep(0)
+
+
+async def read_chunks(source: ByteSource, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """
+    Reads an async byte source in chunks of at most chunk_size bytes. The source is either an object with an async
+    read method, such as an asyncio.StreamReader, or an async iterable of chunks, which are split if too large.
+    """
+    read = getattr(source, 'read', None)
+    if read is not None:
+        while True:
+            chunk = await read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        async for chunk in source:
+            if len(chunk) <= chunk_size:
+                yield chunk
+            else:
+                for start in range(0, len(chunk), chunk_size):
+                    yield chunk[start:start + chunk_size]
+
+
+async def _outputs(value) -> AsyncIterator[events.ParseEvent]:
+    """ The events in the value returned by a function: an event, None, or a sync or async iterable of events """
+    if inspect.isawaitable(value):
+        value = await value
+    if isinstance(value, ParseEvent):
+        yield value
+    elif hasattr(value, '__aiter__'):
+        async for event in value:
+            yield event
+    elif isinstance(value, Iterable):
+        for event in value:
+            yield event
+    elif value is not None:
+        yield value
+
+
+def filter_stream(
+        stream: AnyEventStream,
+        check: EventCheck = lambda x: True,
+        pass_function: EventFilter = pass_event,
+        fail_function: EventFilter = block_event,
+        error_function: FilterErrorHandler = raise_error,
+        concurrency: int = 1,
+        window: int = None,
+        **kwargs,
+) -> AsyncIterator[events.ParseEvent]:
+    """
+    The async version of filters.generic.filter_stream.
+
+    With a concurrency above 1, the coroutines returned by the pass and fail functions are run for up to that many
+    events at once, and their results are emitted in the order of the events in the stream. Results that are ready
+    wait in a reorder window of up to window events (by default twice the concurrency) for those ahead of them, and
+    the stream is not read any further while the window is full. Errors go to the error_function as usual.
+    """
+    pass_call = call_plan(pass_function).bind(pass_function, **kwargs)
+    fail_call = call_plan(fail_function).bind(fail_function, **kwargs)
+    error_call = call_plan(error_function).bind(error_function, with_exception=True, **kwargs)
+
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1: {concurrency}")
+    if concurrency == 1 and window is None:
+        return _filter_serial(stream, check, pass_call, fail_call, error_call)
+
+    if window is None:
+        window = 2 * concurrency
+    if window < concurrency:
+        raise ValueError(f"window must be at least the concurrency ({concurrency}): {window}")
+    return _filter_concurrent(stream, check, pass_call, fail_call, error_call, concurrency, window)
+
+
+async def _filter_serial(stream, check, pass_call, fail_call, error_call):
+    async for event in aiter_events(stream):
+        try:
+            value = pass_call(event) if check(event) else fail_call(event)
+            if isinstance(value, ParseEvent):
+                yield value
+            elif value is not None:
+                async for output in _outputs(value):
+                    yield output
+        except Exception as ex:
+            async for output in _outputs(error_call(event, ex)):
+                yield output
+
+
+async def _collect_outputs(event, value, error_call) -> list:
+    """ The events in the value returned for an event, or those returned by the error_function if that fails """
+    try:
+        return [output async for output in _outputs(value)]
+    except Exception as ex:
+        return [output async for output in _outputs(error_call(event, ex))]
+
+
+async def _filter_concurrent(stream, check, pass_call, fail_call, error_call, concurrency, window):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(event, awaitable):
+        async with semaphore:
+            return await _collect_outputs(event, awaitable, error_call)
+
+    # Each entry is either the list of events for one input event, or the task that will produce it
+    pending = deque()
+    try:
+        async for event in aiter_events(stream):
+            try:
+                value = pass_call(event) if check(event) else fail_call(event)
+            except Exception as ex:
+                value = error_call(event, ex)
+
+            if inspect.isawaitable(value):
+                pending.append(asyncio.ensure_future(_run(event, value)))
+            elif isinstance(value, ParseEvent):
+                pending.append((value,))
+            elif value is None:
+                pending.append(())
+            else:
+                pending.append(await _collect_outputs(event, value, error_call))
+
+            # Emit whatever is ready at the head of the window, and wait for the head if the window is full
+            while pending:
+                head = pending[0]
+                if isinstance(head, asyncio.Future):
+                    if not head.done() and len(pending) < window:
+                        break
+                    head = await head
+                pending.popleft()
+                for output in head:
+                    yield output
+
+        while pending:
+            head = pending.popleft()
+            if isinstance(head, asyncio.Future):
+                head = await head
+            for output in head:
+                yield output
+    finally:
+        for item in pending:
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+
+
+def __event_generator(func, default_args=None, **genargs):
+    @functools.wraps(func)
+    def wrapper(stream, *_, **kwargs):
+        if default_args:
+            _kwargs = default_args()
+            _kwargs.update(**kwargs)
+            kwargs = _kwargs
+        return filter_stream(stream, pass_function=func, **genargs, **kwargs)
+
+    wrapper.streamfilter_args = (func, default_args, genargs)
+    return wrapper
+
+
+def streamfilter(arg=None, **kwargs):
+    """ The async version of filters.generic.streamfilter """
+    if isinstance(arg, Callable):
+        return __event_generator(arg, **kwargs)
+    else:
+        def wrapper(func):
+            return __event_generator(func, **kwargs)
+        return wrapper
+
+
+_END = object()
+
+
+class _Peekable:
+    """ An async iterator that can look at its next event without consuming it """
+
+    def __init__(self, stream: AsyncIterable[events.ParseEvent]):
+        self._iterator = stream.__aiter__()
+        self._next = _END
+
+    async def peek(self, default=None):
+        if self._next is _END:
+            try:
+                self._next = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                return default
+        return self._next
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._next is not _END:
+            event, self._next = self._next, _END
+            return event
+        return await self._iterator.__anext__()
+
+
+async def _block(first: events.ParseEvent, stream: AsyncIterator[events.ParseEvent], end_check: EventCheck):
+    """ Yields first and then the events of stream up to and including the one that passes end_check """
+    yield first
+    async for event in stream:
+        yield event
+        if end_check(event):
+            return
+
+
+def __collector(func, check=None, iterations=None, pass_function=None, receive_stream=False, stop_after=False):
+    if pass_function is None:
+        pass_function = pass_event
+    if iterations is None:
+        iterations = 0
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        caller = FunctionCaller(func, *args, **kwargs)
+        stream = aiter_events(caller.stream)
+
+        pass_count = 0
+        while True:
+            # Pass events until the check starts a block
+            start = end_check = None
+            async for event in stream:
+                end_check = check(event)
+                if end_check is None:
+                    async for output in _outputs(pass_function(event)):
+                        yield output
+                else:
+                    start = event
+                    break
+            if start is None:
+                return
+
+            pass_count += 1
+            collected = _Peekable(_block(start, stream, end_check))
+            if receive_stream:
+                async for output in _outputs(caller.call(collected)):
+                    yield output
+            else:
+                ix = 0
+                async for event in collected:
+                    caller.event_index = ix
+                    caller.first_event = ix == 0
+                    caller.last_event = await collected.peek(_END) is _END
+                    async for output in _outputs(caller.call(event)):
+                        yield output
+                    ix += 1
+
+            if 0 < iterations <= pass_count:
+                if stop_after:
+                    return
+                async for event in stream:
+                    async for output in _outputs(pass_function(event)):
+                        yield output
+                return
+
+    return wrapper
+
+
+def collector(*args, check=None, iterations=None, pass_function=None, receive_stream=False, stop_after=False):
+    """
+    The async version of collectors.collector, taking the same arguments. With receive_stream, the function is
+    given the collected events as an async iterable.
+    """
+    collector_args = dict(check=check, iterations=iterations, pass_function=pass_function,
+                          receive_stream=receive_stream, stop_after=stop_after)
+
+    if len(args) > 0 and isinstance(args[0], Callable):
+        return __collector(args[0], **collector_args)
+    else:
+        def wrapper(func):
+            return __collector(func, **collector_args)
+        return wrapper
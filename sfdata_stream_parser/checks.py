@@ -1,3 +1,7 @@
+import functools
+import operator
+import re
+from collections import Counter
 from typing import Iterable, Type, Union, Callable
 from sfdata_stream_parser import events
 
@@ -5,51 +9,336 @@ EventCheck = Callable[[events.ParseEvent], bool]
 OneOrMoreEventTypes = Union[Type[events.ParseEvent], Iterable[Type[events.ParseEvent]]]
 
 
+# Checks don't call each other at runtime. Each one carries a small expression tree in __check_expr__. Combining
+# checks merges their trees and compiles the result into one flat function, with type checks merged into a single
+# isinstance and each property read once. Any other callable can still be combined with them, and is called in order
+# with the usual short-circuit rules. Constant parts of an expression are folded away, so checks should be free of
+# side effects.
+class _Node:
+    __slots__ = ()
+
+
+class _Const(_Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value: bool):
+        self.value = value
+
+
+_TRUE = _Const(True)
+_FALSE = _Const(False)
+
+
+class _Type(_Node):
+    __slots__ = ('types',)
+
+    def __init__(self, types: tuple):
+        self.types = types
+
+
+class _Lookup(_Node):
+    __slots__ = ('attr', 'template', 'value')
+
+    def __init__(self, attr: str, template: str, value):
+        self.attr = attr
+        self.template = template
+        self.value = value
+
+
+class _Call(_Node):
+    __slots__ = ('func',)
+
+    def __init__(self, func: Callable):
+        self.func = func
+
+
+class _And(_Node):
+    __slots__ = ('children',)
+
+    def __init__(self, children: tuple):
+        self.children = children
+
+
+class _Or(_Node):
+    __slots__ = ('children',)
+
+    def __init__(self, children: tuple):
+        self.children = children
+
+
+class _Not(_Node):
+    __slots__ = ('child',)
+
+    def __init__(self, child: _Node):
+        self.child = child
+
+
+def _text(value):
+    return str(value)
+
+
+def _lower(value):
+    return str(value).lower()
+
+
+def _hashable(value) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class _Members(frozenset):
+    """ The values of an in lookup, and all of them in a tuple to search for the unhashable values the set can't """
+    __slots__ = ('values',)
+
+    def __call__(self, value) -> bool:
+        try:
+            return value in self
+        except TypeError:
+            return value in self.values
+
+
+def _collection(value):
+    values = tuple(value)
+    members = _Members(v for v in values if _hashable(v))
+    members.values = values
+    return members
+
+
+def _comparison(op):
+    def prepare(value):
+        def compare(v):
+            try:
+                return v is not None and op(v, value)
+            except TypeError:
+                # A value that can't be compared with the lookup's, such as text with a number, is not a match
+                return False
+        return compare
+    return prepare
+
+
+# lookup: (expression template, how to prepare the value). {v} is the property value and {c} the prepared value.
+_LOOKUPS = {
+    'exact': ('{v} == {c}', None),
+    'iexact': ('{v} is not None and str({v}).lower() == {c}', _lower),
+    'contains': ('{v} is not None and {c} in str({v})', _text),
+    'icontains': ('{v} is not None and {c} in str({v}).lower()', _lower),
+    'in': ('{c}({v})', _collection),
+    'gt': ('{c}({v})', _comparison(operator.gt)),
+    'gte': ('{c}({v})', _comparison(operator.ge)),
+    'lt': ('{c}({v})', _comparison(operator.lt)),
+    'lte': ('{c}({v})', _comparison(operator.le)),
+    'startswith': ('{v} is not None and str({v}).startswith({c})', _text),
+    'istartswith': ('{v} is not None and str({v}).lower().startswith({c})', _lower),
+    'endswith': ('{v} is not None and str({v}).endswith({c})', _text),
+    'iendswith': ('{v} is not None and str({v}).lower().endswith({c})', _lower),
+    'regex': ('{v} is not None and {c}(str({v})) is not None', lambda value: re.compile(value).search),
+    'iregex': ('{v} is not None and {c}(str({v})) is not None', lambda value: re.compile(value, re.IGNORECASE).search),
+}
+
+
+def _lookup(key: str, value) -> _Node:
+    attr, sep, lookup = key.rpartition('__')
+    if not sep or lookup not in _LOOKUPS and lookup != 'isnull':
+        attr, lookup = key, 'exact'
+
+    if lookup == 'isnull':
+        return _Lookup(attr, '{v} is None' if value else '{v} is not None', None)
+
+    template, prepare = _LOOKUPS[lookup]
+    if prepare is not None:
+        value = prepare(value)
+    if lookup == 'in' and not value.values:
+        return _FALSE
+    return _Lookup(attr, template, value)
+
+
+def _node(check: EventCheck) -> _Node:
+    node = getattr(check, '__check_expr__', None)
+    return node if isinstance(node, _Node) else _Call(check)
+
+
+def _all(nodes: Iterable[_Node]) -> _Node:
+    children = []
+    for node in nodes:
+        for child in (node.children if isinstance(node, _And) else (node,)):
+            if isinstance(child, _Const):
+                if not child.value:
+                    return _FALSE
+            else:
+                children.append(child)
+    if not children:
+        return _TRUE
+    return children[0] if len(children) == 1 else _And(tuple(children))
+
+
+def _any(nodes: Iterable[_Node]) -> _Node:
+    children = []
+    types = None
+    for node in nodes:
+        for child in (node.children if isinstance(node, _Or) else (node,)):
+            if isinstance(child, _Const):
+                if child.value:
+                    return _TRUE
+            elif isinstance(child, _Type):
+                # All the type checks are merged into one, in the position of the first
+                if types is None:
+                    types = []
+                    children.append(None)
+                types.extend(child.types)
+            else:
+                children.append(child)
+    if types is not None:
+        children[children.index(None)] = _Type(tuple(dict.fromkeys(types)))
+    if not children:
+        return _FALSE
+    return children[0] if len(children) == 1 else _Or(tuple(children))
+
+
+def _negate(node: _Node) -> _Node:
+    if isinstance(node, _Const):
+        return _FALSE if node.value else _TRUE
+    if isinstance(node, _Not):
+        return node.child
+    return _Not(node)
+
+
+def _attr_uses(node: _Node) -> Counter:
+    if isinstance(node, _Lookup):
+        return Counter({node.attr: node.template.count('{v}')})
+    if isinstance(node, (_And, _Or)):
+        return sum((_attr_uses(child) for child in node.children), Counter())
+    if isinstance(node, _Not):
+        return _attr_uses(node.child)
+    return Counter()
+
+
+class _Compiler:
+    """
+    Generates the source of a check function for an expression. Constants are referenced by name, so expressions
+    with the same shape produce the same source and share a code object.
+    """
+
+    def __init__(self):
+        self.namespace = {}
+        self.attrs = {}
+        self.lines = []
+
+    def constant(self, value) -> str:
+        name = f'_c{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+    def hoist(self, attr: str):
+        if attr not in self.attrs:
+            name = self.attrs[attr] = f'_v{len(self.attrs)}'
+            self.lines.append(f'    {name} = getattr(e, {attr!r}, None)')
+
+    def expr(self, node: _Node) -> str:
+        if isinstance(node, _Const):
+            return repr(node.value)
+        if isinstance(node, _Type):
+            types = node.types[0] if len(node.types) == 1 else node.types
+            return f'isinstance(e, {self.constant(types)})'
+        if isinstance(node, _Lookup):
+            value = self.attrs.get(node.attr) or f'getattr(e, {node.attr!r}, None)'
+            return node.template.format(v=value, c=self.constant(node.value))
+        if isinstance(node, _Call):
+            return f'{self.constant(node.func)}(e)'
+        if isinstance(node, _Not):
+            return f'not ({self.expr(node.child)})'
+        joiner = ' and ' if isinstance(node, _And) else ' or '
+        return joiner.join(f'({self.expr(child)})' for child in node.children)
+
+    def compile(self, node: _Node) -> str:
+        children = node.children if isinstance(node, (_And, _Or)) else (node,)
+        uses = [_attr_uses(child) for child in children]
+        for ix, child in enumerate(children):
+            # Properties are read into a local if they are needed more than once, otherwise where they are used, so
+            # nothing is read that an earlier check would have ruled out
+            later = set().union(*uses[ix + 1:])
+            for attr, count in uses[ix].items():
+                if count > 1 or attr in later:
+                    self.hoist(attr)
+            expr = self.expr(child)
+            if isinstance(node, _And):
+                self.lines.append(f'    if not ({expr}): return False')
+            elif isinstance(node, _Or):
+                self.lines.append(f'    if {expr}: return True')
+            elif isinstance(node, _Call):
+                self.lines.append(f'    return bool({expr})')
+            else:
+                self.lines.append(f'    return {expr}')
+        if isinstance(node, (_And, _Or)):
+            self.lines.append(f'    return {isinstance(node, _And)}')
+        return 'def _check(e):\n' + '\n'.join(self.lines)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_source(source: str):
+    return compile(source, '<check>', 'exec')
+
+
+def _build(node: _Node) -> EventCheck:
+    compiler = _Compiler()
+    source = compiler.compile(node)
+    namespace = compiler.namespace
+    exec(_compile_source(source), namespace)
+    check = namespace['_check']
+    check.__check_expr__ = node
+    return check
+
+
 def and_check(*args: EventCheck) -> EventCheck:
     """
     Combines multiple checks into one using the logical AND operator.
     """
-    def _check(event: events.ParseEvent) -> bool:
-        for check in args:
-            if not check(event):
-                return False
-        return True
-    return _check
+    return _build(_all(_node(check) for check in args))
 
 
 def or_check(*args: EventCheck) -> EventCheck:
     """
     Combines multiple checks into one using the logical OR operator.
     """
-    def _check(event: events.ParseEvent) -> bool:
-        for check in args:
-            if check(event):
-                return True
-        return False
-    return _check
+    return _build(_any(_node(check) for check in args))
+
+
+def not_check(check: EventCheck) -> EventCheck:
+    """
+    Inverts a check.
+    """
+    return _build(_negate(_node(check)))
 
 
 def type_check(event_type: OneOrMoreEventTypes = None, permissive=False) -> EventCheck:
     """
     Checks that the event is of the given type.
     """
-    def _check(event: events.ParseEvent) -> bool:
-        if event_type is None:
-            return permissive
-        return isinstance(event, event_type)
-    return _check
+    if event_type is None:
+        return _build(_TRUE if permissive else _FALSE)
+    types = (event_type,) if isinstance(event_type, type) else tuple(event_type)
+    return _build(_Type(types) if types else _FALSE)
 
 
 def property_check(**kwargs) -> EventCheck:
     """
-    Checks that the event has the given properties with the given values.
+    Checks that the event has the given properties with the given values. Missing properties are treated as None.
 
-    TODO: Expand to allow django_filters style properties, e.g. age__gt=18 or band__icontains='foo'
-    """
-    def _check(event: events.ParseEvent) -> bool:
-        for key, value in kwargs.items():
-            if getattr(event, key, None) != value:
-                return False
-        return True
+    Properties can be compared with django-style lookups by adding the lookup to the name, e.g. ``age__gt=18`` or
+    ``band__icontains='foo'``. Only a known lookup at the end of the name is treated as one, so properties with
+    double underscores in their names can still be checked. The supported lookups are:
 
-    return _check
+    * ``exact`` (the default) and ``iexact``
+    * ``contains``, ``icontains``, ``startswith``, ``istartswith``, ``endswith`` and ``iendswith``
+    * ``regex`` and ``iregex``, which match anywhere in the value
+    * ``in``, which takes a collection of values
+    * ``gt``, ``gte``, ``lt`` and ``lte``
+    * ``isnull``, which takes True or False
+
+    The text lookups compare the value as a string, and all lookups except ``exact``, ``in`` and ``isnull`` fail for
+    missing values. ``gt``, ``gte``, ``lt`` and ``lte`` also fail for values that can't be compared with theirs, so
+    ``age__gt=18`` matches no text values: convert them to numbers first to compare them as numbers.
+    """
+    return _build(_all(_lookup(key, value) for key, value in kwargs.items()))
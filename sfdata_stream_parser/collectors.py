@@ -1,14 +1,12 @@
 import functools
-from typing import Callable, Optional, Type
-
-from more_itertools import peekable
+from typing import Callable, Iterable, Iterator, Optional, Type
 
 from sfdata_stream_parser import events
-from sfdata_stream_parser.function_helpers import FunctionCaller, event_or_iterable
-from sfdata_stream_parser.checks import EventCheck, and_check, type_check, property_check
+from sfdata_stream_parser.function_helpers import FunctionCaller, call_plan, event_or_iterable
+from sfdata_stream_parser.checks import EventCheck
 from sfdata_stream_parser.events import ParseEvent
-from sfdata_stream_parser.filters.generic import until_match, pass_event, EventFilter
-from sfdata_stream_parser.stream import first_then_rest
+from sfdata_stream_parser.filters.generic import pass_event
+from sfdata_stream_parser.profiling import stage
 
 CollectorCheck = Callable[[events.ParseEvent], Optional[EventCheck]]
 
@@ -77,20 +75,75 @@ def block_check(start_type: Type[ParseEvent] = None, end_type: Type[ParseEvent]
     return _BlockChecker(start_type, end_type)
 
 
-def __pass_events(stream, check, pass_function: EventFilter):
-    for event in stream:
-        end_check = check(event)
-        if end_check is None:
-            yield from event_or_iterable(pass_function(event))
-        else:
-            return end_check, event
-    return None, None
+_END = object()
+
+
+class _Block:
+    """
+    The events of one collected block, read straight from the upstream iterator: the first event, then the events
+    up to and including the one that passes the end check. Like more_itertools.peekable, it has a peek method and
+    is false once the block is exhausted.
+    """
+    __slots__ = ('_next', '_upstream', '_end_check', '_done')
+
+    def __init__(self, first: ParseEvent, upstream: Iterator[ParseEvent], end_check: EventCheck):
+        self._next = first
+        self._upstream = upstream
+        self._end_check = end_check
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self._next
+        if event is not _END:
+            self._next = _END
+            return event
+        if self._done:
+            raise StopIteration
+        event = next(self._upstream, _END)
+        if event is _END or self._end_check(event):
+            self._done = True
+            if event is _END:
+                raise StopIteration
+        return event
+
+    def _fill(self):
+        if self._next is _END and not self._done:
+            self._next = event = next(self._upstream, _END)
+            if event is _END or self._end_check(event):
+                self._done = True
+        return self._next
+
+    def peek(self, default=_END):
+        event = self._fill()
+        if event is _END:
+            if default is _END:
+                raise StopIteration
+            return default
+        return event
+
+    def __bool__(self):
+        return self._fill() is not _END
+
+
+def _outputs(value) -> Iterable[ParseEvent]:
+    if isinstance(value, ParseEvent):
+        return value,
+    elif value is None:
+        return ()
+    return event_or_iterable(value)
 
 
 def __collector(func, check: CollectorCheck = None, iterations=None, pass_function=None, receive_stream=False,
                 stop_after=False):
     """
     See collector.
+
+    The events are read in a single loop that switches between passing events and collecting a block. Blocks given
+    to a receive_stream function are read straight from the upstream iterator, and functions that take events are
+    only given the event_index, first_event and last_event arguments that they accept.
     """
 
     if pass_function is None:
@@ -98,36 +151,71 @@ def __collector(func, check: CollectorCheck = None, iterations=None, pass_functi
     if iterations is None:
         iterations = 0
 
+    @stage(stream_arg=1 if call_plan(func).is_method else 0)
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         caller = FunctionCaller(func, *args, **kwargs)
-        stream = caller.stream
+        stream = iter(caller.stream)
+        call = caller.call
+        wants_index, wants_first, wants_last = (caller.has(name) for name in _CONTEXT)
+        wants_context = wants_index or wants_first or wants_last
 
         pass_count = 0
-        stream = peekable(stream)
-        while stream:
+        for event in stream:
+            end_check = check(event)
+            if end_check is None:
+                yield from _outputs(pass_function(event))
+                continue
+
             pass_count += 1
-            end_check, event = yield from __pass_events(stream, check, pass_function)
-            if event is None:
-                return
-            collected_stream = peekable(first_then_rest(event, until_match(stream, end_check, yield_final=True)))
             if receive_stream:
-                yield from caller(collected_stream)
+                yield from _outputs(call(_Block(event, stream, end_check)))
+            elif not wants_context:
+                # The first event of a block is not checked against its end
+                yield from _outputs(call(event))
+                for event in stream:
+                    yield from _outputs(call(event))
+                    if end_check(event):
+                        break
             else:
-                for ix, event in enumerate(collected_stream):
-                    caller.event_index = ix
-                    caller.first_event = ix == 0
-                    caller.last_event = not bool(collected_stream)
-                    yield from caller(event)
+                # Read one event ahead, so we know whether each event is the last of the block
+                event_index = 0
+                done = False
+                while True:
+                    following = _END if done else next(stream, _END)
+                    if following is not _END and end_check(following):
+                        done = True
+                    context = _context(event_index, following is _END, wants_index, wants_first, wants_last)
+                    yield from _outputs(caller.call_with(event, context))
+                    if following is _END:
+                        break
+                    event = following
+                    event_index += 1
+
             if 0 < iterations <= pass_count:
                 if stop_after:
                     return
                 for event in stream:
-                    yield from event_or_iterable(pass_function(event))
+                    yield from _outputs(pass_function(event))
+                return
 
     return wrapper
 
 
+_CONTEXT = ('event_index', 'first_event', 'last_event')
+
+
+def _context(event_index, last_event, wants_index, wants_first, wants_last) -> dict:
+    context = {}
+    if wants_index:
+        context['event_index'] = event_index
+    if wants_first:
+        context['first_event'] = event_index == 0
+    if wants_last:
+        context['last_event'] = last_event
+    return context
+
+
 def collector(*args, check: CollectorCheck = None, iterations=None, pass_function=None, receive_stream=False,
               stop_after=False):
     """
@@ -159,12 +247,9 @@ def collector(*args, check: CollectorCheck = None, iterations=None, pass_functio
 
 def xml_collector(func):
     """
-    A collector that collects events between two XML tags. The start tag is the first tag in the stream, and the end tag
-    is the next matching EndElement event with the same tag as the start tag.
-
-    NOTE: This will currently not allow nested elements with the same name.
-
-    TODO: Improve to allow nested elements with the same name assuming a well-formed document.
+    A collector that collects the events of one XML element. The stream must start with the element's StartElement,
+    and the function is given the events up to, but not including, its EndElement, which is consumed. Nested
+    elements are counted, so an element may contain others with the same tag.
     """
     @functools.wraps(func)
     def wrapper(stream, *args, **kwargs):
@@ -174,13 +259,20 @@ def xml_collector(func):
             return tuple()
         assert isinstance(start_element, events.StartElement)
 
-        stream = until_match(
-            first_then_rest(start_element, stream),
-            and_check(
-                type_check(events.EndElement),
-                property_check(tag=start_element.tag),
-            )
-        )
-
-        return func(stream, *args, **kwargs)
+        return func(_element_events(start_element, stream), *args, **kwargs)
     return wrapper
+
+
+def _element_events(start_element: events.StartElement, stream: Iterator[ParseEvent]) -> Iterator[ParseEvent]:
+    """ Yields the events of an element up to its EndElement, which is returned rather than yielded """
+    start_type, end_type = events.StartElement, events.EndElement
+    yield start_element
+    depth = 1
+    for event in stream:
+        if isinstance(event, start_type):
+            depth += 1
+        elif isinstance(event, end_type):
+            depth -= 1
+            if depth == 0:
+                return event
+        yield event
@@ -1,92 +1,415 @@
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROVENANCE_NONE = 'none'
+PROVENANCE_PARENT = 'parent-only'
+PROVENANCE_WEAKREF = 'weakref'
+PROVENANCE_FULL = 'full'
+PROVENANCE_MODES = (PROVENANCE_NONE, PROVENANCE_PARENT, PROVENANCE_WEAKREF, PROVENANCE_FULL)
+
+_MISSING = object()
+_INTERNAL_SLOTS = frozenset(('_extra', '_source'))
+
+_default_provenance = PROVENANCE_FULL
+_provenance = ContextVar('provenance', default=None)
+
+
+def _check_provenance(mode: str) -> str:
+    if mode not in PROVENANCE_MODES:
+        raise ValueError(f"Unknown provenance mode: {mode!r}. Expected one of {PROVENANCE_MODES}")
+    return mode
+
+
+def set_provenance(mode: str):
+    """
+    Sets the global provenance mode, which controls what ParseEvent.from_event records as the source of a new event:
+
+    * ``full`` (default) - the source event, which in turn keeps its own source, so the whole chain is kept alive
+    * ``parent-only`` - a copy of the source event without its own source, so only one level is kept
+    * ``weakref`` - a weak reference to the source event, which is available for as long as something else holds it
+    * ``none`` - no source is recorded
+    """
+    global _default_provenance
+    _default_provenance = _check_provenance(mode)
+
+
+def get_provenance() -> str:
+    """
+    Returns the provenance mode currently in effect.
+    """
+    return _provenance.get() or _default_provenance
+
+
+@contextmanager
+def provenance(mode: str):
+    """
+    A context manager that overrides the provenance mode within the block. Note that generators only run when they
+    are consumed, so the stream has to be consumed inside the block. Use stream.with_provenance to attach a mode
+    to a pipeline instead.
+    """
+    token = _provenance.set(_check_provenance(mode))
+    try:
+        yield
+    finally:
+        _provenance.reset(token)
+
+
+_OVERLAY_MAX_DEPTH = 8
+
+
+class _ExtraOverlay:
+    """
+    One overflow field of a derived event, layered on top of the overflow fields of the event it was derived from.
+    The parent mapping is shared rather than copied, so deriving an event only allocates the fields that changed.
+    Chains longer than _OVERLAY_MAX_DEPTH are flattened into a single dict to bound the lookup time.
+    """
+    __slots__ = ('key', 'value', 'parent', 'depth')
+
+    def __init__(self, key, value, parent):
+        depth = 1
+        if type(parent) is _ExtraOverlay:
+            if parent.depth < _OVERLAY_MAX_DEPTH:
+                depth = parent.depth + 1
+            else:
+                parent = parent.flatten()
+        self.key = key
+        self.value = value
+        self.parent = parent
+        self.depth = depth
+
+    def get(self, key, default=None):
+        node = self
+        while type(node) is _ExtraOverlay:
+            if node.key == key:
+                return node.value
+            node = node.parent
+        return node.get(key, default)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def flatten(self) -> dict:
+        nodes = []
+        node = self
+        while type(node) is _ExtraOverlay:
+            nodes.append(node)
+            node = node.parent
+        values = dict(node)
+        for node in reversed(nodes):
+            values[node.key] = node.value
+        return values
+
+
+def _overlay_extra(parent, own: dict):
+    if not own:
+        return parent
+    if parent is None:
+        return own
+    for key, value in own.items():
+        parent = _ExtraOverlay(key, value, parent)
+    return parent
+
+
+def _flat_extra(extra) -> dict:
+    return extra.flatten() if type(extra) is _ExtraOverlay else extra
+
+
+def _compile(cls, name: str, signature: str, lines, **namespace):
+    namespace['_MISSING'] = _MISSING
+    exec(f'def {name}({signature}):\n' + '\n'.join(lines), namespace)
+    func = namespace[name]
+    func.__qualname__ = f'{cls.__qualname__}.{name}'
+    return func
+
+
+def _make_init(cls):
+    """
+    Generates an __init__ for an event class that binds the declared fields as keyword arguments. Argument binding
+    then happens in C, which makes constructing a slotted event as cheap as building a kwargs dict.
+    """
+    lines = []
+    for name in cls._required:
+        present = f'{name} is not _MISSING' if name in cls._fields else f"'{name}' in extra"
+        lines.append(f'    assert {present}, "A {name} property is required"')
+    for name in cls._field_names:
+        lines.append(f'    if {name} is not _MISSING: self.{name} = {name}')
+    lines.append('    self._source = source')
+    lines.append('    self._extra = extra or None')
+
+    params = ''.join(f'{name}=_MISSING, ' for name in cls._field_names)
+    init = _compile(cls, '__init__', f'self, *, {params}source=None, **extra', lines)
+    init._generated = True
+    return init
+
+
+def _make_derive(cls):
+    """
+    Generates the copy-on-write constructor used by from_event when the source event has the same fields as the
+    new one. Declared fields are copied slot to slot and the overflow fields are layered on the source's rather
+    than merged, so nothing is allocated for the fields that did not change.
+    """
+    lines = ['    self = _new(_cls)']
+    for name in cls._field_names:
+        lines += [
+            f'    if {name} is _MISSING:',
+            '        try:',
+            f'            self.{name} = event.{name}',
+            '        except AttributeError:',
+            '            pass',
+            '    else:',
+            f'        self.{name} = {name}',
+        ]
+    lines.append('    self._extra = _overlay_extra(event._extra, extra)')
+    lines.append('    return self')
+
+    params = ''.join(f'{name}=_MISSING, ' for name in cls._field_names)
+    return _compile(cls, '_derive', f'event, *, {params}source=None, **extra', lines,
+                    _new=object.__new__, _cls=cls, _overlay_extra=_overlay_extra)
+
+
+def _make_positional(cls):
+    """
+    Generates a constructor that takes every declared field positionally, for parsers that emit millions of events
+    with all their fields known. It skips the keyword handling of __init__ and fills the slots directly.
+    """
+    lines = ['    self = _new(_cls)']
+    lines += [f'    self.{name} = {name}' for name in cls._field_names]
+    lines += ['    self._extra = None', '    self._source = None', '    return self']
+    return _compile(cls, '_make', ', '.join(cls._field_names), lines, _new=object.__new__, _cls=cls)
+
+
+def _configure(cls):
+    """
+    Collects the declared fields of an event class from the __slots__ of the class and its bases.
+    """
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get('__slots__', ()):
+            if not name.startswith('_') and name not in names:
+                names.append(name)
+    cls._field_names = tuple(names)
+    cls._fields = frozenset(names)
+    cls._field_getters = tuple((name, getattr(cls, name).__get__) for name in names)
+
+    # Only replace constructors we generated ourselves - hand-written ones are left alone, and from_event then
+    # goes through them as well
+    if cls.__init__ is ParseEvent.__init__ or getattr(cls.__init__, '_generated', False):
+        if cls is not ParseEvent:
+            cls.__init__ = _make_init(cls)
+        cls._derive = staticmethod(_make_derive(cls))
+        cls._make = staticmethod(_make_positional(cls))
+    else:
+        cls._derive = None
+        cls._make = None
+
 
 class ParseEvent:
+    """
+    The base class for all events.
+
+    Events are slotted: each subclass declares the core fields it nearly always carries in ``__slots__``, and any
+    other keyword arguments are kept in an overflow dictionary. Both kinds of field are read the same way, either
+    as attributes or through :meth:`get`, and both are included in :meth:`as_dict`.
+
+    Subclasses can list fields that must always be present in ``_required``.
+    """
+    __slots__ = ('_extra', '_source', '__weakref__')
+
+    _required = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _configure(cls)
+
     def __init__(self, **kwargs):
-        self._args = kwargs
+        for name in self._required:
+            assert name in kwargs, f"A {name} property is required"
+        self._source = kwargs.pop('source', None)
+        fields = self._fields
+        extra = None
+        for key, value in kwargs.items():
+            if key in fields:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
 
     def __getattr__(self, item):
-        try:
-            return self._args[item]
-        except KeyError as e:
-            raise AttributeError from e
+        # Only called when a slot is unset or the attribute is not declared
+        if item in _INTERNAL_SLOTS or item.startswith('__'):
+            raise AttributeError(item)
+        if item == 'source':
+            source = self._get_source()
+            if source is not None:
+                return source
+        extra = self._extra
+        if extra is not None:
+            value = extra.get(item, _MISSING)
+            if value is not _MISSING:
+                return value
+        raise AttributeError(item)
 
     def get(self, key, default=None):
-        return self._args.get(key, default)
+        if key in self._fields:
+            return getattr(self, key, default)
+        if key == 'source':
+            source = self._get_source()
+            return default if source is None else source
+        extra = self._extra
+        if extra is None:
+            return default
+        return extra.get(key, default)
+
+    def _get_source(self):
+        source = self._source
+        if type(source) is weakref.ref:
+            source = source()
+        return source
+
+    def _without_source(self):
+        """ A shallow copy of this event that does not reference its source """
+        clone = object.__new__(type(self))
+        for name, getter in self._field_getters:
+            try:
+                setattr(clone, name, getter(self))
+            except AttributeError:
+                pass
+        clone._extra = self._extra
+        clone._source = None
+        if hasattr(self, '__dict__'):
+            clone.__dict__.update(self.__dict__)
+        return clone
 
     @classmethod
     def from_event(cls, event, **kwargs):
-        return cls(**{**event.as_dict(), **kwargs, 'source': event})
+        """
+        Creates a new event of this class with the fields of the given event, updated with kwargs. What is recorded
+        as the source of the new event depends on the provenance mode (see set_provenance).
+        """
+        derive = cls._derive
+        if derive is not None and (type(event) is cls or event._field_names == cls._field_names):
+            derived = derive(event, **kwargs)
+            if type(event) is not cls:
+                for name in cls._required:
+                    assert derived.get(name, _MISSING) is not _MISSING, f"A {name} property is required"
+        else:
+            values = {**event.as_dict(), **kwargs}
+            values.pop('source', None)
+            derived = cls(**values)
+
+        mode = _provenance.get() or _default_provenance
+        if mode == PROVENANCE_FULL:
+            derived._source = event
+        elif mode == PROVENANCE_PARENT:
+            derived._source = event if event._source is None else event._without_source()
+        elif mode == PROVENANCE_WEAKREF:
+            derived._source = weakref.ref(event)
+        else:
+            derived._source = None
+        return derived
 
     def as_dict(self):
-        return self._args
+        values = {}
+        for key, getter in self._field_getters:
+            try:
+                values[key] = getter(self)
+            except AttributeError:
+                pass
+        if self._extra:
+            values.update(_flat_extra(self._extra))
+        source = self._get_source()
+        if source is not None:
+            values['source'] = source
+        return values
+
+    def __getstate__(self):
+        state = {'_extra': self._extra and _flat_extra(self._extra), '_source': self._get_source()}
+        for name, getter in self._field_getters:
+            try:
+                state[name] = getter(self)
+            except AttributeError:
+                pass
+        return getattr(self, '__dict__', None), state
 
     def __eq__(self, other):
         return self.as_dict() == other.as_dict()
 
 
+_configure(ParseEvent)
+
+
 class EndContainer(ParseEvent):
-    pass
+    __slots__ = ('name',)
 
 
 class StartContainer(ParseEvent):
+    __slots__ = ('name',)
     end_event = EndContainer
-    pass
 
 
 class EndTable(ParseEvent):
-    pass
+    __slots__ = ('name',)
 
 
 class StartTable(ParseEvent):
+    __slots__ = ('name',)
     end_event = EndTable
-    pass
 
 
 class EndRow(ParseEvent):
-    pass
+    __slots__ = ('row_index',)
 
 
 class StartRow(ParseEvent):
+    __slots__ = ('row_index',)
     end_event = EndRow
-    pass
 
 
 class Cell(ParseEvent):
-    pass
+    __slots__ = ('value', 'column_index')
+
+
+class Row(ParseEvent):
+    """
+    A whole row in one event, emitted by parsers in place of StartRow, the row's Cells and EndRow when asked to
+    """
+    __slots__ = ('row_index', 'values')
 
 
 class XmlEvent(ParseEvent):
-    pass
+    __slots__ = ()
 
 
 class EndElement(XmlEvent):
-    def __init__(self, **kwargs):
-        assert 'tag' in kwargs, "A tag property is required"
-        super().__init__(**kwargs)
+    __slots__ = ('tag',)
+    _required = ('tag',)
 
 
 class StartElement(XmlEvent):
+    __slots__ = ('tag', 'attrib')
     end_event = EndElement
-
-    def __init__(self, **kwargs):
-        assert 'tag' in kwargs, "A tag property is required"
-        super().__init__(**kwargs)
+    _required = ('tag',)
 
 
 class ProcessingInstructionNode(XmlEvent):
-    def __init__(self, **kwargs):
-        assert 'text' in kwargs, "A text property is required"
-        super().__init__(**kwargs)
+    __slots__ = ('name', 'text')
+    _required = ('text',)
 
 
 class CommentNode(XmlEvent):
-    def __init__(self, **kwargs):
-        assert 'text' in kwargs, "A text property is required"
-        super().__init__(**kwargs)
+    __slots__ = ('text',)
+    _required = ('text',)
 
 
 class TextNode(XmlEvent):
-
-    def __init__(self, **kwargs):
-        assert 'text' in kwargs, "A text property is required"
-        super().__init__(**kwargs)
-
+    __slots__ = ('text',)
+    _required = ('text',)
@@ -1,9 +1,6 @@
-from typing import Iterable
+from typing import Iterable, List, Optional
 from sfdata_stream_parser import events
-from sfdata_stream_parser.checks import type_check
-from sfdata_stream_parser.collectors import collector, block_check
-from sfdata_stream_parser.filters.generic import filter_stream, streamfilter
-from sfdata_stream_parser.functions import pass_event
+from sfdata_stream_parser.profiling import stage
 
 
 class _SafeList(list):
@@ -14,43 +11,314 @@ class _SafeList(list):
             return default
 
 
-class _HeaderEvent(events.ParseEvent):
-    def __init__(self, headers: Iterable[str]):
-        super().__init__(headers=headers)
+class Headers(tuple):
+    """
+    The column headers of a table, in the order of its header row, with dicts between the headers and the column
+    indexes of their columns so either can be found from the other in constant time. A single Headers is shared by
+    the StartTable, rows and cells of a table. Where a header is repeated, its first column is the one found by name.
+
+    The column indexes are those of the header row's cells, which are the columns in the file when only some of
+    them are read. Without them, the headers are taken to be for columns 0, 1, 2 and so on, as for the values of a
+    Row event.
+    """
+
+    def __new__(cls, headers: Iterable[str], column_indexes: Iterable[int] = None):
+        self = super().__new__(cls, headers)
+        if column_indexes is not None:
+            column_indexes = tuple(column_indexes)
+            if column_indexes == tuple(range(len(self))):
+                column_indexes = None
+        # The header of each column, unless the columns are 0, 1, 2... when the tuple itself is used
+        self._by_column = None if column_indexes is None else dict(zip(reversed(column_indexes), reversed(self)))
+        columns = {}
+        for column_index, header in zip(column_indexes if column_indexes is not None else range(len(self)), self):
+            columns.setdefault(header, column_index)
+        self._columns = columns
+        return self
+
+    def get(self, column_index: int, default=None):
+        """ Returns the header of the column with column_index, or default if there is no such column """
+        by_column = self._by_column
+        if by_column is not None:
+            return by_column.get(column_index, default)
+        try:
+            return self[column_index] if column_index >= 0 else default
+        except (IndexError, TypeError):
+            return default
+
+    def column_index(self, header: str, default=None) -> Optional[int]:
+        """ Returns the column index of the column with header, or default if there is no such column """
+        return self._columns.get(header, default)
+
+    def __contains__(self, header):
+        return header in self._columns
+
+
+def _column_indexes(cells: Iterable[events.ParseEvent]) -> list:
+    """ The column indexes of the Cells of a row, or their positions for cells without one """
+    return [cell.get('column_index', ix) for ix, cell in enumerate(c for c in cells if isinstance(c, events.Cell))]
+
+
+@stage()
+def promote_first_row(stream, cell_headers=True):
+    """
+    Promote the first row of tables as column headers. The headers are set on the StartTable event as
+    column_headers, on the rows as headers, and on each cell as its column_header. They are one Headers object per
+    table, which the rows only refer to. Cells are matched to their header by column_index.
+
+    Setting column_header derives a new event for every cell, which is most of the cost of this stage: with the
+    default cell_headers=True a pipeline runs at about three quarters of the events per second it does with
+    cell_headers=False. Then only the rows are derived, which costs next to nothing, and a cell's header is
+    headers.get(cell.column_index) on its row's headers.
+
+    Anything between a StartTable and its first row is passed on after the StartTable.
+
+    :param stream:
+    :param cell_headers: If False, the cells are passed on as they are, without a column_header. Default is True.
+    :return:
+    """
+    # While reading the header row: the table's StartTable, the events held back until the headers are known, and
+    # the header values once the row has started
+    start_table = held = header_values = header_cells = None
+    headers = None
+    for event in stream:
+        if start_table is not None:
+            if header_values is not None:
+                if isinstance(event, events.Cell):
+                    header_values.append(event.get("value", ""))
+                    header_cells.append(event)
+                if not isinstance(event, events.EndRow):
+                    continue
+                headers = Headers(header_values, _column_indexes(header_cells))
+            elif isinstance(event, events.StartRow):
+                header_values, header_cells = [], []
+                continue
+            elif isinstance(event, events.Row):
+                headers = Headers(event.values)
+            elif isinstance(event, events.EndTable):
+                # A table without any rows
+                headers = Headers(())
+            else:
+                held.append(event)
+                continue
+
+            yield events.StartTable.from_event(start_table, column_headers=headers)
+            yield from held
+            start_table = held = header_values = header_cells = None
+            if isinstance(event, events.EndTable):
+                headers = None
+                yield event
+            continue
+
+        if isinstance(event, events.Cell):
+            if cell_headers and headers is not None:
+                event = event.from_event(event, column_header=headers.get(event.get('column_index')))
+        elif isinstance(event, (events.StartRow, events.Row)):
+            if headers is not None:
+                event = event.from_event(event, headers=headers)
+        elif isinstance(event, events.StartTable):
+            start_table = event
+            held = []
+            continue
+        elif isinstance(event, events.EndTable):
+            headers = None
+        yield event
+
 
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
 
-@collector(check=block_check(start_type=events.StartTable), receive_stream=True)
-def promote_first_row(stream):
+
+def _is_number(value) -> bool:
+    if isinstance(value, (int, float)):
+        return not isinstance(value, bool)
+    if isinstance(value, str):
+        try:
+            float(value.replace(',', ''))
+        except ValueError:
+            return False
+        return True
+    return False
+
+
+def _normalise(value) -> str:
+    return str(value).strip().casefold()
+
+
+def _fill_forward(values: list) -> list:
+    """ Fills the empty values of a row with the value to their left, as for the cells of a merged header """
+    filled = []
+    last = None
+    for value in values:
+        if _is_empty(value):
+            value = last
+        else:
+            last = value
+        filled.append(value)
+    return filled
+
+
+def _combine(rows: List[list], separator: str) -> list:
     """
-    Promote the first row of tables as column headers. The headers are set on the StartTable event as well
-    as on the individual cells.
+    Combines several header rows into one header per column. The rows above the last are filled forward, so a
+    header merged across columns is part of each of their headers. Repeated parts are only used once.
     """
-    start_table = next(stream)
-    assert isinstance(start_table, events.StartTable), "Expected StartTable event"
+    width = max(len(row) for row in rows)
+    filled = [_fill_forward(row) for row in rows[:-1]] + [rows[-1]]
+    headers = []
+    for column_index in range(width):
+        parts = []
+        for row in filled:
+            value = row[column_index] if column_index < len(row) else None
+            if not _is_empty(value):
+                value = str(value).strip()
+                if not parts or parts[-1] != value:
+                    parts.append(value)
+        headers.append(separator.join(parts))
+    return headers
 
-    @collector(check=block_check(start_type=events.StartRow), receive_stream=True, stop_after=True, iterations=1)
-    def row_consumer(row):
-        """ A collector that consumes the first row of a table and emits a _HeaderEvent event with the headers """
-        _headers = []
-        for event in filter_stream(row, type_check(events.Cell)):
-            _headers.append(event.get("value", ""))
-        yield _HeaderEvent(_headers)
 
-    # Consume the first row and extract the headers
-    header_events = list(row_consumer(stream))
-    assert isinstance(header_events[-1], _HeaderEvent), "Expected _HeaderEvent event"
+def _score(rows: List[list], width: int, expected: frozenset) -> float:
+    """
+    Scores how much a block of rows looks like the header of a table: the share of the columns they fill, the share
+    of their values that are text rather than numbers, and the share of the expected headers among them, which is
+    weighted twice as much
+    """
+    score = 0.0
+    for ix, row in enumerate(rows):
+        if ix < len(rows) - 1:
+            row = _fill_forward(row)
+        values = [value for value in row if not _is_empty(value)]
+        if values:
+            score += len(values) / width
+            score += sum(1 for value in values if not _is_number(value)) / len(values)
+    score /= len(rows)
+    if expected:
+        found = {_normalise(value) for row in rows for value in row if not _is_empty(value)}
+        score += 2 * len(found & expected) / len(expected)
+    return score
 
-    headers = header_events[-1].headers
 
-    # Emit the StartTable event with the headers
-    yield events.StartTable.from_event(start_table, column_headers=headers)
+@stage()
+def promote_header_row(stream, lookahead: int = 10, header_rows: int = 1, expected_headers: Iterable[str] = None,
+                       separator=' ', cell_headers=True):
+    """
+    Finds the header row of each table among its first rows and promotes it as the column headers, for tables with
+    title rows, notes or blank rows above the header. The headers are set as by promote_first_row, and the rows
+    above the header are dropped.
 
-    # Emit anything between the StartTable and the first row
-    yield from header_events[:-1]
+    Each candidate is scored on the share of the table's columns it fills, the share of its values that are text
+    rather than numbers, and, if expected_headers are given, how many of them it contains, ignoring case. The first
+    of the best scoring is used. Only the first lookahead rows of a table are held, so memory use does not grow
+    with the size of the table.
+
+        stream = promote_header_row(parse_csv(f), expected_headers=['Child ID', 'Date of birth'])
+
+    :param stream:
+    :param lookahead: The number of rows at the start of each table to look for the header in. Default is 10.
+    :param header_rows: The number of rows the header takes up. Their values are joined with separator for each
+                        column, and a value in an upper row is used for the empty cells to its right, as for a
+                        header merged across several columns. Default is 1.
+    :param expected_headers: Headers the header row should contain.
+    :param separator: The separator between the values of a header taking up several rows. Default is a space.
+    :param cell_headers: If False, the cells are passed on without a column_header. Default is True.
+    :return:
+    """
+    if header_rows < 1:
+        raise ValueError(f"header_rows must be at least 1: {header_rows}")
+    if lookahead < header_rows:
+        raise ValueError(f"lookahead must be at least header_rows ({header_rows}): {lookahead}")
+    expected = frozenset(_normalise(header) for header in expected_headers or ())
+
+    # While looking for the header: the table's StartTable, the events held back as (row values, events) pairs,
+    # where the values are None for events outside a row, and the values and events of the row being read
+    start_table = held = row_values = row_events = None
+    held_rows = 0
+    headers = None
+    for event in stream:
+        if start_table is not None:
+            if row_values is not None:
+                row_events.append(event)
+                if isinstance(event, events.Cell):
+                    row_values.append(event.get("value"))
+                if not isinstance(event, events.EndRow):
+                    continue
+                held.append((row_values, row_events))
+                held_rows += 1
+                row_values = row_events = None
+                if held_rows < lookahead:
+                    continue
+            elif isinstance(event, events.StartRow):
+                row_values, row_events = [], [event]
+                continue
+            elif isinstance(event, events.Row):
+                held.append((list(event.values), [event]))
+                held_rows += 1
+                if held_rows < lookahead:
+                    continue
+            elif not isinstance(event, events.EndTable):
+                held.append((None, [event]))
+                continue
+
+            headers, rows = _find_header(held, header_rows, expected, separator)
+            yield events.StartTable.from_event(start_table, column_headers=headers)
+            start_table = held = None
+            held_rows = 0
+            if isinstance(event, events.EndTable):
+                rows.append(event)
+            for held_event in rows:
+                if isinstance(held_event, events.Cell):
+                    if cell_headers:
+                        held_event = held_event.from_event(
+                            held_event, column_header=headers.get(held_event.get('column_index')))
+                elif isinstance(held_event, (events.StartRow, events.Row)):
+                    held_event = held_event.from_event(held_event, headers=headers)
+                elif isinstance(held_event, events.EndTable):
+                    headers = None
+                yield held_event
+            continue
+
+        if isinstance(event, events.Cell):
+            if cell_headers and headers is not None:
+                event = event.from_event(event, column_header=headers.get(event.get('column_index')))
+        elif isinstance(event, (events.StartRow, events.Row)):
+            if headers is not None:
+                event = event.from_event(event, headers=headers)
+        elif isinstance(event, events.StartTable):
+            start_table = event
+            held = []
+            continue
+        elif isinstance(event, events.EndTable):
+            headers = None
+        yield event
+
+
+def _find_header(held: list, header_rows: int, expected: frozenset, separator: str):
+    """
+    Picks the header from the rows held at the start of a table. Returns the headers, and the events to pass on:
+    those outside rows, and the rows below the header.
+    """
+    rows = [(ix, values) for ix, (values, _) in enumerate(held) if values is not None]
+    if not rows:
+        return Headers(()), [event for _, held_events in held for event in held_events]
 
-    @streamfilter(check=type_check(events.StartRow), fail_function=pass_event)
-    def row_enricher(event):
-        yield event.from_event(event, headers=headers)
+    width = max(len(values) for _, values in rows) or 1
+    best = best_score = None
+    for start in range(max(1, len(rows) - header_rows + 1)):
+        block = [values for _, values in rows[start:start + header_rows]]
+        score = _score(block, width, expected)
+        if best_score is None or score > best_score:
+            best, best_score = start, score
 
-    # Now add headers to every row
-    yield from row_enricher(stream)
+    block = rows[best:best + header_rows]
+    # The columns are those of the widest header row, unless they came as Row events
+    widest = max(block, key=lambda row: len(row[1]))[0]
+    row_events = held[widest][1]
+    column_indexes = None if isinstance(row_events[0], events.Row) else _column_indexes(row_events)
+    headers = Headers(_combine([values for _, values in block], separator), column_indexes)
+    below = block[-1][0]
+    passed = []
+    for ix, (values, held_events) in enumerate(held):
+        if values is None or ix > below:
+            passed.extend(held_events)
+    return headers, passed
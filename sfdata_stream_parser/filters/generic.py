@@ -3,8 +3,9 @@ from typing import Iterator, Iterable, Callable,Mapping, Any
 
 from sfdata_stream_parser.checks import type_check, EventCheck
 from sfdata_stream_parser.events import ParseEvent
-from sfdata_stream_parser.function_helpers import filter_caller
+from sfdata_stream_parser.function_helpers import call_plan, event_or_iterable
 from sfdata_stream_parser.functions import *
+from sfdata_stream_parser.profiling import stage
 from sfdata_stream_parser.stream import first_then_rest
 from sfdata_stream_parser.types import FilteredValue, EventFilter, FilterErrorHandler
 
@@ -43,14 +44,20 @@ def filter_stream(
         error_function: FilterErrorHandler = raise_error,
         **kwargs,
 ) -> Iterable[events.ParseEvent]:
+    # Resolve the signatures once, rather than for every event
+    pass_call = call_plan(pass_function).bind(pass_function, **kwargs)
+    fail_call = call_plan(fail_function).bind(fail_function, **kwargs)
+    error_call = call_plan(error_function).bind(error_function, with_exception=True, **kwargs)
+
     for event in iterable:
         try:
-            if check(event):
-                yield from filter_caller(pass_function, event, **kwargs)
-            else:
-                yield from filter_caller(fail_function, event, **kwargs)
+            value = pass_call(event) if check(event) else fail_call(event)
+            if isinstance(value, ParseEvent):
+                yield value
+            elif value is not None:
+                yield from event_or_iterable(value)
         except Exception as ex:
-            yield from filter_caller(error_function, event, ex, **kwargs)
+            yield from event_or_iterable(error_call(event, ex))
 
 
 def __event_generator(func, default_args=None, **genargs):
@@ -66,6 +73,9 @@ def __event_generator(func, default_args=None, **genargs):
 
         yield from filter_stream(stream, pass_function=func, **genargs, **kwargs)
 
+    wrapper = stage()(wrapper)
+    # Lets a Pipeline fuse this filter with its neighbours
+    wrapper.streamfilter_args = (func, default_args, genargs)
     return wrapper
 
 
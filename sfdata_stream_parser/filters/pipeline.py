@@ -0,0 +1,223 @@
+import functools
+from typing import Callable, Iterable, Iterator, List, Union
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import EventCheck
+from sfdata_stream_parser.events import ParseEvent
+from sfdata_stream_parser.function_helpers import call_plan, event_or_iterable
+from sfdata_stream_parser.functions import pass_event, block_event, raise_error
+from sfdata_stream_parser.profiling import stage
+from sfdata_stream_parser.types import EventFilter, FilterErrorHandler
+
+StreamFunction = Callable[[Iterable[events.ParseEvent]], Iterable[events.ParseEvent]]
+
+
+def _always(event):
+    return True
+
+
+class FilterStage:
+    """
+    The arguments of one filter_stream: a check, the pass, fail and error functions, and the keyword arguments
+    passed on to them.
+    """
+
+    def __init__(
+            self,
+            check: EventCheck = _always,
+            pass_function: EventFilter = pass_event,
+            fail_function: EventFilter = block_event,
+            error_function: FilterErrorHandler = raise_error,
+            **kwargs,
+    ):
+        self.check = check
+        self.pass_function = pass_function
+        self.fail_function = fail_function
+        self.error_function = error_function
+        self.kwargs = kwargs
+
+    @classmethod
+    def from_streamfilter(cls, func: Callable, **kwargs) -> "FilterStage":
+        """
+        Returns the stage for a function decorated with streamfilter, called with kwargs
+        """
+        pass_function, default_args, genargs = func.streamfilter_args
+        if default_args:
+            kwargs = {**default_args(), **kwargs}
+        return cls(pass_function=pass_function, **genargs, **kwargs)
+
+    def bind(self):
+        """ Returns the check and the pass, fail and error callables as resolved by filter_stream """
+        kwargs = self.kwargs
+        return (
+            self.check,
+            call_plan(self.pass_function).bind(self.pass_function, **kwargs),
+            call_plan(self.fail_function).bind(self.fail_function, **kwargs),
+            call_plan(self.error_function).bind(self.error_function, with_exception=True, **kwargs),
+        )
+
+
+def _as_filter_stage(item) -> Union[FilterStage, None]:
+    if isinstance(item, FilterStage):
+        return item
+    if hasattr(item, 'streamfilter_args'):
+        return FilterStage.from_streamfilter(item)
+    if isinstance(item, functools.partial) and not item.args and hasattr(item.func, 'streamfilter_args'):
+        return FilterStage.from_streamfilter(item.func, **item.keywords)
+    return None
+
+
+class _FusedFilters:
+    """
+    Runs a sequence of filter stages over a stream in a single loop. An event that a stage turns into exactly one
+    event goes straight on to the next stage. Only when a stage returns an iterable do we fall back to a generator,
+    which passes each of the events it produces through the remaining stages in turn.
+
+    This gives the same output, in the same order, as chaining filter_stream for each stage: errors raised by a
+    stage, or while iterating its output, are handled by that stage's error function, and errors raised by the
+    error function propagate.
+    """
+
+    def __init__(self, stages: List[FilterStage]):
+        # Resolve the signatures once, rather than for every event
+        self._bound = [filter_stage.bind() for filter_stage in stages]
+        self._run = self._compile()
+
+    def __call__(self, stream: Iterable[events.ParseEvent]) -> Iterator[events.ParseEvent]:
+        return self._run(stream)
+
+    def _compile(self):
+        """
+        Generates the main loop with the stages unrolled, which is the same as calling _from(event, 0) for each
+        event but without a generator per event. Calls to pass_event are left out, as are checks that always pass.
+        """
+        namespace = dict(ParseEvent=ParseEvent, _continue=self._continue)
+        lines = ['def _fused(stream):', '    for event in stream:']
+        for ix, (check, pass_call, fail_call, error_call) in enumerate(self._bound):
+            namespace.update({f'check_{ix}': check, f'pass_{ix}': pass_call, f'fail_{ix}': fail_call,
+                              f'error_{ix}': error_call})
+            on_pass = 'event' if pass_call is pass_event else f'pass_{ix}(event)'
+            on_fail = 'event' if fail_call is pass_event else f'fail_{ix}(event)'
+            if check is not _always:
+                value = f'{on_pass} if check_{ix}(event) else {on_fail}'
+            elif on_pass != 'event':
+                value = on_pass
+            else:
+                # Passes every event as it is
+                continue
+            lines += [
+                '        try:',
+                f'            value = {value}',
+                '        except Exception as ex:',
+                f'            yield from _continue(error_{ix}(event, ex), event, {ix}, False)',
+                '            continue',
+                '        if not isinstance(value, ParseEvent):',
+                '            if value is not None:',
+                f'                yield from _continue(value, event, {ix})',
+                '            continue',
+                '        event = value',
+            ]
+        lines.append('        yield event')
+        exec(compile('\n'.join(lines), '<pipeline>', 'exec'), namespace)
+        return namespace['_fused']
+
+    def _continue(self, value, event, ix, handle_errors=True) -> Iterator[events.ParseEvent]:
+        """ Passes the events in value, the output of stage ix for event, through the stages after ix """
+        if isinstance(value, ParseEvent):
+            yield from self._from(value, ix + 1)
+            return
+
+        iterator = iter(event_or_iterable(value))
+        while True:
+            try:
+                output = next(iterator)
+            except StopIteration:
+                return
+            except Exception as ex:
+                if not handle_errors:
+                    raise
+                yield from self._continue(self._bound[ix][3](event, ex), event, ix, handle_errors=False)
+                return
+            yield from self._from(output, ix + 1)
+
+    def _from(self, event, start) -> Iterator[events.ParseEvent]:
+        """ Passes a single event through the stages from start onwards """
+        bound = self._bound
+        for ix in range(start, len(bound)):
+            check, pass_call, fail_call, error_call = bound[ix]
+            try:
+                value = pass_call(event) if check(event) else fail_call(event)
+            except Exception as ex:
+                yield from self._continue(error_call(event, ex), event, ix, handle_errors=False)
+                return
+            if isinstance(value, ParseEvent):
+                event = value
+            elif value is None:
+                return
+            else:
+                yield from self._continue(value, event, ix)
+                return
+        yield event
+
+
+class Pipeline:
+    """
+    A chain of stream stages that runs consecutive filter stages in one fused loop, rather than as one generator
+    per stage. Stages can be:
+
+    * a FilterStage, which holds the arguments of a filter_stream
+    * a function decorated with streamfilter, or a functools.partial of one with keyword arguments
+    * any other function that takes a stream and returns a stream, such as a collector. These break the fused
+      loop and are chained as they are.
+
+        pipeline = Pipeline([
+            FilterStage(check=type_check(events.Cell), pass_function=strip_value, fail_function=pass_event),
+            convert_values,
+            promote_first_row,
+        ])
+        stream = pipeline(parse_csv(f))
+
+    The output is the same as applying each stage in turn.
+    """
+
+    def __init__(self, stages: Iterable[Union[FilterStage, StreamFunction]] = ()):
+        self.stages = []
+        for item in stages:
+            self.add(item)
+
+    def add(self, item: Union[FilterStage, StreamFunction]) -> "Pipeline":
+        """ Appends a stage, and returns the pipeline so calls can be chained """
+        self.stages.append(item)
+        return self
+
+    def add_filter(self, **kwargs) -> "Pipeline":
+        """ Appends a FilterStage created with kwargs, and returns the pipeline so calls can be chained """
+        return self.add(FilterStage(**kwargs))
+
+    def segments(self) -> List[Union[List[FilterStage], StreamFunction]]:
+        """ The stages, with runs of consecutive filter stages grouped into lists """
+        segments = []
+        for item in self.stages:
+            filter_stage = _as_filter_stage(item)
+            if filter_stage is None:
+                segments.append(item)
+            elif segments and isinstance(segments[-1], list):
+                segments[-1].append(filter_stage)
+            else:
+                segments.append([filter_stage])
+        return segments
+
+    def __call__(self, stream: Iterable[events.ParseEvent]) -> Iterable[events.ParseEvent]:
+        if isinstance(stream, ParseEvent):
+            stream = (stream,)
+        for segment in self.segments():
+            if isinstance(segment, list):
+                stream = _run_fused(stream, segment)
+            else:
+                stream = segment(stream)
+        return stream
+
+
+@stage(name='Pipeline')
+def _run_fused(stream, filter_stages):
+    return _FusedFilters(filter_stages)(stream)
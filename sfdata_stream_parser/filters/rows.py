@@ -0,0 +1,204 @@
+"""
+Filters that work on whole rows. The function is called once per row with a RowRecord, which holds the row's
+StartRow, its cells, and their values in a list, rather than once for each cell. Rows emitted by parsers as single
+Row events are handed over the same way.
+
+    @rowfilter
+    def add_age(row):
+        row['Age'] = age(row['Date of birth'])
+        return row
+"""
+import functools
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Union
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import EventCheck
+from sfdata_stream_parser.function_helpers import call_plan, event_or_iterable
+from sfdata_stream_parser.functions import raise_error
+from sfdata_stream_parser.profiling import stage
+from sfdata_stream_parser.types import FilterErrorHandler
+
+
+class RowRecord:
+    """
+    One row of a table. start is the row's StartRow, or its Row event for parsers emitting rows as single events,
+    cells its Cells and end its EndRow, while values holds the values of the cells, which can be changed in place.
+    Returned from a row filter, the row is emitted as it came in, apart from new Cells for the values that were
+    changed. Values added to the end of the list get new Cells, and Cells are dropped for values removed from it.
+
+    Values can be read and set by their position in values, or by column header if the row has headers, as set by
+    promote_first_row. A header finds the value of the Cell with its column's column_index.
+    """
+    __slots__ = ('start', 'cells', 'values', 'end', 'others')
+
+    def __init__(self, start: events.ParseEvent, cells: Optional[List[events.Cell]], values: list,
+                 end: Optional[events.EndRow] = None, others: List[events.ParseEvent] = None):
+        self.start = start
+        self.cells = cells
+        self.values = values
+        self.end = end
+        # Events inside the row that are not Cells, which are emitted after the StartRow
+        self.others = others
+
+    @property
+    def row_index(self) -> Optional[int]:
+        return self.start.get('row_index')
+
+    @property
+    def headers(self):
+        return self.start.get('headers')
+
+    def _position(self, key: Union[int, str]) -> int:
+        """ The position in values of a position, or of the column with a header """
+        if isinstance(key, int):
+            return key
+        headers = self.headers
+        column_index = headers.column_index(key) if headers is not None else None
+        if column_index is None:
+            raise KeyError(key)
+        cells = self.cells
+        if cells is None:
+            return column_index
+        # The cells are usually in column order from 0, but not when only some columns were read
+        if column_index < len(cells) and cells[column_index].get('column_index') == column_index:
+            return column_index
+        for position, cell in enumerate(cells):
+            if cell.get('column_index') == column_index:
+                return position
+        raise KeyError(key)
+
+    def __getitem__(self, key: Union[int, str]) -> Any:
+        return self.values[self._position(key)]
+
+    def __setitem__(self, key: Union[int, str], value):
+        self.values[self._position(key)] = value
+
+    def get(self, key: Union[int, str], default=None) -> Any:
+        try:
+            return self[key]
+        except (IndexError, KeyError):
+            return default
+
+    def __len__(self):
+        return len(self.values)
+
+    def events(self) -> Iterator[events.ParseEvent]:
+        """ The events of the row, with new Cells for any values that were changed """
+        start, values = self.start, self.values
+        if self.cells is None:
+            yield start if values == start.values else start.from_event(start, values=values)
+            return
+
+        yield start
+        if self.others:
+            yield from self.others
+        cells = self.cells
+        for cell, value in zip(cells, values):
+            # The values are the cells' own until they are replaced
+            yield cell if value is cell.get('value') else cell.from_event(cell, value=value)
+        for column_index in range(len(cells), len(values)):
+            yield events.Cell(value=values[column_index], column_index=column_index)
+        if self.end is not None:
+            yield self.end
+
+
+def _outputs(value) -> Iterable[events.ParseEvent]:
+    """ The events for a value returned from a row function: a RowRecord, an event, None or an iterable of events """
+    if isinstance(value, RowRecord):
+        return value.events()
+    if isinstance(value, events.ParseEvent):
+        return value,
+    if value is None:
+        return ()
+    return event_or_iterable(value)
+
+
+def filter_rows(
+        iterable: Iterable[events.ParseEvent],
+        row_function: Callable[[RowRecord], Any],
+        check: EventCheck = lambda x: True,
+        error_function: FilterErrorHandler = raise_error,
+        **kwargs,
+) -> Iterable[events.ParseEvent]:
+    """
+    Calls row_function with a RowRecord for each row whose StartRow (or Row event) passes the check, and emits what
+    it returns: the row itself, other events, or None to drop the row. Events outside rows, and the rows that fail
+    the check, are passed on as they are. If the function raises an exception, the error_function is called with the
+    RowRecord as the event.
+
+    :param iterable:
+    :param row_function: A function taking the RowRecord as its first argument, and any of kwargs
+    :param check: A check on the row's StartRow or Row event
+    :param error_function:
+    :param kwargs: Arguments for row_function and error_function, each only getting those it accepts
+    :return:
+    """
+    accepted = call_plan(row_function).accepted
+    row_kwargs = {k: v for k, v in kwargs.items() if k in accepted}
+    call = functools.partial(row_function, **row_kwargs) if row_kwargs else row_function
+    error_call = call_plan(error_function).bind(error_function, with_exception=True, **kwargs)
+
+    start = cells = values = others = None
+    for event in iterable:
+        if start is None:
+            if isinstance(event, events.StartRow) and check(event):
+                start, cells, values = event, [], []
+            elif isinstance(event, events.Row) and check(event):
+                row = RowRecord(event, None, list(event.values))
+                try:
+                    yield from _outputs(call(row))
+                except Exception as ex:
+                    yield from _outputs(error_call(row, ex))
+            else:
+                yield event
+            continue
+
+        if isinstance(event, events.Cell):
+            cells.append(event)
+            values.append(event.get('value'))
+            continue
+        if not isinstance(event, events.EndRow):
+            if others is None:
+                others = []
+            others.append(event)
+            continue
+
+        row = RowRecord(start, cells, values, event, others)
+        start = cells = values = others = None
+        try:
+            yield from _outputs(call(row))
+        except Exception as ex:
+            yield from _outputs(error_call(row, ex))
+
+    if start is not None:
+        # The stream ended inside a row, so pass on what there is of it
+        yield from RowRecord(start, cells, values, None, others).events()
+
+
+def __row_generator(func, default_args=None, **genargs):
+    @functools.wraps(func)
+    def wrapper(stream, *_, **kwargs):
+        if default_args:
+            _kwargs = default_args()
+            _kwargs.update(**kwargs)
+            kwargs = _kwargs
+
+        if isinstance(stream, events.ParseEvent):
+            stream = (stream,)
+
+        yield from filter_rows(stream, func, **genargs, **kwargs)
+
+    return stage()(wrapper)
+
+
+def rowfilter(arg=None, **kwargs):
+    """
+    Turns a function taking a RowRecord into a stream filter, as streamfilter does for functions taking an event.
+    The arguments are those of filter_rows, and default_args, a function returning default keyword arguments.
+    """
+    if isinstance(arg, Callable):
+        return __row_generator(arg, **kwargs)
+    else:
+        def wrapper(func):
+            return __row_generator(func, **kwargs)
+        return wrapper
@@ -1,4 +1,7 @@
+import functools
 import inspect
+import types
+import weakref
 from typing import Callable, Iterable
 
 from sfdata_stream_parser import events
@@ -6,19 +9,93 @@ from sfdata_stream_parser.events import ParseEvent
 from sfdata_stream_parser.types import FilteredValue
 
 
+class CallPlan:
+    """
+    Everything we need to know about a function's signature to call it from a filter or collector: the names it
+    accepts, which argument receives the event and which the exception, and whether it is a method. Inspecting a
+    signature is slow, so plans are resolved once per function with call_plan and cached.
+    """
+    __slots__ = ('accepted', 'event_arg', 'exception_arg', 'event_first', 'is_method')
+
+    def __init__(self, func: Callable):
+        argspec = inspect.getfullargspec(func)
+        self.accepted = frozenset(argspec.args) | frozenset(argspec.kwonlyargs)
+
+        event_arg = next(filter(lambda x: x.startswith("ev"), argspec.args), 'event')
+        exception_arg = next(filter(lambda x: x.startswith("ex"), argspec.args), 'exception')
+        self.event_arg = event_arg if event_arg in self.accepted else None
+        self.exception_arg = exception_arg if exception_arg in self.accepted else None
+
+        # The event can be passed positionally, which is the cheapest way to call
+        self.event_first = len(argspec.args) > 0 and argspec.args[0] == self.event_arg
+
+        # I don't like this... but it works
+        self.is_method = len(argspec.args) > 0 and argspec.args[0] in ["self", "cls"]
+
+    def has(self, key) -> bool:
+        return key in self.accepted
+
+    def bind(self, func: Callable, with_exception=False, **kwargs) -> Callable:
+        """
+        Returns a callable that calls func with the arguments it accepts. It takes the event, or the event and the
+        exception if with_exception is set. A function that only takes the event is returned as it is.
+        """
+        kwargs = {k: v for k, v in kwargs.items() if k in self.accepted}
+        event_arg = self.event_arg
+        exception_arg = self.exception_arg
+
+        if not with_exception and exception_arg is None:
+            if event_arg is None and not kwargs:
+                return lambda event: func()
+            if self.event_first:
+                # partial binds the keyword arguments in C, which is cheaper than building them on each call
+                return functools.partial(func, **kwargs) if kwargs else func
+
+        def _call(event, exception=None):
+            call_kwargs = dict(kwargs)
+            if event_arg is not None:
+                call_kwargs[event_arg] = event
+            if exception_arg is not None:
+                call_kwargs[exception_arg] = exception
+            return func(**call_kwargs)
+        return _call
+
+
+_call_plans = weakref.WeakKeyDictionary()
+
+
+def call_plan(func: Callable) -> CallPlan:
+    """
+    Returns the cached CallPlan for func, creating it on first use. Bound methods share the plan of their function.
+    """
+    key = func.__func__ if isinstance(func, types.MethodType) else func
+    try:
+        return _call_plans[key]
+    except KeyError:
+        plan = _call_plans[key] = CallPlan(func)
+        return plan
+    except TypeError:
+        # Not hashable or not weakly referenceable, so we can't cache it
+        return CallPlan(func)
+
+
 class FunctionCaller:
 
     def __init__(self, func: Callable, *args, **kwargs):
         self._func = func
         self._args = args
         self._kwargs = kwargs
-        self._argspec = inspect.getfullargspec(func)
+        self._plan = plan = call_plan(func)
+        self._prefix = args[:1] if plan.is_method else ()
+        self._call_kwargs = {k: v for k, v in kwargs.items() if k in plan.accepted}
 
     def __setattr__(self, key, value):
         if key.startswith("_"):
             super().__setattr__(key, value)
         else:
             self._kwargs[key] = value
+            if key in self._plan.accepted:
+                self._call_kwargs[key] = value
 
     @property
     def stream(self):
@@ -28,41 +105,36 @@ class FunctionCaller:
             return self._args[0]
 
     def __call__(self, event):
-        if self.is_method:
-            args = (self._args[0], event)
-        else:
-            args = (event,)
+        return event_or_iterable(self._func(*self._prefix, event, **self._call_kwargs))
+
+    def call(self, event):
+        """ Calls the function with the event, and returns its result as it is """
+        return self._func(*self._prefix, event, **self._call_kwargs)
 
-        kwargs = {k: v for k, v in self._kwargs.items() if self.has(k)}
-        return event_or_iterable(self._func(*args, **kwargs))
+    def call_with(self, event, context: dict):
+        """
+        Calls the function with the event and the arguments in context, which must all be accepted by the function,
+        and returns its result as it is. The arguments are kept for later calls, as if they had been set as attributes.
+        """
+        call_kwargs = self._call_kwargs
+        call_kwargs.update(context)
+        return self._func(*self._prefix, event, **call_kwargs)
 
     def has(self, key):
-        return _has_arg(key, self._argspec)
+        return key in self._plan.accepted
 
     @property
     def is_method(self):
-        # I don't like this... but it works
-        return self._argspec.args[0] in ["self", "cls"]
-
-
-def _has_arg(key, argspec):
-    return key in argspec.args or key in argspec.kwonlyargs
+        return self._plan.is_method
 
 
 def filter_caller(func: Callable, event: ParseEvent, exception: Exception = None, **kwargs):
-    argspec = inspect.getfullargspec(func)
-
-    event_arg = next(filter(lambda x: x.startswith("ev"), argspec.args), 'event')
-    exception_arg = next(filter(lambda x: x.startswith("ex"), argspec.args), 'exception')
-
-    kwargs = {**kwargs, event_arg: event, exception_arg: exception}
-    kwargs = {k: v for k, v in kwargs.items() if _has_arg(k, argspec)}
-
-    return event_or_iterable(func(**kwargs))
+    call = call_plan(func).bind(func, with_exception=True, **kwargs)
+    return event_or_iterable(call(event, exception))
 
 
 def event_or_iterable(value: FilteredValue) -> Iterable[events.ParseEvent]:
     if isinstance(value, Iterable):
         yield from value
     elif isinstance(value, events.ParseEvent) or value is not None:
-        yield value
\ No newline at end of file
+        yield value
@@ -1,14 +1,485 @@
+import asyncio
 import csv
+import io
+import itertools
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from sfdata_stream_parser import aio
+from sfdata_stream_parser.aio import ByteSource
 from sfdata_stream_parser.events import *
+from sfdata_stream_parser.parser.selection import RowSelection, ColumnSelection, row_range, column_list, select_rows
+from sfdata_stream_parser.profiling import stage
+
+DEFAULT_BLOCK_SIZE = 1 << 20
 
 
-def parse_csv(csvfile, name=None, table_name=None, **csvargs):
+def _emit(indexed_records, name=None, table_name=None, row_events=False, rows: Optional[range] = None,
+          columns: Optional[list] = None):
+    """
+    Emits the events for a table from (row_index, values) pairs, for the rows and columns selected. Cells keep
+    the column_index of their column in the file.
+    """
     yield StartContainer(name=name)
     yield StartTable(name=table_name or name)
-    for row_ix, row in enumerate(csv.reader(csvfile, **csvargs)):
-        yield StartRow(row_index=row_ix)
-        for col_ix, cell in enumerate(row):
-            yield Cell(value=cell, column_index=col_ix)
-        yield EndRow(row_index=row_ix)
+    yield from _emit_rows(select_rows(indexed_records, rows), row_events, columns)
     yield EndTable(name=table_name or name)
     yield EndContainer(name=name)
+
+
+def _emit_rows(indexed_records, row_events=False, columns: Optional[list] = None):
+    """ Emits the events for each (row_index, values) pair """
+    if row_events:
+        row = Row._make
+        if columns is None:
+            for row_ix, values in indexed_records:
+                yield row(row_ix, values)
+        else:
+            # The values line up with columns, so a column missing from a short row is given as an empty field
+            for row_ix, values in indexed_records:
+                width = len(values)
+                yield row(row_ix, [values[col_ix] if col_ix < width else '' for col_ix in columns])
+    else:
+        start_row, cell, end_row = StartRow._make, Cell._make, EndRow._make
+        for row_ix, values in indexed_records:
+            yield start_row(row_ix)
+            if columns is None:
+                for col_ix, value in enumerate(values):
+                    yield cell(value, col_ix)
+            else:
+                width = len(values)
+                for col_ix in columns:
+                    if col_ix < width:
+                        yield cell(values[col_ix], col_ix)
+            yield end_row(row_ix)
+
+
+@stage(stream_arg=None)
+def parse_csv(csvfile, name=None, table_name=None, row_events=False, rows: RowSelection = None,
+              columns: ColumnSelection = None, **csvargs):
+    """
+    Parses CSV from a text file, or any iterable of lines, using csv.reader.
+
+    :param csvfile:
+    :param name: The name of the container
+    :param table_name: The name of the table. Defaults to name.
+    :param row_events: If True, emit a Row event with all the values of each row, rather than StartRow, a Cell
+                       for each value and EndRow. Default is False.
+    :param rows: The rows to read, as a range of row indexes or the number of rows from the start. Reading stops
+                 after the last row selected. Defaults to all rows.
+    :param columns: The indexes of the columns to read, in the order to emit them. Defaults to all columns. The
+                    values of Row events line up with columns, with '' for a column missing from a short row.
+    :param csvargs: Passed on to csv.reader
+    :return:
+    """
+    return _emit(enumerate(csv.reader(csvfile, **csvargs)), name=name, table_name=table_name,
+                 row_events=row_events, rows=row_range(rows), columns=column_list(columns))
+
+
+def _blocks(source, block_size: int, use_mmap: bool):
+    """ Yields the contents of a binary file, or of the file at a path, in blocks of block_size bytes """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from _blocks(f, block_size, use_mmap)
+        return
+
+    if use_mmap:
+        if os.fstat(source.fileno()).st_size == 0:
+            return
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, len(mapped), block_size):
+                yield mapped[start:start + block_size]
+        return
+
+    read = source.read
+    block = read(block_size)
+    while block:
+        yield block
+        block = read(block_size)
+
+
+def _split(text: str, delimiter: str, quotechar: str):
+    """ Splits complete lines of CSV into rows, using str.split unless there are quotes to deal with """
+    if quotechar in text:
+        yield from csv.reader(io.StringIO(text, newline=''), delimiter=delimiter, quotechar=quotechar)
+        return
+
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    for line in lines:
+        yield line.split(delimiter) if line else []
+
+
+# A line after the text being split, which is a record of its own unless the last record of the text is still in
+# quotes at its end and takes the line in. It is ASCII, so that adding it to ASCII text does not widen the string.
+_END_MARK = '\x1e'
+
+
+def _split_records(text: str, delimiter: str, quotechar: str):
+    """
+    Splits lines of CSV into rows as _split does. Yields the rows of the complete records, and returns the text of
+    the last record if a quoted field carries it on past the end of the text, or ''. Only quoted fields do: a quote
+    in the middle of an unquoted field, as in 12" pizza, is part of its value, as it is for csv.reader.
+    """
+    if quotechar not in text:
+        yield from _split(text, delimiter, quotechar)
+        return ''
+
+    csvargs = dict(delimiter=delimiter, quotechar=quotechar)
+    marked = text + _END_MARK if text.endswith('\n') else text + '\n' + _END_MARK
+    reader = csv.reader(io.StringIO(marked, newline=''), **csvargs)
+    # Each row is held back until the next, as the last is either the mark or a record that took it in
+    complete = 0
+    last = next(reader)
+    for complete, row in enumerate(reader, start=1):
+        yield last
+        last = row
+    if last == [_END_MARK]:
+        return ''
+
+    # Find where the last record starts by reading the records before it again
+    lines = io.StringIO(text, newline='')
+    deque(itertools.islice(csv.reader(lines, **csvargs), complete), maxlen=0)
+    return text[lines.tell():]
+
+
+def _records(source, encoding: str, delimiter: str, quotechar: str, block_size: int, use_mmap: bool):
+    """
+    Yields the rows of a CSV file read in blocks. Each block is cut after its last line break, and the remainder
+    is carried over to the next block, along with the last record of the block if it is still in quotes there.
+    """
+    pending = b''
+    for block in _blocks(source, block_size, use_mmap):
+        if pending:
+            block = pending + block
+        cut = block.rfind(b'\n') + 1
+        if not cut:
+            pending = block
+            continue
+        rest = yield from _split_records(block[:cut].decode(encoding), delimiter, quotechar)
+        pending = rest.encode(encoding) + block[cut:] if rest else block[cut:]
+
+    if pending:
+        yield from _split(pending.decode(encoding), delimiter, quotechar)
+
+
+def _collect(generator) -> Tuple[list, Any]:
+    """ Returns the items of a generator, and the value it returns """
+    returned = []
+
+    def _items():
+        returned.append((yield from generator))
+    return list(_items()), returned[0]
+
+
+def _indexed(records):
+    """ Enumerates records, closing them when closed, so that the file is closed as soon as we stop reading """
+    try:
+        yield from enumerate(records)
+    finally:
+        records.close()
+
+
+@stage(stream_arg=None)
+def parse_csv_fast(source, name=None, table_name=None, row_events=False, rows: RowSelection = None,
+                   columns: ColumnSelection = None, encoding='utf-8', delimiter=',', quotechar='"',
+                   block_size=DEFAULT_BLOCK_SIZE, use_mmap=False):
+    """
+    Parses CSV from a binary file, or the file at a path, for large files. The file is read in blocks that are
+    decoded and split in one go, and lines without quotes are split with str.split rather than csv.reader. The
+    events are the same as those of parse_csv with the default dialect.
+
+    Only line breaks of \\n and \\r\\n, and encodings in which these are single bytes (such as UTF-8 and latin-1),
+    are supported.
+
+    :param source: A binary file, or a path
+    :param name: The name of the container
+    :param table_name: The name of the table. Defaults to name.
+    :param row_events: If True, emit a Row event with all the values of each row, rather than StartRow, a Cell
+                       for each value and EndRow. Default is False.
+    :param rows: The rows to read, as a range of row indexes or the number of rows from the start. Reading stops
+                 after the last row selected. Defaults to all rows.
+    :param columns: The indexes of the columns to read, in the order to emit them. Defaults to all columns. The
+                    values of Row events line up with columns, with '' for a column missing from a short row.
+    :param encoding: The encoding of the file. Default is utf-8.
+    :param delimiter:
+    :param quotechar:
+    :param block_size: The number of bytes to read at a time
+    :param use_mmap: If True, memory-map the file rather than reading it. The source must have a fileno.
+    :return:
+    """
+    records = _records(source, encoding, delimiter, quotechar, block_size, use_mmap)
+    return _emit(_indexed(records), name=name, table_name=table_name, row_events=row_events, rows=row_range(rows),
+                 columns=column_list(columns))
+
+
+class CsvFeedParser:
+    """
+    A CSV parser that is pushed the file a chunk of bytes at a time, for input that arrives in pieces, such as an
+    upload read from a queue. feed returns the events of the rows completed by each chunk, and close the rest.
+    The events are the same as those of parse_csv_fast, and only an incomplete record is held between chunks.
+
+        parser = CsvFeedParser(name="upload.csv")
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.close()
+
+    The arguments are those of parse_csv_fast.
+    """
+
+    def __init__(self, name=None, table_name=None, row_events=False, rows: RowSelection = None,
+                 columns: ColumnSelection = None, encoding='utf-8', delimiter=',', quotechar='"'):
+        self.name = name
+        self.table_name = table_name or name
+        self._row_events = row_events
+        self._rows = row_range(rows)
+        self._columns = column_list(columns)
+        self._encoding = encoding
+        self._delimiter = delimiter
+        self._quotechar = quotechar
+        self._pending = b''
+        self._row_ix = 0
+        self._started = False
+        self._closed = False
+        # True once the end of the file, or the last row selected, has been reached
+        self.done = False
+
+    def feed(self, data: bytes) -> List[ParseEvent]:
+        """ Parses the next chunk of the file, and returns the events of the rows it completes """
+        if self._closed:
+            raise ValueError("feed() called after close()")
+        events = self._start()
+        if self.done:
+            return events
+        block = self._pending + data if self._pending else data
+        cut = block.rfind(b'\n') + 1
+        if not cut:
+            self._pending = block
+            return events
+        records, rest = _collect(_split_records(block[:cut].decode(self._encoding), self._delimiter,
+                                                self._quotechar))
+        self._pending = rest.encode(self._encoding) + block[cut:] if rest else block[cut:]
+        events.extend(self._emit(records))
+        return events
+
+    def close(self) -> List[ParseEvent]:
+        """ Ends the file, and returns the events of its last row and the end of the table """
+        if self._closed:
+            return []
+        self._closed = True
+        events = self._start()
+        if self._pending and not self.done:
+            events.extend(self._emit(list(_split(self._pending.decode(self._encoding), self._delimiter,
+                                                 self._quotechar))))
+        self._pending = b''
+        self.done = True
+        events.append(EndTable(name=self.table_name))
+        events.append(EndContainer(name=self.name))
+        return events
+
+    def _start(self) -> List[ParseEvent]:
+        if self._started:
+            return []
+        self._started = True
+        return [StartContainer(name=self.name), StartTable(name=self.table_name)]
+
+    def _emit(self, records: List[List[str]]) -> List[ParseEvent]:
+        start = self._row_ix
+        self._row_ix += len(records)
+        rows = self._rows
+        if rows is not None and self._row_ix >= rows.stop:
+            self.done = True
+            self._pending = b''
+        indexed_records = select_rows(zip(range(start, self._row_ix), records), rows)
+        return list(_emit_rows(indexed_records, self._row_events, self._columns))
+
+
+async def parse_csv_async(source: ByteSource, name=None, table_name=None, row_events=False,
+                          rows: RowSelection = None, columns: ColumnSelection = None, encoding='utf-8',
+                          delimiter=',', quotechar='"', chunk_size=aio.DEFAULT_CHUNK_SIZE):
+    """
+    Parses CSV from an async byte source, such as an asyncio.StreamReader or an async iterable of chunks, with a
+    CsvFeedParser. The event loop gets a turn after each chunk. The other arguments are those of parse_csv_fast.
+
+        async for event in parse_csv_async(reader, name="upload.csv"):
+            ...
+
+    :param source: An object with an async read method, or an async iterable of bytes
+    :param chunk_size: The most bytes to parse between turns of the event loop
+    :return:
+    """
+    parser = CsvFeedParser(name=name, table_name=table_name, row_events=row_events, rows=rows, columns=columns,
+                           encoding=encoding, delimiter=delimiter, quotechar=quotechar)
+    async for chunk in aio.read_chunks(source, chunk_size):
+        for event in parser.feed(chunk):
+            yield event
+        if parser.done:
+            break
+        await asyncio.sleep(0)
+    for event in parser.close():
+        yield event
+
+
+DEFAULT_CHUNK_SIZE = 16 << 20
+
+RowFunction = Callable[[List[str]], Optional[List[str]]]
+
+
+def _ranges(path, chunk_size: int, quote: bytes, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Yields (start, end) byte ranges of about chunk_size bytes that are likely to each hold whole records. A range
+    ends at the first line break after chunk_size bytes where the number of quote characters since the start of
+    the range is even, which is outside quotes unless a quote in the middle of an unquoted field has left the count
+    odd. So if there is no such line break within block_size bytes, the range ends at the next line break. The
+    records are checked as they are parsed, and a record a range ends in the middle of is carried on into the next.
+    """
+    with open(path, 'rb') as f:
+        start = position = 0
+        while True:
+            target = start + chunk_size
+            odd = False
+            while position < target:
+                data = f.read(min(block_size, target - position))
+                if not data:
+                    if position > start:
+                        yield start, position
+                    return
+                odd ^= data.count(quote) % 2 == 1
+                position += len(data)
+
+            limit = position + block_size
+            while True:
+                line = f.readline()
+                if not line:
+                    yield start, position
+                    return
+                odd ^= line.count(quote) % 2 == 1
+                position += len(line)
+                if not odd or position >= limit:
+                    break
+
+            yield start, position
+            start = position
+
+
+def _parse_text(text: str, delimiter: str, quotechar: str, row_functions: Iterable[RowFunction], last=False):
+    """
+    Parses records, applying the row functions to each. Returns the rows, with None for those that a function
+    dropped, and the text of the last record if it is still in quotes at the end of the text, or ''. If last is
+    True, the text is the end of the file, and such a record is parsed as csv.reader would.
+    """
+    if last:
+        rows, rest = list(_split(text, delimiter, quotechar)), ''
+    else:
+        rows, rest = _collect(_split_records(text, delimiter, quotechar))
+    for function in row_functions:
+        rows = [None if row is None else function(row) for row in rows]
+    return rows, rest
+
+
+def _parse_range(path, start: int, end: int, encoding: str, delimiter: str, quotechar: str,
+                 row_functions: Iterable[RowFunction]):
+    """
+    Parses the records in a byte range, applying the row functions to each, as _parse_text does. Runs in a worker
+    process.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding)
+    return _parse_text(text, delimiter, quotechar, row_functions)
+
+
+def _parse_ranges(path, workers: int, max_in_flight: int, chunk_size: int, encoding: str, delimiter: str,
+                  quotechar: str, row_functions: Iterable[RowFunction]):
+    """ Yields (row_index, values) for every row kept, parsing the ranges in a pool of worker processes """
+    row_functions = tuple(row_functions)
+    args = (encoding, delimiter, quotechar, row_functions)
+    ranges = _ranges(path, chunk_size, quotechar.encode(encoding))
+
+    if workers == 1:
+        results = ((start, end, _parse_range(path, start, end, *args)) for start, end in ranges)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        in_flight = deque()
+
+        def _results():
+            for start, end in ranges:
+                in_flight.append((start, end, executor.submit(_parse_range, path, start, end, *args)))
+                if len(in_flight) >= max_in_flight:
+                    start, end, future = in_flight.popleft()
+                    yield start, end, future.result()
+            while in_flight:
+                start, end, future = in_flight.popleft()
+                yield start, end, future.result()
+        results = _results()
+
+    def _rows():
+        carried = ''
+        for start, end, (rows, rest) in results:
+            if carried:
+                # The range before ended in the middle of a record, so this one did not start at a record. Parse
+                # it again, carrying on from that record.
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    text = carried + f.read(end - start).decode(encoding)
+                rows, rest = _parse_text(text, delimiter, quotechar, row_functions)
+            carried = rest
+            yield rows
+        if carried:
+            # The file ends in quotes, so the last record is the rest of it
+            yield _parse_text(carried, delimiter, quotechar, row_functions, last=True)[0]
+
+    try:
+        row_ix = 0
+        for rows in _rows():
+            for values in rows:
+                if values is not None:
+                    yield row_ix, values
+                row_ix += 1
+    finally:
+        if executor is not None:
+            for *_, future in in_flight:
+                future.cancel()
+            executor.shutdown()
+
+
+@stage(stream_arg=None)
+def parse_csv_parallel(path, name=None, table_name=None, row_events=False, row_functions: Iterable[RowFunction] = (),
+                       workers: int = None, max_in_flight: int = None, chunk_size=DEFAULT_CHUNK_SIZE,
+                       encoding='utf-8', delimiter=',', quotechar='"'):
+    """
+    Parses a CSV file in parallel. The file is split into byte ranges of whole records, which are parsed in a
+    pool of worker processes, and the rows are merged back in order. The events are the same as those of
+    parse_csv_fast.
+
+    Row functions run in the workers too. Each takes the values of a row as a list of strings, and returns the
+    values to keep or None to drop the row. They must be picklable, so module-level functions rather than lambdas.
+    Dropped rows still count towards the row_index of the rows after them.
+
+    :param path: The path of the file
+    :param name: The name of the container
+    :param table_name: The name of the table. Defaults to name.
+    :param row_events: If True, emit a Row event for each row rather than StartRow, Cells and EndRow
+    :param row_functions: Functions applied to the values of each row in the workers
+    :param workers: The number of worker processes. Defaults to the number of CPUs. With 1 worker, the ranges are
+                    parsed in this process.
+    :param max_in_flight: The most ranges being parsed, or parsed and waiting to be emitted, at any time. This
+                          bounds the memory used to about max_in_flight * chunk_size. Defaults to twice the
+                          number of workers.
+    :param chunk_size: The approximate size of each range in bytes
+    :param encoding: The encoding of the file. Default is utf-8.
+    :param delimiter:
+    :param quotechar:
+    :return:
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    records = _parse_ranges(path, workers, max_in_flight, chunk_size, encoding, delimiter, quotechar, row_functions)
+    return _emit(records, name=name, table_name=table_name, row_events=row_events)
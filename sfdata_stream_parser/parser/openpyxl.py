@@ -1,46 +1,360 @@
+import io
+import os
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Optional, Union
+
 from openpyxl import load_workbook
+from openpyxl.utils.cell import get_column_letter
 from openpyxl.worksheet._read_only import ReadOnlyWorksheet
 from openpyxl.worksheet.worksheet import Worksheet
 
 from sfdata_stream_parser import events
+from sfdata_stream_parser.parser.selection import RowSelection, ColumnSelection, row_range, column_list
+from sfdata_stream_parser.profiling import stage
+
+
+EXCEL_TYPE = 'excel_type'
+EXCEL_LOCATION = 'excel_location'
+EXCEL_NUMBER_FORMAT = 'excel_number_format'
+METADATA_FIELDS = (EXCEL_TYPE, EXCEL_LOCATION, EXCEL_NUMBER_FORMAT)
+
+_CELL_ATTRIBUTES = {EXCEL_TYPE: 'data_type', EXCEL_LOCATION: 'coordinate', EXCEL_NUMBER_FORMAT: 'number_format'}
 
 
-def _parse_sheet(source: Worksheet):
+def _parse_sheet(source: Worksheet, metadata=METADATA_FIELDS, trim=False, rows: Optional[range] = None,
+                 columns: Optional[list] = None):
     yield events.StartTable(name=source.title, type="worksheet")
-    for row_ix, row in enumerate(source.rows):
-        yield events.StartRow(row_index=row_ix)
-        for col_ix, cell in enumerate(row):
-            props = dict(value=cell.value, column_index=col_ix)
-            props['excel_type'] = getattr(cell, 'data_type', None)
-            props['excel_location'] = getattr(cell, 'coordinate', None)
-            props['excel_number_format'] = getattr(cell, 'number_format', None)
-            yield events.Cell(**props)
-        yield events.EndRow()
+    if rows is not None and not rows:
+        # openpyxl takes a max_row of 0 as no bound at all, so an empty selection never reaches iter_rows
+        yield events.EndTable()
+        return
+    if trim and isinstance(source, ReadOnlyWorksheet):
+        # Read the rows that are in the file, rather than padding them to the declared dimensions
+        source.reset_dimensions()
+
+    # Let openpyxl skip the rows and columns outside the selection, and stop reading after its last row. A Worksheet
+    # creates the cells it is asked for, growing the caller's sheet, so it is only asked for those it has.
+    in_memory = isinstance(source, Worksheet)
+    bounds = {}
+    first_row = 0
+    if rows is not None:
+        first_row = rows.start
+        bounds.update(min_row=rows.start + 1, max_row=min(rows.stop, source.max_row) if in_memory else rows.stop)
+    if columns is not None:
+        if in_memory:
+            columns = [column for column in columns if column < source.max_column]
+        first_column = min(columns, default=0)
+        bounds.update(min_col=first_column + 1, max_col=max(columns, default=0) + 1)
+        offsets = [column - first_column for column in columns]
+
+    values_only = not metadata or set(metadata) == {EXCEL_LOCATION}
+    if bounds.get('min_row', 1) > bounds.get('max_row', 1):
+        # The selection starts after the last row of the sheet
+        sheet_rows = iter(())
+    else:
+        sheet_rows = enumerate(source.iter_rows(values_only=values_only, **bounds), start=first_row)
+    if rows is not None and rows.step != 1:
+        sheet_rows = ((row_ix, row) for row_ix, row in sheet_rows if row_ix in rows)
+    if columns is not None:
+        sheet_rows = ((row_ix, [row[offset] for offset in offsets]) for row_ix, row in sheet_rows)
+    if trim:
+        empty = _is_none if values_only else _is_empty_cell
+        sheet_rows = ((row_ix, _trimmed(row, empty)) for row_ix, row in sheet_rows)
+
+    if values_only:
+        cell_rows = _value_rows(sheet_rows, columns, EXCEL_LOCATION in metadata)
+    else:
+        cell_rows = _cell_rows(sheet_rows, columns, metadata)
+
+    start_row, end_row = events.StartRow._make, events.EndRow
+    last_ix = first_row - 1
+    for row_ix, row in cell_rows:
+        if trim:
+            if not row:
+                # Blank rows are emitted once there is a row with data after them
+                continue
+            for blank_ix in range(last_ix + 1, row_ix):
+                if rows is None or blank_ix in rows:
+                    yield start_row(blank_ix)
+                    yield end_row()
+            last_ix = row_ix
+
+        yield start_row(row_ix)
+        yield from row
+        yield end_row()
     yield events.EndTable()
 
 
-def parse_sheets(source, container_name=None):
+def _trimmed(values, empty):
+    """ The values of a row without the trailing values that are empty """
+    end = len(values)
+    while end and empty(values[end - 1]):
+        end -= 1
+    return values[:end] if end < len(values) else values
+
+
+def _is_none(value):
+    return value is None
+
+
+def _is_empty_cell(cell):
+    return cell.value is None
+
+
+def _with_columns(row, columns: Optional[list]):
+    """ Pairs the items of a row with their column indexes """
+    return enumerate(row) if columns is None else zip(columns, row)
+
+
+def _cell_rows(sheet_rows, columns: Optional[list], metadata):
+    """ Yields the Cell events of each row, with the metadata fields read from openpyxl's cells """
+    attributes = [(field, _CELL_ATTRIBUTES[field]) for field in metadata]
+    make_cell = events.Cell
+    for row_ix, row in sheet_rows:
+        yield row_ix, [
+            make_cell(value=cell.value, column_index=col_ix,
+                      **{field: getattr(cell, attribute, None) for field, attribute in attributes})
+            for col_ix, cell in _with_columns(row, columns)
+        ]
+
+
+def _value_rows(sheet_rows, columns: Optional[list], location: bool):
+    """
+    Yields the Cell events of each row read with values_only, which skips creating openpyxl's cells. If asked
+    for, the location is worked out from the row and column indexes, and is given for the empty cells that pad the
+    rows too.
+    """
+    if not location:
+        make_cell = events.Cell._make
+        for row_ix, values in sheet_rows:
+            yield row_ix, [make_cell(value, col_ix) for col_ix, value in _with_columns(values, columns)]
+        return
+
+    make_cell = events.Cell
+    letters = []
+    for row_ix, values in sheet_rows:
+        width = len(values) if columns is None else max(columns, default=-1) + 1
+        while len(letters) < width:
+            letters.append(get_column_letter(len(letters) + 1))
+        row_number = row_ix + 1
+        yield row_ix, [make_cell(value=value, column_index=col_ix, excel_location=f'{letters[col_ix]}{row_number}')
+                       for col_ix, value in _with_columns(values, columns)]
+
+
+@stage(stream_arg=None)
+def parse_sheets(source, container_name=None, metadata: Iterable[str] = METADATA_FIELDS, trim=False,
+                 sheets: Iterable[Union[str, int]] = None, rows: RowSelection = None,
+                 columns: ColumnSelection = None):
+    """
+    Parses the worksheets of a workbook, a worksheet, or a list of worksheets.
+
+    :param source: A workbook, a worksheet or a list of them, or the path of a workbook or a binary file holding it
+    :param container_name: The name of the container. Defaults to the path or file name.
+    :param metadata: The metadata fields to set on each Cell, from METADATA_FIELDS. Defaults to all of them. With
+                     none, or only EXCEL_LOCATION, the sheets are read with values_only, which skips reading the cell
+                     objects but is only slightly faster, as most of the time goes on parsing the sheet's XML.
+    :param trim: If True, ignore the dimensions declared by each sheet, and drop the empty cells at the end of each
+                 row and the empty rows at the end of each table. Blank rows followed by data are kept. Use this for
+                 workbooks that declare far more rows or columns than they hold, or that have formatted empty cells.
+    :param sheets: The names or indexes of the sheets of a workbook to parse, in the order to emit them. Defaults to
+                   all sheets. A workbook opened from a path or file is closed once they have been read.
+    :param rows: The rows to read from each sheet, as a range of row indexes or the number of rows from the start.
+                 Reading a sheet stops after the last row selected. Defaults to all rows.
+    :param columns: The indexes of the columns to read, in the order to emit them. Cells keep the column_index of
+                    their column in the sheet. Defaults to all columns. For a workbook already in memory, the
+                    rows and columns past the end of a sheet are left out, rather than created in the sheet.
+    :return:
+    """
+    metadata = tuple(metadata)
+    unknown = set(metadata) - set(METADATA_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown metadata fields: {sorted(unknown)!r}")
+    if sheets is not None:
+        sheets = list(sheets)
+    return _parse_sheets(source, container_name=container_name, sheets=sheets, metadata=metadata, trim=trim,
+                         rows=row_range(rows), columns=column_list(columns))
+
+
+def _select_sheets(workbook, sheets: Optional[list]) -> list:
+    if sheets is None:
+        return workbook.worksheets
+    worksheets = workbook.worksheets
+    return [worksheets[sheet] if isinstance(sheet, int) else workbook[sheet] for sheet in sheets]
+
+
+def _parse_sheets(source, container_name=None, sheets=None, **options):
     if hasattr(source, 'worksheets'):
         yield events.StartContainer(name=container_name)
-        yield from parse_sheets(source.worksheets, container_name=container_name)
+        yield from _parse_sheets(_select_sheets(source, sheets), container_name=container_name, **options)
         yield events.EndContainer()
 
     elif isinstance(source, list):
         for sheet in source:
-            yield from parse_sheets(sheet, container_name=container_name)
+            yield from _parse_sheets(sheet, container_name=container_name, **options)
 
-    elif isinstance(source, str):
-        if container_name is None:
-            container_name = source
-        yield from parse_sheets(load_workbook(filename=source, read_only=True, data_only=True),
-                                container_name=container_name)
+    elif isinstance(source, str) or hasattr(source, 'read'):
+        if isinstance(source, str):
+            if container_name is None:
+                container_name = source
+            workbook = load_workbook(filename=source, read_only=True, data_only=True)
+        else:
+            if container_name is None and hasattr(source, 'name'):
+                container_name = source.name
+            workbook = load_workbook(source, read_only=True, data_only=True)
 
+        yield events.StartContainer(name=container_name)
+        try:
+            yield from _parse_sheets(_select_sheets(workbook, sheets), container_name=container_name, **options)
+        finally:
+            workbook.close()
+        yield events.EndContainer()
+
+    elif isinstance(source, (Worksheet, ReadOnlyWorksheet)):
+        yield from _parse_sheet(source, **options)
+
+
+ORDER_SHEETS = 'sheets'
+ORDER_COMPLETED = 'completed'
+
+
+def _read_sheet(source, sheet: str):
+    """
+    Reads a worksheet into plain tuples of (value, data_type, coordinate, number_format) for each cell, which are
+    much cheaper to send back from a worker process than events. Runs in a worker process.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = [
+            [(cell.value, getattr(cell, 'data_type', None), getattr(cell, 'coordinate', None),
+              getattr(cell, 'number_format', None)) for cell in row]
+            for row in workbook[sheet].rows
+        ]
+    finally:
+        workbook.close()
+    return sheet, rows
+
+
+def _emit_sheet(title: str, rows: list):
+    """ Emits the same events as _parse_sheet for a sheet read by _read_sheet """
+    yield events.StartTable(name=title, type="worksheet")
+    for row_ix, row in enumerate(rows):
+        yield events.StartRow(row_index=row_ix)
+        for col_ix, (value, data_type, coordinate, number_format) in enumerate(row):
+            yield events.Cell(value=value, column_index=col_ix, excel_type=data_type, excel_location=coordinate,
+                              excel_number_format=number_format)
+        yield events.EndRow()
+    yield events.EndTable()
+
+
+@contextmanager
+def _workbook_path(source):
+    """
+    The path of the workbook, for the workers to load it from, rather than sending each of them all of its bytes
+    with every sheet. Bytes are written to a temporary file, which is removed afterwards.
+    """
+    if not isinstance(source, bytes):
+        yield source
+        return
+    handle, path = tempfile.mkstemp(suffix='.xlsx')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(source)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _read_sheets(source, sheets: list, workers: int, max_in_flight: int, order: str):
+    """ Yields the results of _read_sheet for each sheet, reading them in a pool of worker processes """
+    if workers == 1:
+        for sheet in sheets:
+            yield _read_sheet(source, sheet)
+        return
+
+    with _workbook_path(source) as path:
+        yield from _read_sheets_in_pool(path, sheets, workers, max_in_flight, order)
+
+
+def _read_sheets_in_pool(source, sheets: list, workers: int, max_in_flight: int, order: str):
+    executor = ProcessPoolExecutor(max_workers=workers)
+    in_flight = deque()
+    pending = iter(sheets)
+    try:
+        for sheet in pending:
+            in_flight.append(executor.submit(_read_sheet, source, sheet))
+            if len(in_flight) >= max_in_flight:
+                break
+
+        while in_flight:
+            if order == ORDER_SHEETS:
+                done = [in_flight.popleft()]
+            else:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                done = [future for future in in_flight if future in finished]
+                for future in done:
+                    in_flight.remove(future)
+            for future in done:
+                sheet = next(pending, None)
+                if sheet is not None:
+                    in_flight.append(executor.submit(_read_sheet, source, sheet))
+                yield future.result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown()
+
+
+@stage(stream_arg=None)
+def parse_sheets_parallel(source, container_name=None, sheets: Iterable[Union[str, int]] = None,
+                          workers: int = None, max_in_flight: int = None, order: str = ORDER_SHEETS):
+    """
+    Parses the worksheets of a workbook in a pool of worker processes, each of which loads the workbook and reads
+    one sheet at a time. The workers are given the path of the workbook, and a workbook read from a binary file or
+    bytes is written to a temporary file for them. The events are the same as those of parse_sheets, apart from the
+    order of the tables if order is ORDER_COMPLETED.
+
+    :param source: The path of the workbook, or a binary file or bytes holding it
+    :param container_name: The name of the container. Defaults to the path or file name.
+    :param sheets: The names or indexes of the sheets to parse. Defaults to all sheets.
+    :param workers: The number of worker processes. Defaults to the number of CPUs. With 1 worker, the sheets are
+                    read in this process.
+    :param max_in_flight: The most sheets being read, or read and waiting to be emitted, at any time. Defaults to
+                          twice the number of workers.
+    :param order: ORDER_SHEETS to emit the tables in workbook order, or ORDER_COMPLETED to emit each table as soon
+                  as its sheet has been read
+    :return:
+    """
+    if order not in (ORDER_SHEETS, ORDER_COMPLETED):
+        raise ValueError(f"Unknown order: {order!r}")
+
+    if isinstance(source, (str, os.PathLike)):
+        if container_name is None:
+            container_name = str(source)
     elif hasattr(source, 'read'):
         if container_name is None and hasattr(source, 'name'):
             container_name = source.name
-        yield from parse_sheets(load_workbook(source, read_only=True, data_only=True),
-                                container_name=container_name)
+        source = source.read()
+
+    workbook = load_workbook(io.BytesIO(source) if isinstance(source, bytes) else source, read_only=True)
+    sheet_names = workbook.sheetnames
+    workbook.close()
+    if sheets is None:
+        sheets = sheet_names
+    else:
+        sheets = [sheet_names[sheet] if isinstance(sheet, int) else sheet for sheet in sheets]
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    return _emit_workbook(_read_sheets(source, sheets, workers, max_in_flight, order), container_name)
 
-    elif isinstance(source, (Worksheet, ReadOnlyWorksheet)):
-        yield from _parse_sheet(source)
 
+def _emit_workbook(sheets, container_name):
+    yield events.StartContainer(name=container_name)
+    for title, rows in sheets:
+        yield from _emit_sheet(title, rows)
+    yield events.EndContainer()
@@ -0,0 +1,60 @@
+"""
+Helpers for the row and column selections that parsers accept, so that rows and columns that are not wanted are
+skipped before any events are created for them.
+"""
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, TypeVar, Union
+
+RowSelection = Union[int, range]
+ColumnSelection = Sequence[int]
+
+T = TypeVar('T')
+
+
+def row_range(rows: Optional[RowSelection]) -> Optional[range]:
+    """
+    Returns the row indexes selected by rows, which is either a range, or the number of rows to read from the
+    start. None selects every row.
+    """
+    if rows is None:
+        return None
+    if isinstance(rows, bool) or not isinstance(rows, (int, range)):
+        raise TypeError(f"rows must be an int or a range, not {type(rows).__name__}")
+    if isinstance(rows, int):
+        if rows < 0:
+            raise ValueError(f"rows must not be negative: {rows}")
+        return range(rows)
+    if rows.start < 0 or rows.step < 1:
+        raise ValueError(f"rows must be an increasing range of row indexes: {rows!r}")
+    return rows
+
+
+def column_list(columns: Optional[ColumnSelection]) -> Optional[list]:
+    """ Returns the column indexes selected by columns as a list, or None to select every column """
+    if columns is None:
+        return None
+    columns = list(columns)
+    if any(column < 0 for column in columns):
+        raise ValueError(f"column indexes must not be negative: {columns}")
+    return columns
+
+
+def select_rows(indexed_records: Iterable[Tuple[int, T]], rows: Optional[range]) -> Iterator[Tuple[int, T]]:
+    """
+    Yields the (row_index, record) pairs whose row_index is in rows. Once past the last row selected, the records
+    are closed, if they can be, without reading any further.
+    """
+    if rows is None:
+        yield from indexed_records
+        return
+
+    stop = rows.stop
+    try:
+        for row_ix, record in indexed_records:
+            if row_ix >= stop:
+                return
+            if row_ix in rows:
+                yield row_ix, record
+    finally:
+        close = getattr(indexed_records, 'close', None)
+        if close is not None:
+            close()
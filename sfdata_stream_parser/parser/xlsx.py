@@ -0,0 +1,287 @@
+"""
+A streaming XLSX reader that parses the worksheet XML straight out of the zip file, rather than going through
+openpyxl's cell objects. Shared strings and cell styles are read up front into lists indexed the same way as
+the workbook, so each cell only needs a couple of lookups.
+
+The events are the same as those of parser.openpyxl.parse_sheets on a read-only, data-only workbook. openpyxl's
+number format and date helpers are used to interpret the values, so this needs the openpyxl extra as well.
+"""
+import os
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string, get_column_letter, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+
+try:
+    from openpyxl.styles.numbers import is_timedelta_format
+except ImportError:  # openpyxl < 3.1 does not read durations
+    def is_timedelta_format(fmt):
+        return False
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.profiling import stage
+
+_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_ROW = f'{_MAIN}row'
+_CELL = f'{_MAIN}c'
+_VALUE = f'{_MAIN}v'
+_TEXT = f'{_MAIN}t'
+_RICH_RUN = f'{_MAIN}r'
+_INLINE_STRING = f'{_MAIN}is'
+_DIMENSION = f'{_MAIN}dimension'
+_SHEET_DATA = f'{_MAIN}sheetData'
+
+
+def _text_content(element) -> str:
+    """ The text of a shared or inline string, without its formatting """
+    snippets = []
+    text = element.find(_TEXT)
+    if text is not None and text.text is not None:
+        snippets.append(text.text)
+    for run in element.iterfind(_RICH_RUN):
+        text = run.find(_TEXT)
+        if text is not None and text.text is not None:
+            snippets.append(text.text)
+    return ''.join(snippets)
+
+
+class _Workbook:
+    """ The parts of a workbook we need to read its sheets: the sheet paths, shared strings and cell styles """
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self.archive = archive
+
+        relationships = {}
+        with archive.open('xl/_rels/workbook.xml.rels') as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{_PKG_REL}Relationship':
+                    target = element.get('Target')
+                    if target.startswith('/'):
+                        target = target[1:]
+                    else:
+                        target = posixpath.normpath(posixpath.join('xl', target))
+                    relationships[element.get('Id')] = (element.get('Type').rsplit('/', 1)[-1], target)
+
+        self.epoch = CALENDAR_WINDOWS_1900
+        self.sheets = []
+        with archive.open('xl/workbook.xml') as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{_MAIN}workbookPr':
+                    if element.get('date1904') in ('1', 'true'):
+                        self.epoch = CALENDAR_MAC_1904
+                elif element.tag == f'{_MAIN}sheet':
+                    rel_type, target = relationships[element.get(f'{_REL}id')]
+                    if rel_type == 'worksheet':
+                        self.sheets.append((element.get('name'), target))
+
+        paths = {rel_type: target for rel_type, target in relationships.values()}
+        self.shared_strings = self._read_shared_strings(paths.get('sharedStrings'))
+        self.number_formats, self.date_styles, self.timedelta_styles = self._read_styles(paths.get('styles'))
+
+    def _read_shared_strings(self, path) -> list:
+        strings = []
+        if path is None:
+            return strings
+        with self.archive.open(path) as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{_MAIN}si':
+                    strings.append(_text_content(element).replace('x005F_', ''))
+                    element.clear()
+        return strings
+
+    def _read_styles(self, path):
+        """ Returns the number format of each cell style, and the sets of styles that hold dates and durations """
+        custom_formats = {}
+        number_formats = []
+        if path is not None:
+            with self.archive.open(path) as f:
+                for _, element in iterparse(f):
+                    if element.tag == f'{_MAIN}numFmt':
+                        custom_formats[int(element.get('numFmtId'))] = element.get('formatCode')
+                    elif element.tag == f'{_MAIN}cellXfs':
+                        for xf in element.iterfind(f'{_MAIN}xf'):
+                            number_formats.append(int(xf.get('numFmtId', 0)))
+
+        formats = []
+        date_styles = set()
+        timedelta_styles = set()
+        for style_id, format_id in enumerate(number_formats):
+            fmt = custom_formats.get(format_id) or BUILTIN_FORMATS.get(format_id, 'General')
+            formats.append(fmt)
+            if is_date_format(fmt):
+                date_styles.add(style_id)
+            if is_timedelta_format(fmt):
+                timedelta_styles.add(style_id)
+        return formats or ['General'], date_styles, timedelta_styles
+
+
+class _SheetReader:
+    """
+    Reads the rows of one worksheet as lists of (value, data_type, coordinate, number_format) tuples, padded the
+    same way as openpyxl's read-only worksheets: rows start at column A and are as wide as the sheet's dimension,
+    missing rows and cells are filled with empty cells, and rows beyond the dimension are not read.
+    """
+    EMPTY = (None, 'n', None, None)
+
+    def __init__(self, workbook: _Workbook, path: str):
+        self.workbook = workbook
+        self.path = path
+        self._columns = {}
+        self._letters = [None]
+
+    def _column(self, letters: str) -> int:
+        column = self._columns.get(letters)
+        if column is None:
+            column = self._columns[letters] = column_index_from_string(letters)
+        return column
+
+    def _letter(self, column: int) -> str:
+        letters = self._letters
+        while len(letters) <= column:
+            letters.append(get_column_letter(len(letters)))
+        return letters[column]
+
+    def _cell(self, element, row: int, column: int):
+        workbook = self.workbook
+        data_type = element.get('t', 'n')
+        style_id = element.get('s')
+        style_id = int(style_id) if style_id else 0
+
+        value = None
+        if data_type == 'inlineStr':
+            inline = element.find(_INLINE_STRING)
+            if inline is not None:
+                data_type = 's'
+                value = _text_content(inline)
+        else:
+            value_element = element.find(_VALUE)
+            value = value_element.text if value_element is not None else None
+            if not value:
+                value = None
+            elif data_type == 'n':
+                value = float(value) if '.' in value or 'E' in value or 'e' in value else int(value)
+                if style_id in workbook.date_styles:
+                    data_type = 'd'
+                    try:
+                        if style_id in workbook.timedelta_styles:
+                            value = from_excel(value, workbook.epoch, timedelta=True)
+                        else:
+                            value = from_excel(value, workbook.epoch)
+                    except (OverflowError, ValueError):
+                        data_type = 'e'
+                        value = '#VALUE!'
+            elif data_type == 's':
+                value = workbook.shared_strings[int(value)]
+            elif data_type == 'b':
+                value = bool(int(value))
+            elif data_type == 'str':
+                data_type = 's'
+            elif data_type == 'd':
+                value = from_ISO8601(value)
+
+        number_formats = workbook.number_formats
+        number_format = number_formats[style_id] if style_id < len(number_formats) else 'General'
+        return value, data_type, f'{self._letter(column)}{row}', number_format
+
+    def rows(self):
+        max_column = max_row = None
+        row_counter = 0
+        expected_row = 1
+        empty_row = []
+        sheet_data = None
+
+        with self.workbook.archive.open(self.path) as f:
+            for event, element in iterparse(f, events=('start', 'end')):
+                tag = element.tag
+                if event == 'start':
+                    if tag == _SHEET_DATA:
+                        sheet_data = element
+                    continue
+
+                if tag == _DIMENSION and sheet_data is None:
+                    _, _, max_column, max_row = range_boundaries(element.get('ref'))
+                    if max_column is not None:
+                        empty_row = [self.EMPTY] * max_column
+                elif tag == _ROW:
+                    row_number = element.get('r')
+                    row_counter = int(float(row_number)) if row_number else row_counter + 1
+                    if max_row is not None and row_counter > max_row:
+                        break
+
+                    while expected_row < row_counter:
+                        expected_row += 1
+                        yield empty_row
+                    if expected_row == row_counter:
+                        expected_row += 1
+                        yield self._row(element, row_counter, max_column)
+
+                    # Drop the rows we have read, so memory use does not grow with the size of the sheet
+                    sheet_data.clear()
+
+    def _row(self, element, row_number: int, max_column):
+        cells = []
+        column = 0
+        for cell in element.iterfind(_CELL):
+            coordinate = cell.get('r')
+            if coordinate:
+                letters = coordinate.rstrip('0123456789')
+                column = self._column(letters)
+                cell_row = int(coordinate[len(letters):])
+            else:
+                column += 1
+                cell_row = row_number
+            cells.append((column, cell, cell_row))
+
+        if not cells and not max_column:
+            return []
+
+        width = max_column or cells[-1][0]
+        row = [self.EMPTY] * width
+        for column, cell, cell_row in cells:
+            if 1 <= column <= width:
+                row[column - 1] = self._cell(cell, cell_row, column)
+        return row
+
+
+def _emit_sheet(title: str, rows):
+    make_cell = events.Cell
+    yield events.StartTable(name=title, type="worksheet")
+    for row_ix, row in enumerate(rows):
+        yield events.StartRow(row_index=row_ix)
+        for col_ix, (value, data_type, coordinate, number_format) in enumerate(row):
+            yield make_cell(value=value, column_index=col_ix, excel_type=data_type, excel_location=coordinate,
+                            excel_number_format=number_format)
+        yield events.EndRow()
+    yield events.EndTable()
+
+
+@stage(stream_arg=None)
+def parse_xlsx(source, container_name=None):
+    """
+    Parses all the worksheets of an XLSX workbook.
+
+    :param source: The path of the workbook, or a binary file holding it
+    :param container_name: The name of the container. Defaults to the path or file name.
+    :return:
+    """
+    if container_name is None:
+        if isinstance(source, (str, os.PathLike)):
+            container_name = str(source)
+        elif hasattr(source, 'name'):
+            container_name = source.name
+    return _parse_xlsx(source, container_name)
+
+
+def _parse_xlsx(source, container_name):
+    with zipfile.ZipFile(source) as archive:
+        workbook = _Workbook(archive)
+        yield events.StartContainer(name=container_name)
+        for title, path in workbook.sheets:
+            yield from _emit_sheet(title, _SheetReader(workbook, path).rows())
+        yield events.EndContainer()
@@ -1,5 +1,16 @@
-from sfdata_stream_parser.events import StartElement, EndElement, TextNode, CommentNode, ProcessingInstructionNode
+import asyncio
+import itertools
+import os
+from typing import Iterable, List, Optional, Tuple, Union
 from xml.dom import pulldom
+from xml.parsers import expat
+
+from sfdata_stream_parser import aio
+from sfdata_stream_parser.aio import ByteSource
+from sfdata_stream_parser.events import StartElement, EndElement, TextNode, CommentNode, ProcessingInstructionNode
+from sfdata_stream_parser.events import XmlEvent
+from sfdata_stream_parser.parser.selection import RowSelection, row_range
+from sfdata_stream_parser.profiling import stage
 
 
 def _coalesce_text_nodes(event_stream):
@@ -19,18 +30,61 @@ def _coalesce_text_nodes(event_stream):
     assert last_event is None, "Last event was not emitted"
 
 
-def parse(source, coalesce=True, element_id=False, attach_node=False, **kwargs):
+ENGINE_EXPAT = 'expat'
+ENGINE_PULLDOM = 'pulldom'
+
+DEFAULT_BUFSIZE = 1 << 16
+
+
+@stage(name='xml.parse', stream_arg=None)
+def parse(source, coalesce=True, element_id=False, attach_node=False, rows: RowSelection = None,
+          paths: Iterable[str] = None, ancestors=False, engine: str = None, comments=False, **kwargs):
     """
-    Parses an XML document from a file-like object.
+    Parses an XML document from a file-like object, or the file at a path.
+
+    By default the document is read with expat, which creates the events straight from the parser's callbacks, so
+    memory use does not grow with the size of the document. The pulldom engine builds a DOM node for each element,
+    and is only used for attach_node, or if a parser is passed on to pulldom.
 
-    NOTE: Comment nodes are currently not emitted
     :param source:
     :param coalesce: If True, coalesce adjacent text nodes into a single node. Default is True.
-    :param element_id: If True, attach the source node's identity to the element node. Default is False.
-    :param attach_node: If True, attach the node to the event. Default is False.
-    :param kwargs:
+    :param element_id: If True, attach an identity to each element node that is the same for its start and end
+                       events. Default is False.
+    :param attach_node: If True, attach the node to the event. Default is False. Needs the pulldom engine.
+    :param rows: The child elements of the root element to read, such as the records of a data file, as a range of
+                 their indexes or the number to read from the start. No events are created for the others, and
+                 the document is not read any further after the last one selected, apart from closing the root
+                 element. Defaults to all of them.
+    :param paths: Paths of the elements to read, such as /Message/Children/Child. Events are only emitted for
+                  these elements and everything inside them, and the parser skips the rest without creating
+                  events. A path starting with / is matched from the root element, and any other path against
+                  the end of an element's path, so Child/Episodes matches every Episodes element in a Child. A *
+                  matches any one element. Defaults to the whole document. Needs the expat engine.
+    :param ancestors: If True, also emit the StartElement and EndElement, but nothing else, of the elements that
+                      could contain a match of paths. With relative paths, that is every element outside a match.
+                      Default is False.
+    :param engine: ENGINE_EXPAT or ENGINE_PULLDOM. Defaults to expat, unless attach_node or a parser is given.
+    :param comments: If True, emit CommentNodes. Default is False. Needs the expat engine.
+    :param kwargs: bufsize, the number of characters to read at a time, and for the pulldom engine parser, a SAX
+                   parser to use
     :return:
     """
+    if engine is None:
+        engine = ENGINE_PULLDOM if attach_node or 'parser' in kwargs else ENGINE_EXPAT
+    if engine == ENGINE_EXPAT:
+        if attach_node:
+            raise ValueError("attach_node needs the pulldom engine, as there are no nodes to attach")
+        unknown = set(kwargs) - {'bufsize'}
+        if unknown:
+            raise TypeError(f"Unexpected arguments for the expat engine: {sorted(unknown)!r}")
+        return _ExpatEvents(source, bufsize=kwargs.get('bufsize') or DEFAULT_BUFSIZE, coalesce=coalesce,
+                            element_id=element_id, rows=rows, paths=paths, ancestors=ancestors, comments=comments)
+    if engine != ENGINE_PULLDOM:
+        raise ValueError(f"Unknown engine: {engine!r}")
+    if comments:
+        raise ValueError("comments needs the expat engine")
+    if paths is not None:
+        raise ValueError("paths needs the expat engine")
 
     def _add_extras(node):
         extras = {}
@@ -62,7 +116,429 @@ def parse(source, coalesce=True, element_id=False, attach_node=False, **kwargs):
                 raise ValueError('Unknown event: %s' % event)
 
     event_stream = pulldom.parse(source, **kwargs)
-    event_stream = _generator(event_stream)
+    rows = row_range(rows)
+    if rows is None:
+        event_stream = _generator(event_stream)
+    else:
+        event_stream = _generator(_select_children(event_stream, rows, close=isinstance(source, str)))
     if coalesce:
         event_stream = _coalesce_text_nodes(event_stream)
     return event_stream
+
+
+class _PathMatcher:
+    """
+    Matches element paths against a set of path patterns, one element at a time. The patterns are held in a trie
+    of their steps. The state at an element is the set of trie nodes reached by its path, and the transitions
+    between states are cached by tag, so after the first few elements each one costs a single dict lookup.
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        self._children = [{}, {}]
+        self._terminal = [False, False]
+        relative = False
+        for path in paths:
+            if path.startswith('/'):
+                node, steps = 0, path[1:].split('/')
+            else:
+                node, steps = 1, path.split('/')
+                relative = True
+            if not all(steps):
+                raise ValueError(f"Invalid path: {path!r}")
+            for step in steps:
+                children = self._children[node]
+                if step not in children:
+                    children[step] = len(self._children)
+                    self._children.append({})
+                    self._terminal.append(False)
+                node = children[step]
+            self._terminal[node] = True
+
+        # Relative paths can start below any element, so their root is in every state
+        self._anywhere = frozenset((1,)) if relative else frozenset()
+        self._states = {}
+        self._state_nodes = []
+        self._transitions = []
+        self.start = self._state(frozenset((0,)) | self._anywhere)
+
+    def _state(self, nodes: frozenset) -> int:
+        state = self._states.get(nodes)
+        if state is None:
+            state = self._states[nodes] = len(self._state_nodes)
+            self._state_nodes.append(nodes)
+            self._transitions.append({})
+        return state
+
+    def transition(self, state: int, tag: str) -> Tuple[Optional[int], bool]:
+        """
+        Returns the state at a child element with tag, or None if no path can match it or anything below it, and
+        whether a path matches it
+        """
+        transitions = self._transitions[state]
+        result = transitions.get(tag)
+        if result is None:
+            nodes = set()
+            for node in self._state_nodes[state]:
+                children = self._children[node]
+                for step in (tag, '*'):
+                    child = children.get(step)
+                    if child is not None:
+                        nodes.add(child)
+            matched = any(self._terminal[node] for node in nodes)
+            nodes = frozenset(nodes) | self._anywhere
+            has_children = any(self._children[node] for node in nodes)
+            result = transitions[tag] = (self._state(nodes) if has_children else None, matched)
+        return result
+
+
+class _StopParsing(Exception):
+    """ Raised by a handler to stop expat part way through a buffer """
+
+
+class XmlFeedParser:
+    """
+    An XML parser that is pushed the document a chunk at a time, for input that arrives in pieces, such as an
+    upload read from a queue. feed returns the events completed by each chunk, and close the rest. The events are
+    the same as those of parse with the expat engine, and only the events of one chunk are held at a time.
+
+        parser = XmlFeedParser(paths=['/Message/Children/Child'])
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.close()
+
+    The arguments are those of parse.
+    """
+
+    def __init__(self, coalesce=True, element_id=False, rows: RowSelection = None, paths: Iterable[str] = None,
+                 ancestors=False, comments=False):
+        self._parser, self._output, self._stopped, self._skip = _expat_parser(
+            coalesce=coalesce, element_id=element_id, comments=comments, rows=row_range(rows),
+            paths=None if paths is None else list(paths), ancestors=ancestors)
+        self._closed = False
+        # True once the document has been read to the end, or past the last row selected
+        self.done = False
+
+    def feed(self, data: Union[bytes, str]) -> List[XmlEvent]:
+        """ Parses the next chunk of the document, and returns the events it completes """
+        if self._closed:
+            raise ValueError("feed() called after close()")
+        return self._parse(data, False)
+
+    def close(self) -> List[XmlEvent]:
+        """ Ends the document, and returns the remaining events. Raises an ExpatError if it is incomplete. """
+        if self._closed:
+            return []
+        self._closed = True
+        return self._parse(b'', True)
+
+    def skip_open_elements(self, count: int):
+        """
+        Skips the rest of the innermost count elements that were started in the events returned so far, but not
+        yet ended. No events are created for anything in them, including their EndElements.
+        """
+        if count > 0:
+            self._skip(count)
+
+    def _parse(self, data, final: bool) -> List[XmlEvent]:
+        if self.done:
+            return []
+        output = self._output
+        try:
+            self._parser.Parse(data, final)
+        except _StopParsing:
+            output.extend(self._stopped())
+            final = True
+        self.done = final
+        events = output[:]
+        output.clear()
+        return events
+
+
+async def parse_async(source: ByteSource, coalesce=True, element_id=False, rows: RowSelection = None,
+                      paths: Iterable[str] = None, ancestors=False, comments=False, chunk_size=aio.DEFAULT_CHUNK_SIZE):
+    """
+    Parses an XML document from an async byte source, such as an asyncio.StreamReader or an async iterable of
+    chunks, with an XmlFeedParser. The event loop gets a turn after each chunk. The other arguments are those of
+    parse.
+
+        async for event in parse_async(reader, paths=['/Message/Children/Child']):
+            ...
+
+    :param source: An object with an async read method, or an async iterable of bytes
+    :param chunk_size: The most bytes to parse between turns of the event loop
+    :return:
+    """
+    parser = XmlFeedParser(coalesce=coalesce, element_id=element_id, rows=rows, paths=paths, ancestors=ancestors,
+                           comments=comments)
+    async for chunk in aio.read_chunks(source, chunk_size):
+        for event in parser.feed(chunk):
+            yield event
+        if parser.done:
+            return
+        await asyncio.sleep(0)
+    for event in parser.close():
+        yield event
+
+
+class _ExpatEvents:
+    """
+    The events of a document read from a file with an XmlFeedParser. The events of each buffer are held in a list,
+    so skip_subtree can drop those of the element being skipped, and have the parser skip the rest of it.
+    """
+
+    def __init__(self, source, bufsize=DEFAULT_BUFSIZE, **options):
+        if isinstance(source, (str, os.PathLike)):
+            self._file = open(source, 'rb')
+            source = self._file
+        else:
+            self._file = None
+        self._read = source.read
+        self._bufsize = bufsize
+        self._parser = XmlFeedParser(**options)
+        self._events = []
+        self._position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        position = self._position
+        events = self._events
+        while position >= len(events):
+            if self._parser.done:
+                self.close()
+                raise StopIteration
+            data = self._read(self._bufsize)
+            self._events = events = self._parser.feed(data) if data else self._parser.close()
+            position = 0
+        self._position = position + 1
+        return events[position]
+
+    def skip_subtree(self):
+        """
+        Skips the rest of the element whose StartElement was the last event returned, up to and including its
+        EndElement. If that is not in the events read so far, the parser skips the rest without creating events.
+        """
+        events = self._events
+        depth = 1
+        for position in range(self._position, len(events)):
+            event_type = type(events[position])
+            if event_type is StartElement:
+                depth += 1
+            elif event_type is EndElement:
+                depth -= 1
+                if depth == 0:
+                    self._position = position + 1
+                    return
+        self._position = len(events)
+        self._parser.skip_open_elements(depth)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _expat_parser(coalesce=True, element_id=False, comments=False, rows: range = None, paths: List[str] = None,
+                  ancestors=False):
+    """
+    Creates an expat parser whose handlers append events to a list. Returns the parser, the list, a function
+    returning the events that end the document when parsing stops after the last row selected, and a function that
+    skips the rest of the innermost elements that have been started in the list but not ended. Element and
+    attribute names are interned by expat, so repeated tags share one string.
+
+    If rows is given, the handlers track the index of each child of the root element, and ignore everything in
+    the children that are not selected. After the last child selected, they raise _StopParsing. If paths are
+    given, each element outside a match is checked against them, and the contents of elements that no path can
+    match below are ignored.
+    """
+    parser = expat.ParserCreate()
+    # Without coalescing, text comes in the same pieces as from pulldom
+    parser.buffer_text = coalesce
+
+    output = []
+    append = output.append
+    text = []
+    make_start, make_end, make_text = StartElement._make, EndElement._make, TextNode._make
+    if element_id:
+        ids = []
+        next_id = itertools.count().__next__
+
+    depth = 0
+    child_ix = -1
+    root_tag = None
+    root_emitted = False
+    # The depth of the element we are skipping the contents of
+    skip_depth = None
+    # The depth of the element matched by a path, if we are inside one
+    match_depth = None
+    if paths is not None:
+        matcher = _PathMatcher(paths)
+        transition = matcher.transition
+        states = [matcher.start]
+    # True if text and the like are not emitted where we are
+    silent = paths is not None
+
+    def start_element(tag, attrib):
+        nonlocal depth, child_ix, root_tag, root_emitted, skip_depth, match_depth, silent
+        depth += 1
+        if skip_depth is not None:
+            return
+        if rows is not None:
+            if depth == 1:
+                root_tag = tag
+            elif depth == 2:
+                child_ix += 1
+                if child_ix >= rows.stop:
+                    raise _StopParsing()
+                if child_ix not in rows:
+                    skip_depth = depth
+                    silent = True
+                    return
+        if paths is not None and match_depth is None:
+            state, matched = transition(states[-1], tag)
+            if matched:
+                match_depth = depth
+                silent = False
+            elif state is None:
+                # Nothing below here can match
+                skip_depth = depth
+                silent = True
+                return
+            else:
+                states.append(state)
+                if not ancestors:
+                    return
+        if text:
+            append(make_text(''.join(text)))
+            text.clear()
+        if element_id:
+            element = next_id()
+            ids.append(element)
+            append(StartElement(tag=tag, attrib=attrib, id=element))
+        else:
+            append(make_start(tag, attrib))
+        if depth == 1:
+            root_emitted = True
+
+    def end_element(tag):
+        nonlocal depth, skip_depth, match_depth, silent
+        depth -= 1
+        if skip_depth is not None:
+            if skip_depth == depth + 1:
+                skip_depth = None
+                silent = paths is not None and match_depth is None
+            return
+        if paths is not None:
+            if match_depth is None:
+                states.pop()
+                if not ancestors:
+                    return
+            elif match_depth == depth + 1:
+                match_depth = None
+                silent = True
+        if text:
+            append(make_text(''.join(text)))
+            text.clear()
+        if element_id:
+            append(EndElement(tag=tag, id=ids.pop()))
+        else:
+            append(make_end(tag))
+
+    def character_data(data):
+        if not silent:
+            if coalesce:
+                text.append(data)
+            else:
+                append(make_text(data))
+
+    def processing_instruction(target, data):
+        if not silent:
+            if text:
+                append(make_text(''.join(text)))
+                text.clear()
+            append(ProcessingInstructionNode._make(target, data))
+
+    def comment(data):
+        if not silent:
+            if text:
+                append(make_text(''.join(text)))
+                text.clear()
+            append(CommentNode._make(data))
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    parser.ProcessingInstructionHandler = processing_instruction
+    if comments:
+        parser.CommentHandler = comment
+
+    def skip(open_elements):
+        nonlocal skip_depth, match_depth, silent
+        # Elements inside one being skipped are not in the list, so the innermost one there is outside it
+        innermost = depth if skip_depth is None else skip_depth - 1
+        target = innermost - open_elements + 1
+        if paths is not None:
+            if match_depth is None:
+                del states[len(states) - open_elements:]
+            elif target <= match_depth:
+                # The match is skipped too, along with the ancestors of the target inside it
+                del states[len(states) - (open_elements - (innermost - match_depth + 1)):]
+                match_depth = None
+        if element_id:
+            del ids[len(ids) - open_elements:]
+        text.clear()
+        skip_depth = target
+        silent = True
+
+    def stopped():
+        events = []
+        if text:
+            events.append(make_text(''.join(text)))
+            text.clear()
+        if root_emitted:
+            # Only the root is open when a child past the last row starts
+            events.append(EndElement(tag=root_tag, id=ids[0]) if element_id else make_end(root_tag))
+        return events
+
+    return parser, output, stopped, skip
+
+
+def _select_children(event_stream, rows: range, close=False):
+    """
+    Passes on the pulldom events of the child elements of the root element whose index is in rows, and of
+    everything outside them. After the last child selected we stop reading and close the root element. If close
+    is True, the file pulldom opened is closed then.
+    """
+    depth = 0
+    child_ix = -1
+    skip_depth = None
+    root = None
+    for event, node in event_stream:
+        if event == pulldom.START_ELEMENT:
+            depth += 1
+            if depth == 1:
+                root = node
+            elif depth == 2 and skip_depth is None:
+                child_ix += 1
+                if child_ix >= rows.stop:
+                    break
+                if child_ix not in rows:
+                    skip_depth = depth
+            if skip_depth is not None:
+                continue
+        elif event == pulldom.END_ELEMENT:
+            depth -= 1
+            if skip_depth is not None:
+                if depth < skip_depth:
+                    skip_depth = None
+                continue
+        elif skip_depth is not None:
+            continue
+        yield event, node
+    else:
+        return
+
+    if close:
+        event_stream.stream.close()
+    yield pulldom.END_ELEMENT, root
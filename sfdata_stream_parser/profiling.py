@@ -0,0 +1,192 @@
+import functools
+import json
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Iterator, Optional
+
+from sfdata_stream_parser.events import ParseEvent
+
+_profiler = ContextVar('profiler', default=None)
+
+REPORT_TABLE = 'table'
+REPORT_JSON = 'json'
+
+
+class StageStats:
+    """
+    The figures recorded for one stage of a pipeline. Times are in seconds: cumulative is the time spent fetching
+    the stage's events, including the stages upstream of it, and self_time excludes the upstream stages that are
+    profiled. events_in is None if the stage's input could not be counted, for example for a parser.
+    """
+    __slots__ = ('name', 'calls', 'events_in', 'events_out', 'cumulative', 'self_time', 'event_types')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.events_in = None
+        self.events_out = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.event_types = {}
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "events_in": self.events_in,
+            "events_out": self.events_out,
+            "cumulative": self.cumulative,
+            "self_time": self.self_time,
+            "event_types": {event_type.__name__: count for event_type, count in self.event_types.items()},
+        }
+
+
+class Profiler:
+    """
+    Collects StageStats for the stages created while it is active. Stages are identified by name. A stage created
+    while another stage of the same name is still open (such as a filter applied twice in one pipeline) gets a
+    numbered name, while stages that are created one after the other (such as a filter created for each table by a
+    collector) share their figures.
+
+    Use the profile context manager rather than creating a Profiler directly.
+    """
+
+    def __init__(self, report: Callable[[str], None] = None, report_format: str = REPORT_TABLE):
+        if report_format not in (REPORT_TABLE, REPORT_JSON):
+            raise ValueError(f"Unknown report format: {report_format!r}")
+        self.stages = {}
+        self._report = report
+        self._report_format = report_format
+        self._open = {}
+        self._timers = []
+
+    def _stage(self, name: str) -> StageStats:
+        open_count = self._open.get(name, 0)
+        self._open[name] = open_count + 1
+        key = name if open_count == 0 else f"{name}#{open_count + 1}"
+        stats = self.stages.get(key)
+        if stats is None:
+            stats = self.stages[key] = StageStats(key)
+        stats.calls += 1
+        return stats
+
+    def _close(self, name: str):
+        self._open[name] -= 1
+        if self._report is not None and not any(self._open.values()):
+            self._report(self.json() if self._report_format == REPORT_JSON else self.table())
+
+    def _count_in(self, stats: StageStats, stream: Iterable) -> Iterator:
+        if stats.events_in is None:
+            stats.events_in = 0
+        for event in stream:
+            stats.events_in += 1
+            yield event
+
+    def _time_out(self, name: str, stats: StageStats, stream: Iterable) -> Iterator:
+        iterator = iter(stream)
+        timers = self._timers
+        event_types = stats.event_types
+        clock = time.perf_counter
+        try:
+            while True:
+                # Stages created while this one runs, such as by a collector, are profiled too
+                token = _profiler.set(self)
+                timers.append(0.0)
+                start = clock()
+                try:
+                    event = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed = clock() - start
+                    upstream = timers.pop()
+                    _profiler.reset(token)
+                    stats.cumulative += elapsed
+                    stats.self_time += elapsed - upstream
+                    if timers:
+                        timers[-1] += elapsed
+                stats.events_out += 1
+                event_type = type(event)
+                event_types[event_type] = event_types.get(event_type, 0) + 1
+                yield event
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            self._close(name)
+
+    def wrap(self, name: str, func: Callable, args: tuple, kwargs: dict, stream_arg: Optional[int]) -> Iterator:
+        stats = self._stage(name)
+        if stream_arg is not None and len(args) > stream_arg and not isinstance(args[stream_arg], ParseEvent):
+            args = args[:stream_arg] + (self._count_in(stats, args[stream_arg]),) + args[stream_arg + 1:]
+        return self._time_out(name, stats, func(*args, **kwargs))
+
+    def as_dict(self) -> dict:
+        return {"stages": [stats.as_dict() for stats in self.stages.values()]}
+
+    def json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+    def table(self) -> str:
+        lines = [f"{'stage':<30} {'calls':>7} {'events in':>10} {'events out':>10} {'cumul (s)':>10} "
+                 f"{'self (s)':>10}  event types"]
+        for stats in self.stages.values():
+            events_in = '-' if stats.events_in is None else stats.events_in
+            event_types = ', '.join(f"{event_type.__name__}={count}" for event_type, count in
+                                    sorted(stats.event_types.items(), key=lambda item: -item[1]))
+            lines.append(f"{stats.name:<30} {stats.calls:>7} {events_in:>10} {stats.events_out:>10} "
+                         f"{stats.cumulative:>10.4f} {stats.self_time:>10.4f}  {event_types}")
+        return '\n'.join(lines)
+
+
+@contextmanager
+def profile(sample: float = 1.0, report: Callable[[str], None] = None, report_format: str = REPORT_TABLE):
+    """
+    A context manager that profiles the pipeline stages created within the block. Stages keep being profiled
+    after the block exits, so the stream can be consumed outside it. If report is given, it is called with a
+    table or JSON report (see report_format) when all the profiled stages have closed.
+
+        with profile(sample=0.01, report=logger.info) as profiler:
+            stream = promote_first_row(parse_csv(f))
+
+    :param sample: The probability of profiling this pipeline. Pipelines that are not sampled are not wrapped
+                   at all, so they run at full speed. The profiler is still returned, but stays empty.
+    :param report: A function to call with the report
+    :param report_format: One of REPORT_TABLE or REPORT_JSON
+    :return:
+    """
+    profiler = Profiler(report=report, report_format=report_format)
+    if sample < 1 and random.random() >= sample:
+        yield profiler
+        return
+
+    token = _profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _profiler.reset(token)
+
+
+def stage(name: str = None, stream_arg: Optional[int] = 0):
+    """
+    A decorator for functions that return a stream of events, such as parsers, filters and collectors, that
+    profiles the streams they create while a profiler is active. Otherwise the function is called as it is.
+
+    :param name: The name of the stage in the reports. Defaults to the function's qualified name.
+    :param stream_arg: The position of the argument holding the stage's input stream, which is counted as the
+                       events in. None for stages without an input stream, such as parsers.
+    :return:
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__.replace('.<locals>', '')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler.get()
+            if profiler is None:
+                return func(*args, **kwargs)
+            return profiler.wrap(stage_name, func, args, kwargs, stream_arg)
+        return wrapper
+    return decorator
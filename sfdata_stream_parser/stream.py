@@ -13,4 +13,59 @@ def first_then_rest(first: events.ParseEvent, rest: Iterator[events.ParseEvent])
     :return:
     """
     yield first
-    yield from rest
\ No newline at end of file
+    yield from rest
+
+
+def skip_subtree(stream: Iterator[events.ParseEvent]):
+    """
+    Skips the rest of the XML element whose StartElement was the last event read from stream, up to and including
+    its EndElement. Nested elements with the same tag are counted, so the element's own EndElement is found.
+
+    If the stream is straight from xml.parse with the expat engine, the parser skips the element without creating
+    events for the part of it not read yet. Otherwise the events are read and dropped.
+
+        for event in stream:
+            if isinstance(event, events.StartElement) and event.tag == "Attachments":
+                skip_subtree(stream)
+
+    :param stream:
+    :return:
+    """
+    skip = getattr(stream, 'skip_subtree', None)
+    if skip is not None:
+        skip()
+        return
+
+    start_element, end_element = events.StartElement, events.EndElement
+    depth = 1
+    for event in stream:
+        if isinstance(event, start_element):
+            depth += 1
+        elif isinstance(event, end_element):
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def with_provenance(stream: Iterable[events.ParseEvent], mode: str) -> Iterable[events.ParseEvent]:
+    """
+    Applies a provenance mode (see events.set_provenance) to a pipeline. The mode is in effect whenever the stream
+    pulls an event from upstream, so every filter between the parser and this wrapper uses it.
+
+        stream = with_provenance(promote_first_row(parse_csv(f)), "parent-only")
+
+    :param stream: The pipeline to wrap
+    :param mode: One of events.PROVENANCE_MODES
+    :return:
+    """
+    mode = events._check_provenance(mode)
+    iterator = iter(stream)
+    while True:
+        token = events._provenance.set(mode)
+        try:
+            event = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            events._provenance.reset(token)
+        yield event
@@ -1,7 +1,7 @@
 import pytest
 
 from sfdata_stream_parser.parser.csv import parse_csv
-from sfdata_stream_parser.filters.column_headers import promote_first_row, _SafeList
+from sfdata_stream_parser.filters.column_headers import promote_first_row, promote_header_row, Headers, _SafeList
 from sfdata_stream_parser import events
 
 
@@ -32,12 +32,13 @@ def test_column_headers_start_rows(single_table):
     row_list = list(filter(lambda x: isinstance(x, events.StartRow), event_list))
     assert len(row_list) == 3
     assert [x.row_index for x in row_list] == [1, 2, 3]
-    assert [x.headers for x in row_list] == [['Col1', 'Col2', 'Col3']] * 3
+    assert [x.headers for x in row_list] == [('Col1', 'Col2', 'Col3')] * 3
+    assert row_list[0].headers is row_list[1].headers
 
 
 def test_column_headers_start_table(single_table):
     event_list = list(promote_first_row(single_table))
-    assert event_list[1].column_headers == ['Col1', 'Col2', 'Col3']
+    assert event_list[1].column_headers == ('Col1', 'Col2', 'Col3')
 
 
 def test_column_headers_extra_events():
@@ -64,3 +65,155 @@ def test_column_headers_extra_events():
 
     assert [e.ix for e in event_list] == [0, 1, 2, 6, 7, 8, 9]
 
+
+
+def test_column_headers_cells(single_table):
+    cells = [e for e in promote_first_row(single_table) if isinstance(e, events.Cell)]
+    assert [(c.value, c.column_header) for c in cells[:3]] == [('R1C1', 'Col1'), ('R1C2', 'Col2'), ('R1C3', 'Col3')]
+
+
+def test_column_headers_without_cells(single_table):
+    event_list = list(promote_first_row(single_table, cell_headers=False))
+    assert all(e.get('column_header') is None for e in event_list if isinstance(e, events.Cell))
+    assert event_list[2].headers.column_index('Col3') == 2
+
+
+def test_column_headers_row_events():
+    stream = parse_csv(["a,b", "1,2", "3,4"], row_events=True)
+    event_list = list(promote_first_row(stream))
+    rows = [e for e in event_list if isinstance(e, events.Row)]
+    assert [row.values for row in rows] == [['1', '2'], ['3', '4']]
+    assert rows[1].values[rows[1].headers.column_index('b')] == '4'
+
+
+def test_column_headers_empty_table():
+    stream = iter((events.StartTable(), events.EndTable(),
+                   events.StartTable(), events.StartRow(), events.Cell(value='a', column_index=0), events.EndRow(),
+                   events.StartRow(), events.Cell(value='1', column_index=0), events.EndRow(), events.EndTable()))
+    event_list = list(promote_first_row(stream))
+    assert [type(e).__name__ for e in event_list] == ['StartTable', 'EndTable', 'StartTable', 'StartRow', 'Cell',
+                                                      'EndRow', 'EndTable']
+    assert event_list[0].column_headers == ()
+    assert event_list[4].column_header == 'a'
+
+
+def test_headers():
+    headers = Headers(['a', 'b', 'a'])
+    assert headers == ('a', 'b', 'a')
+    assert headers.column_index('b') == 1
+    assert headers.column_index('a') == 0
+    assert headers.column_index('c') is None
+    assert 'b' in headers and 'c' not in headers
+    assert headers.get(2) == 'a'
+    assert headers.get(3) is None
+    assert headers.get(None, '') == ''
+
+
+def test_headers_column_indexes():
+    headers = Headers(['c', 'a'], [2, 0])
+    assert headers == ('c', 'a')
+    assert headers.column_index('c') == 2
+    assert headers.column_index('a') == 0
+    assert headers.get(2) == 'c'
+    assert headers.get(0) == 'a'
+    assert headers.get(1) is None
+
+
+def test_column_headers_selected_columns():
+    event_list = list(promote_first_row(parse_csv(["a,b,c", "1,2,3"], columns=[2, 0])))
+    headers = event_list[1].column_headers
+    assert headers == ('c', 'a')
+    assert headers.column_index('a') == 0
+    cells = [e for e in event_list if isinstance(e, events.Cell)]
+    assert [(c.value, c.column_index, c.column_header) for c in cells] == [('3', 2, 'c'), ('1', 0, 'a')]
+
+
+def _table_rows(event_list):
+    rows = []
+    for event in event_list:
+        if isinstance(event, events.StartRow):
+            rows.append([])
+        elif isinstance(event, events.Cell):
+            rows[-1].append((event.value, event.column_header))
+    return rows
+
+
+def test_promote_header_row():
+    stream = parse_csv([
+        "Report of children,,",
+        ",,",
+        "Child ID,Name,Age",
+        "1,Ann,7",
+        "2,Bob,9",
+    ])
+    event_list = list(promote_header_row(stream))
+    assert event_list[1].column_headers == ('Child ID', 'Name', 'Age')
+    assert _table_rows(event_list) == [
+        [('1', 'Child ID'), ('Ann', 'Name'), ('7', 'Age')],
+        [('2', 'Child ID'), ('Bob', 'Name'), ('9', 'Age')],
+    ]
+    assert [e.row_index for e in event_list if isinstance(e, events.StartRow)] == [3, 4]
+
+
+def test_promote_header_row_selected_columns():
+    stream = parse_csv(["Report,,", "Child ID,Name,Age", "1,Ann,7"], columns=[2, 1])
+    event_list = list(promote_header_row(stream))
+    assert event_list[1].column_headers == ('Age', 'Name')
+    assert event_list[1].column_headers.column_index('Age') == 2
+    assert _table_rows(event_list) == [[('7', 'Age'), ('Ann', 'Name')]]
+
+
+def test_promote_header_row_expected_headers():
+    lines = ["Name,Town", "Ann,Leeds", "Bob,York"]
+    assert list(promote_header_row(parse_csv(lines)))[1].column_headers == ('Name', 'Town')
+
+    # Without the expected headers, the all text rows score the same, so the first wins
+    event_list = list(promote_header_row(parse_csv(["Ann,Leeds"] + lines), expected_headers=['town', 'NAME']))
+    assert event_list[1].column_headers == ('Name', 'Town')
+
+
+def test_promote_header_row_multiple_rows():
+    stream = parse_csv([
+        "Child,,Address,",
+        "ID,Name,Street,Town",
+        "1,Ann,High St,Leeds",
+    ])
+    event_list = list(promote_header_row(stream, header_rows=2))
+    assert event_list[1].column_headers == ('Child ID', 'Child Name', 'Address Street', 'Address Town')
+    assert len(_table_rows(event_list)) == 1
+
+
+def test_promote_header_row_lookahead():
+    # The header is not among the first two rows, so the best of them is used
+    lines = ["1,2", "3,4", "a,b", "5,6"]
+    event_list = list(promote_header_row(parse_csv(lines), lookahead=2))
+    assert event_list[1].column_headers == ('1', '2')
+    assert [value for row in _table_rows(event_list) for value, _ in row] == ['3', '4', 'a', 'b', '5', '6']
+
+    event_list = list(promote_header_row(parse_csv(lines)))
+    assert event_list[1].column_headers == ('a', 'b')
+
+
+def test_promote_header_row_bounded():
+    held = []
+
+    def _rows():
+        yield events.StartTable()
+        for row_ix in range(1000):
+            held.append(row_ix)
+            yield events.Row(row_index=row_ix, values=['a', 'b'] if row_ix == 1 else [str(row_ix), 'x'])
+        yield events.EndTable()
+
+    stream = promote_header_row(_rows(), lookahead=3)
+    assert next(stream).column_headers == ('a', 'b')
+    assert len(held) == 3
+    event_list = list(stream)
+    assert len(event_list) == 999
+    assert event_list[0].headers == ('a', 'b')
+
+
+def test_promote_header_row_arguments():
+    with pytest.raises(ValueError):
+        list(promote_header_row(iter(()), header_rows=0))
+    with pytest.raises(ValueError):
+        list(promote_header_row(iter(()), lookahead=1, header_rows=2))
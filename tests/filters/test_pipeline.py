@@ -0,0 +1,92 @@
+import functools
+
+import pytest
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import type_check
+from sfdata_stream_parser.filters.column_headers import promote_first_row
+from sfdata_stream_parser.filters.generic import streamfilter, pass_event, skip_error
+from sfdata_stream_parser.filters.pipeline import Pipeline, FilterStage
+
+
+def _stream():
+    yield events.StartTable()
+    for row_ix in range(3):
+        yield events.StartRow(row_index=row_ix)
+        for col_ix in range(3):
+            yield events.Cell(value=str(row_ix * 3 + col_ix), column_index=col_ix)
+        yield events.EndRow(row_index=row_ix)
+    yield events.EndTable()
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event)
+def _double(event, factor=2):
+    return event.from_event(event, value=str(int(event.value) * factor))
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event)
+def _drop_odd(event):
+    if int(event.value) % 2 == 0:
+        return event
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event)
+def _split(event):
+    yield event
+    yield events.Cell.from_event(event, value=event.value + "0")
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event, error_function=skip_error)
+def _fail_on_large(event):
+    if len(event.value) > 2:
+        raise ValueError(event.value)
+    return event
+
+
+def _chain(stages, stream):
+    for item in stages:
+        stream = item(stream)
+    return stream
+
+
+def _as_dicts(stream):
+    return [(type(e).__name__, e.get("value")) for e in stream]
+
+
+@pytest.mark.parametrize("stages", [
+    [_double],
+    [_double, _drop_odd, functools.partial(_double, factor=3)],
+    [_split, _double, _split],
+    [_double, _split, _fail_on_large, _drop_odd],
+    [_double, promote_first_row, _split],
+])
+def test_matches_chain(stages):
+    assert _as_dicts(Pipeline(stages)(_stream())) == _as_dicts(_chain(stages, _stream()))
+
+
+def test_segments():
+    pipeline = Pipeline([_double, _drop_odd, promote_first_row]).add_filter(check=type_check(events.Cell))
+    segments = pipeline.segments()
+    assert [type(s) for s in segments] == [list, type(promote_first_row), list]
+    assert len(segments[0]) == 2
+    assert isinstance(segments[2][0], FilterStage)
+
+
+def test_error_in_expansion():
+    def _generate(event):
+        yield event
+        raise ValueError("Failed")
+
+    def _error(event, exception):
+        return events.Cell(value=str(exception))
+
+    stage = FilterStage(check=type_check(events.Cell), pass_function=_generate, fail_function=pass_event,
+                        error_function=_error)
+    output = _as_dicts(Pipeline([stage, _split])([events.Cell(value="1")]))
+    assert output == [("Cell", "1"), ("Cell", "10"), ("Cell", "Failed"), ("Cell", "Failed0")]
+
+
+def test_error_function_raises():
+    stage = FilterStage(pass_function=lambda event: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        list(Pipeline([stage])([events.Cell(value="1")]))
@@ -0,0 +1,113 @@
+import pytest
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import property_check
+from sfdata_stream_parser.filters.column_headers import promote_first_row
+from sfdata_stream_parser.filters.rows import rowfilter, filter_rows, RowRecord
+from sfdata_stream_parser.parser.csv import parse_csv
+
+
+def _table(**options):
+    return parse_csv(["Name,Age", "Ann,7", "Bob,", "Cat,9"], **options)
+
+
+def _values(stream):
+    rows = []
+    for event in stream:
+        if isinstance(event, events.StartRow):
+            rows.append([])
+        elif isinstance(event, events.Cell):
+            rows[-1].append(event.value)
+        elif isinstance(event, events.Row):
+            rows.append(event.values)
+    return rows
+
+
+def test_unchanged_rows_pass_as_they_are():
+    source = list(_table())
+    output = list(filter_rows(iter(source), lambda row: row))
+    assert all(a is b for a, b in zip(source, output))
+    assert len(output) == len(source)
+
+
+def test_rowfilter_by_header():
+    calls = []
+
+    @rowfilter
+    def _age_in_months(row):
+        calls.append(row.row_index)
+        if row['Age']:
+            row['Age'] = int(row['Age']) * 12
+        return row
+
+    stream = list(_age_in_months(promote_first_row(_table())))
+    assert calls == [1, 2, 3]
+    assert _values(stream) == [['Ann', 84], ['Bob', ''], ['Cat', 108]]
+    cells = [e for e in stream if isinstance(e, events.Cell)]
+    assert cells[1].column_header == 'Age'
+    assert cells[1].source.value == '7'
+
+
+def test_rowfilter_by_header_selected_columns():
+    @rowfilter
+    def _upper_name(row):
+        row['Name'] = row['Name'].upper()
+        return row
+
+    stream = parse_csv(["Name,Age,Town", "Ann,7,Leeds"], columns=[2, 0])
+    assert _values(_upper_name(promote_first_row(stream))) == [['Leeds', 'ANN']]
+
+
+def test_rowfilter_drops_and_adds():
+    @rowfilter(check=property_check(row_index=2), default_args=lambda: {'suffix': '!'})
+    def _drop_or_shout(row, suffix):
+        return None if row[0] == 'Bob' else row
+
+    assert _values(_drop_or_shout(_table())) == [['Name', 'Age'], ['Ann', '7'], ['Cat', '9']]
+
+    @rowfilter
+    def _extend(row, flag):
+        row.values.append(flag)
+        return row
+
+    stream = list(_extend(_table(), flag=True))
+    assert _values(stream)[1] == ['Ann', '7', True]
+    assert [e.column_index for e in stream if isinstance(e, events.Cell)][:3] == [0, 1, 2]
+
+
+def test_rowfilter_row_events():
+    @rowfilter
+    def _upper(row):
+        row[0] = row[0].upper()
+        return row
+
+    assert _values(_upper(_table(row_events=True))) == [['NAME', 'Age'], ['ANN', '7'], ['BOB', ''], ['CAT', '9']]
+
+    source = list(_table(row_events=True))
+    assert list(filter_rows(iter(source), lambda row: row))[3] is source[3]
+
+
+def test_rowfilter_errors():
+    def _error(event, exception):
+        assert isinstance(event, RowRecord)
+        return events.ParseEvent(error=str(exception), row_index=event.row_index)
+
+    @rowfilter(error_function=_error)
+    def _strict(row):
+        return row if row[1] else int(row[1])
+
+    stream = list(_strict(_table()))
+    assert [e.row_index for e in stream if e.get('error')] == [2]
+
+    with pytest.raises(KeyError):
+        list(filter_rows(_table(), lambda row: row['Age']))
+
+
+def test_row_record():
+    start = events.StartRow(row_index=4)
+    cells = [events.Cell(value='a', column_index=0), events.Cell(value='b', column_index=1)]
+    row = RowRecord(start, cells, ['a', 'b'], events.EndRow(row_index=4), [events.ParseEvent(note=1)])
+    assert len(row) == 2
+    assert row.get(5) is None
+    assert row.get('missing', 'x') == 'x'
+    assert [type(e).__name__ for e in row.events()] == ['StartRow', 'ParseEvent', 'Cell', 'Cell', 'EndRow']
@@ -1,6 +1,9 @@
+import io
+
 import pytest
 
-from sfdata_stream_parser.parser.csv import parse_csv
+from sfdata_stream_parser.parser.csv import parse_csv, parse_csv_fast, parse_csv_parallel, CsvFeedParser, \
+    DEFAULT_BLOCK_SIZE, _collect, _ranges, _split_records
 from sfdata_stream_parser import events
 
 
@@ -65,3 +68,228 @@ def test_csv_emitter_row_and_cols(event_stream):
 
 
 
+
+
+_TRICKY_CSV = (
+    'Col1,Col2,Col3\r\n'
+    'plain,"quoted, with comma","with ""escaped"" quotes"\r\n'
+    '"multi\r\nline",,last\r\n'
+    '\r\n'
+    'short\r\n'
+    'ünïcödé,x,"y"'
+)
+
+
+def _fast(data, **kwargs):
+    return list(parse_csv_fast(io.BytesIO(data.encode('utf-8')), **kwargs))
+
+
+def _as_tuples(stream):
+    return [(type(e).__name__, e.get('row_index'), e.get('column_index'), e.get('value')) for e in stream]
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 64, DEFAULT_BLOCK_SIZE])
+def test_fast_matches_parse_csv(block_size):
+    expected = _as_tuples(parse_csv(io.StringIO(_TRICKY_CSV, newline=''), name="test"))
+    assert _as_tuples(_fast(_TRICKY_CSV, name="test", block_size=block_size)) == expected
+
+
+# Quotes in the middle of unquoted fields are part of their values, and leave an odd number of quotes behind them
+_STRAY_QUOTE_CSV = (
+    'item,size\n'
+    'pizza,12" pizza\n'
+    '"multi\nline",x\n'
+    '"closed"after"quote,"a""b"\n'
+    'tv,40"\n'
+    'last,"split\n\nover lines"\n'
+) * 3
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 16, 64, DEFAULT_BLOCK_SIZE])
+def test_fast_stray_quotes(block_size):
+    expected = _as_tuples(parse_csv(io.StringIO(_STRAY_QUOTE_CSV, newline='')))
+    assert _as_tuples(_fast(_STRAY_QUOTE_CSV, block_size=block_size)) == expected
+
+
+def _split_all(text):
+    return _collect(_split_records(text, ',', '"'))
+
+
+def test_split_records():
+    # A stray quote does not keep the records after it in quotes
+    assert _split_all('a,12" pizza\nb,c\n') == ([['a', '12" pizza'], ['b', 'c']], '')
+    assert _split_all('a,"b\n\nc",d\ne,"f\ng\n') == ([['a', 'b\n\nc', 'd']], 'e,"f\ng\n')
+    assert _split_all('"a\n') == ([], '"a\n')
+    assert _split_all('a\n\n') == ([['a'], []], '')
+
+
+def test_fast_unquoted_lines():
+    data = "a,b,c\n1,2,3\n\n4,5\n"
+    assert _as_tuples(_fast(data, block_size=4)) == _as_tuples(parse_csv(io.StringIO(data, newline='')))
+
+
+def test_fast_row_events():
+    stream = _fast(_TRICKY_CSV, row_events=True, block_size=16)
+    rows = [e for e in stream if isinstance(e, events.Row)]
+    assert not any(isinstance(e, (events.StartRow, events.Cell)) for e in stream)
+    assert [r.row_index for r in rows] == [0, 1, 2, 3, 4, 5]
+    assert rows[1].values == ['plain', 'quoted, with comma', 'with "escaped" quotes']
+    assert rows[2].values == ['multi\r\nline', '', 'last']
+    assert rows[3].values == []
+
+
+def test_fast_path_and_mmap(tmp_path):
+    filename = tmp_path / "test.csv"
+    filename.write_bytes(_TRICKY_CSV.encode('utf-8'))
+    expected = _as_tuples(_fast(_TRICKY_CSV))
+    assert _as_tuples(parse_csv_fast(filename)) == expected
+    assert _as_tuples(parse_csv_fast(str(filename), use_mmap=True, block_size=10)) == expected
+
+    empty = tmp_path / "empty.csv"
+    empty.write_bytes(b"")
+    assert [type(e) for e in parse_csv_fast(empty, use_mmap=True)] == [
+        events.StartContainer, events.StartTable, events.EndTable, events.EndContainer]
+
+
+def test_row_events():
+    stream = list(parse_csv(["a,b", "c"], row_events=True))
+    assert [e.values for e in stream if isinstance(e, events.Row)] == [["a", "b"], ["c"]]
+
+
+def _upper(values):
+    return [value.upper() for value in values]
+
+
+def _drop_short(values):
+    return values if len(values) > 1 else None
+
+
+@pytest.mark.parametrize("workers,chunk_size", [(1, 1), (2, 1), (2, 20), (3, 1 << 20)])
+def test_parallel_matches_fast(tmp_path, workers, chunk_size):
+    filename = tmp_path / "test.csv"
+    filename.write_bytes((_TRICKY_CSV + '\n' + _TRICKY_CSV).encode('utf-8'))
+    expected = _as_tuples(parse_csv_fast(filename, name="test"))
+    stream = parse_csv_parallel(filename, name="test", workers=workers, chunk_size=chunk_size, max_in_flight=2)
+    assert _as_tuples(stream) == expected
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("chunk_size", [1, 10, 30])
+def test_parallel_stray_quotes(tmp_path, workers, chunk_size):
+    filename = tmp_path / "test.csv"
+    filename.write_bytes((_STRAY_QUOTE_CSV + '"unterminated,\nrecord').encode('utf-8'))
+    expected = _as_tuples(parse_csv_fast(filename))
+    assert _as_tuples(parse_csv_parallel(filename, workers=workers, chunk_size=chunk_size)) == expected
+
+
+def test_ranges_after_stray_quote(tmp_path):
+    # The ranges after a quote in an unquoted field end near chunk_size, rather than all at the end of the file
+    filename = tmp_path / "test.csv"
+    filename.write_bytes(b'a,12" pizza\n' + b'b,c\n' * 1000)
+    ranges = list(_ranges(filename, 400, b'"', block_size=100))
+    assert len(ranges) > 5
+    assert max(end - start for start, end in ranges) < 600
+
+
+def test_parallel_row_functions(tmp_path):
+    filename = tmp_path / "test.csv"
+    filename.write_bytes(_TRICKY_CSV.encode('utf-8'))
+    stream = parse_csv_parallel(filename, row_events=True, row_functions=[_drop_short, _upper], workers=2,
+                                chunk_size=1)
+    rows = [(e.row_index, e.values) for e in stream if isinstance(e, events.Row)]
+    assert rows == [
+        (0, ['COL1', 'COL2', 'COL3']),
+        (1, ['PLAIN', 'QUOTED, WITH COMMA', 'WITH "ESCAPED" QUOTES']),
+        (2, ['MULTI\r\nLINE', '', 'LAST']),
+        (5, ['ÜNÏCÖDÉ', 'X', 'Y']),
+    ]
+
+
+def test_select_rows_and_columns():
+    lines = ["a,b,c", "d,e,f", "g", "h,i,j", "k,l,m"]
+    stream = list(parse_csv(lines, rows=range(1, 4), columns=[2, 0]))
+    assert [(e.column_index, e.value) for e in stream if isinstance(e, events.Cell)] == [
+        (2, "f"), (0, "d"), (0, "g"), (2, "j"), (0, "h")]
+    assert [e.row_index for e in stream if isinstance(e, events.StartRow)] == [1, 2, 3]
+
+    stream = parse_csv(lines, rows=range(0, 5, 2), columns=[1], row_events=True)
+    assert [(e.row_index, e.values) for e in stream if isinstance(e, events.Row)] == [
+        (0, ["b"]), (2, [""]), (4, ["l"])]
+
+
+def test_select_columns_of_short_rows():
+    # The values of Row events stay in line with the columns selected
+    stream = parse_csv(["a,b,c", "g"], columns=[2, 0], row_events=True)
+    assert [e.values for e in stream if isinstance(e, events.Row)] == [["c", "a"], ["", "g"]]
+
+
+def test_select_stops_reading():
+    read = []
+
+    def _lines():
+        for ix in range(100):
+            read.append(ix)
+            yield f"{ix},x"
+
+    stream = list(parse_csv(_lines(), rows=2))
+    assert [e.value for e in stream if isinstance(e, events.Cell)] == ["0", "x", "1", "x"]
+    assert isinstance(stream[-1], events.EndContainer)
+    assert read == [0, 1, 2]
+
+
+def test_fast_select(tmp_path):
+    filename = tmp_path / "test.csv"
+    filename.write_bytes(_TRICKY_CSV.encode('utf-8'))
+    expected = _as_tuples(parse_csv(io.StringIO(_TRICKY_CSV, newline=''), rows=range(1, 3), columns=[0, 2]))
+    assert _as_tuples(parse_csv_fast(filename, rows=range(1, 3), columns=[0, 2], block_size=8)) == expected
+
+
+@pytest.mark.parametrize("rows", [-1, range(3, 0, -1), "3"])
+def test_invalid_rows(rows):
+    with pytest.raises((TypeError, ValueError)):
+        parse_csv([], rows=rows)
+
+
+def _feed(parser, data, chunk_size):
+    stream = []
+    for start in range(0, len(data), chunk_size):
+        stream += parser.feed(data[start:start + chunk_size])
+    return stream + parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_feed_matches_fast(chunk_size):
+    data = _TRICKY_CSV.encode('utf-8')
+    expected = _as_tuples(_fast(_TRICKY_CSV, name="test"))
+    assert _as_tuples(_feed(CsvFeedParser(name="test"), data, chunk_size)) == expected
+
+    expected = [(type(e), e.as_dict()) for e in _fast(_TRICKY_CSV, rows=range(1, 4), columns=[2, 0], row_events=True)]
+    parser = CsvFeedParser(rows=range(1, 4), columns=[2, 0], row_events=True)
+    assert [(type(e), e.as_dict()) for e in _feed(parser, data, chunk_size)] == expected
+    assert parser.done
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_feed_stray_quotes(chunk_size):
+    data = _STRAY_QUOTE_CSV.encode('utf-8')
+    expected = _as_tuples(parse_csv(io.StringIO(_STRAY_QUOTE_CSV, newline='')))
+    assert _as_tuples(_feed(CsvFeedParser(), data, chunk_size)) == expected
+
+
+def test_feed_after_stray_quote():
+    # The rows after a quote in an unquoted field are returned as their lines are fed, rather than held
+    parser = CsvFeedParser(row_events=True)
+    assert [e.values for e in parser.feed(b'a,12" pizza\nb,c\n') if isinstance(e, events.Row)] == [
+        ['a', '12" pizza'], ['b', 'c']]
+    for row_ix in range(2, 1000):
+        assert [e.row_index for e in parser.feed(b'd,e\n')] == [row_ix]
+    assert parser._pending == b''
+
+
+def test_feed_returns_completed_rows():
+    parser = CsvFeedParser()
+    assert [type(e) for e in parser.feed(b'a,"b\n')] == [events.StartContainer, events.StartTable]
+    assert [e.get('value') for e in parser.feed(b'c",d\ne')] == [None, 'a', 'b\nc', 'd', None]
+    assert [e.get('value') for e in parser.close()] == [None, 'e', None, None, None]
+    with pytest.raises(ValueError):
+        parser.feed(b'more')
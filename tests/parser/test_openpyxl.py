@@ -1,3 +1,6 @@
+import re
+import zipfile
+from concurrent.futures import Future
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
@@ -9,7 +12,8 @@ from openpyxl.worksheet.table import Table
 from sfdata_stream_parser import events
 from sfdata_stream_parser.checks import type_check
 from sfdata_stream_parser.filters.generic import filter_stream
-from sfdata_stream_parser.parser.openpyxl import parse_sheets
+from sfdata_stream_parser.parser import openpyxl as openpyxl_parser
+from sfdata_stream_parser.parser.openpyxl import parse_sheets, parse_sheets_parallel, ORDER_COMPLETED
 
 
 @pytest.fixture
@@ -100,3 +104,194 @@ def test_read_from_sheet(sample_workbook):
     assert len(list(filter_stream(event_stream, type_check(events.StartRow)))) == 40
     assert len(list(filter_stream(event_stream, type_check(events.Cell)))) == 40 * 600
 
+
+
+def _as_dicts(stream):
+    return [(type(e).__name__, e.as_dict()) for e in stream]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parallel_matches_parse_sheets(sample_file, workers):
+    expected = _as_dicts(parse_sheets(str(sample_file)))
+    assert _as_dicts(parse_sheets_parallel(str(sample_file), workers=workers, max_in_flight=1)) == expected
+
+    with open(sample_file, "rb") as f:
+        stream = parse_sheets_parallel(f, workers=workers)
+        assert _as_dicts(stream)[1:] == expected[1:]
+
+
+class _RecordingExecutor:
+    """ Runs the tasks in this process, recording their arguments """
+    submitted = []
+
+    def __init__(self, max_workers):
+        pass
+
+    def submit(self, function, *args):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+    def shutdown(self):
+        pass
+
+
+def test_parallel_sends_path_of_bytes(sample_file, monkeypatch):
+    monkeypatch.setattr(openpyxl_parser, "ProcessPoolExecutor", _RecordingExecutor)
+    _RecordingExecutor.submitted = []
+    expected = _as_dicts(parse_sheets(str(sample_file)))
+    assert _as_dicts(parse_sheets_parallel(sample_file.read_bytes(), workers=2))[1:] == expected[1:]
+
+    paths = {source for source, sheet in _RecordingExecutor.submitted}
+    assert len(_RecordingExecutor.submitted) == 3 and len(paths) == 1
+    path = paths.pop()
+    assert isinstance(path, str) and not Path(path).exists()
+
+
+def test_parallel_sheet_selection_and_order(sample_file):
+    stream = parse_sheets_parallel(sample_file, sheets=[2, "Test Sheet 1"], workers=2, order=ORDER_COMPLETED)
+    tables = [e.name for e in stream if isinstance(e, events.StartTable)]
+    assert sorted(tables) == ["Test Sheet 1", "Test Sheet 3"]
+
+    with pytest.raises(ValueError):
+        parse_sheets_parallel(sample_file, order="random")
+
+
+def test_metadata_fields(sample_file):
+    full = [e for e in parse_sheets(str(sample_file)) if isinstance(e, events.Cell)]
+
+    values_only = [e for e in parse_sheets(str(sample_file), metadata=()) if isinstance(e, events.Cell)]
+    assert [(e.value, e.column_index) for e in values_only] == [(e.value, e.column_index) for e in full]
+    assert values_only[0].get("excel_type") is None
+    assert values_only[0].get("excel_location") is None
+
+    located = [e for e in parse_sheets(str(sample_file), metadata=["excel_location"]) if isinstance(e, events.Cell)]
+    assert [e.excel_location for e in located if e.value is not None] == \
+           [e.excel_location for e in full if e.value is not None]
+
+    typed = [e for e in parse_sheets(str(sample_file), metadata=["excel_type"]) if isinstance(e, events.Cell)]
+    assert [e.excel_type for e in typed] == [e.excel_type for e in full]
+    assert typed[0].get("excel_number_format") is None
+
+
+def test_metadata_from_workbook(sample_workbook):
+    cells = [e for e in parse_sheets(sample_workbook, metadata=["excel_location"]) if isinstance(e, events.Cell)]
+    assert cells[601].value == "R1C1"
+    assert cells[601].excel_location == "B2"
+
+
+def test_unknown_metadata_field(sample_file):
+    with pytest.raises(ValueError):
+        parse_sheets(str(sample_file), metadata=["colour"])
+
+
+@pytest.fixture
+def padded_file(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["a", "b"])
+    ws.append([])
+    ws.append(["c", None, "d"])
+    # Formatted but empty cells, after the data
+    ws.cell(row=3, column=8).number_format = "0.00"
+    ws.cell(row=40, column=2).number_format = "0.00"
+    filename = tmp_path / "padded.xlsx"
+    wb.save(filename)
+
+    # Declare far more rows and columns than the sheet holds
+    with zipfile.ZipFile(filename) as archive:
+        parts = {name: archive.read(name) for name in archive.namelist()}
+    sheet = parts["xl/worksheets/sheet1.xml"].decode()
+    parts["xl/worksheets/sheet1.xml"] = re.sub(r'<dimension ref="[^"]*"', '<dimension ref="A1:Z500"', sheet).encode()
+    with zipfile.ZipFile(filename, "w") as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+    return filename
+
+
+def _rows(stream):
+    rows = []
+    for event in stream:
+        if isinstance(event, events.StartRow):
+            rows.append([event.row_index])
+        elif isinstance(event, events.Cell):
+            rows[-1].append(event.value)
+    return rows
+
+
+@pytest.mark.parametrize("metadata", [(), ("excel_location",), ("excel_type",)])
+def test_trim(padded_file, metadata):
+    rows = _rows(parse_sheets(str(padded_file), metadata=metadata))
+    assert len(rows) == 40
+    assert all(len(row) == 27 for row in rows)
+
+    rows = _rows(parse_sheets(str(padded_file), metadata=metadata, trim=True))
+    assert rows == [[0, "a", "b"], [1], [2, "c", None, "d"]]
+
+
+def test_trim_workbook(padded_file):
+    wb = load_workbook(padded_file)
+    assert _rows(parse_sheets(wb, trim=True)) == [[0, "a", "b"], [1], [2, "c", None, "d"]]
+
+
+def _tables(stream):
+    tables = {}
+    for event in stream:
+        if isinstance(event, events.StartTable):
+            rows = tables[event.name] = []
+        elif isinstance(event, events.StartRow):
+            rows.append([event.row_index])
+        elif isinstance(event, events.Cell):
+            rows[-1].append((event.column_index, event.value, event.get("excel_location")))
+    return tables
+
+
+@pytest.mark.parametrize("metadata", [(), ("excel_location",), ("excel_type", "excel_location")])
+def test_select_sheets_rows_and_columns(sample_file, metadata):
+    stream = parse_sheets(str(sample_file), metadata=metadata, sheets=[2, "Test Sheet 2"], rows=range(1, 6, 2),
+                          columns=[3, 1])
+    tables = _tables(stream)
+    assert list(tables) == ["Test Sheet 3", "Test Sheet 2"]
+
+    def _location(coordinate, empty=False):
+        # Derived locations are given for empty cells too, openpyxl's empty cells have none
+        if "excel_location" not in metadata or (empty and "excel_type" in metadata):
+            return None
+        return coordinate
+
+    assert tables["Test Sheet 2"][0] == [1, (3, "R1C3", _location("D2")), (1, "R1C1", _location("B2"))]
+    assert tables["Test Sheet 3"] == [
+        [1, (3, "R1C3", _location("D2")), (1, "R1C1", _location("B2"))],
+        [3, (3, "R3C3", _location("D4")), (1, "R3C1", _location("B4"))],
+        [5, (3, None, _location("D6", empty=True)), (1, None, _location("B6", empty=True))],
+    ]
+
+
+def test_select_rows_from_workbook(sample_workbook):
+    tables = _tables(parse_sheets(sample_workbook, metadata=(), sheets=["Test Sheet 3"], rows=2, columns=[0]))
+    assert tables == {"Test Sheet 3": [[0, (0, "R0C0", None)], [1, (0, "R1C0", None)]]}
+
+
+@pytest.mark.parametrize("rows", [0, range(0), range(3, 3)])
+def test_select_no_rows(sample_workbook, rows):
+    tables = _tables(parse_sheets(sample_workbook, sheets=["Test Sheet 3"], rows=rows))
+    assert tables == {"Test Sheet 3": []}
+
+
+def test_select_past_the_end_of_workbook():
+    wb = Workbook()
+    ws = wb.active
+    for row in range(5):
+        ws.append([f"R{row}C0", f"R{row}C1"])
+
+    tables = _tables(parse_sheets(ws, metadata=(), rows=10, columns=[0, 5]))
+    assert tables == {"Sheet": [[row, (0, f"R{row}C0", None)] for row in range(5)]}
+    assert _tables(parse_sheets(ws, rows=range(7, 10))) == {"Sheet": []}
+    assert _tables(parse_sheets(ws, rows=2, columns=[4])) == {"Sheet": [[0], [1]]}
+    assert ws.dimensions == "A1:B5"
+
+
+def test_select_with_trim(padded_file):
+    rows = _rows(parse_sheets(str(padded_file), trim=True, rows=range(1, 100), columns=[2, 7]))
+    assert rows == [[1], [2, "d"]]
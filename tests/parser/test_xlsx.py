@@ -0,0 +1,146 @@
+import datetime
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+from openpyxl import Workbook
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.parser.openpyxl import parse_sheets
+from sfdata_stream_parser.parser.xlsx import parse_xlsx
+
+
+@pytest.fixture
+def sample_file():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Types"
+    ws.append(["text", 1, 2.5, True, None, datetime.datetime(2020, 1, 2, 3, 4), datetime.date(1999, 12, 31)])
+    ws.append(["=SUM(B1:C1)", -3, 1e20, False, "", datetime.time(12, 30), datetime.timedelta(hours=5)])
+    ws["B3"] = 0.125
+    ws["B3"].number_format = "0.00%"
+    ws["C3"] = 1234.5
+    ws["C3"].number_format = "#,##0.000 \"units\""
+    ws["E6"] = "after a gap"
+    ws["A8"] = "#N/A"
+    ws["A8"].data_type = "e"
+
+    ws = wb.create_sheet("Second")
+    for row in range(30):
+        ws.append([f"R{row}C{col}" if (row + col) % 4 else None for col in range(12)])
+
+    wb.create_sheet("Empty")
+
+    with TemporaryDirectory() as temp_folder:
+        filename = Path(temp_folder) / "sample.xlsx"
+        wb.save(filename)
+        yield filename
+
+
+def _as_tuples(stream):
+    return [(type(e).__name__, e.as_dict()) for e in stream]
+
+
+def test_matches_parse_sheets(sample_file):
+    expected = _as_tuples(parse_sheets(str(sample_file)))
+    assert _as_tuples(parse_xlsx(str(sample_file))) == expected
+
+
+def test_from_stream(sample_file):
+    with open(sample_file, "rb") as f:
+        stream = list(parse_xlsx(f))
+    assert stream[0].name == str(sample_file)
+    assert [e.name for e in stream if isinstance(e, events.StartTable)] == ["Types", "Second", "Empty"]
+
+    cells = [e for e in stream if isinstance(e, events.Cell)]
+    assert cells[0].value == "text"
+    assert cells[0].excel_location == "A1"
+    assert cells[5].value == datetime.datetime(2020, 1, 2, 3, 4)
+    assert cells[5].excel_type == "d"
+
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+  xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+  <workbookPr date1904="1"/>
+  <sheets><sheet name="Raw" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+    Target="worksheets/sheet1.xml"/>
+  <Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+    Target="/xl/sharedStrings.xml"/>
+  <Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+    Target="styles.xml"/>
+</Relationships>"""
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+  <Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+  <Default Extension="xml" ContentType="application/xml"/>
+  <Override PartName="/xl/workbook.xml"
+    ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+  <Override PartName="/xl/worksheets/sheet1.xml"
+    ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+  <Override PartName="/xl/sharedStrings.xml"
+    ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+  <Override PartName="/xl/styles.xml"
+    ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+    Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_SHARED_STRINGS = """<?xml version="1.0" encoding="UTF-8"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+  <si><t>plain</t></si>
+  <si><r><t>rich </t></r><r><rPr><b/></rPr><t>text</t></r></si>
+  <si><t>escaped_x005F_x0041_</t></si>
+</sst>"""
+
+_STYLES = """<?xml version="1.0" encoding="UTF-8"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+  <numFmts><numFmt numFmtId="170" formatCode="dd/mm/yyyy"/><numFmt numFmtId="171" formatCode="0.0000"/></numFmts>
+  <cellXfs>
+    <xf numFmtId="0"/><xf numFmtId="170"/><xf numFmtId="171"/><xf numFmtId="14"/><xf numFmtId="10"/>
+  </cellXfs>
+</styleSheet>"""
+
+_SHEET = """<?xml version="1.0" encoding="UTF-8"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+  <sheetData>
+    <row r="2"><c r="B2" t="s"><v>0</v></c><c t="s"><v>1</v></c><c r="E2" t="s"><v>2</v></c></row>
+    <row><c s="1"><v>40000</v></c><c s="2"><v>1.5</v></c><c s="3"><v>100</v></c><c s="4"><v>0.25</v></c></row>
+    <row r="6"><c r="A6" t="b"><v>1</v></c><c r="B6" t="e"><v>#DIV/0!</v></c><c r="C6" t="str"><v>f</v></c></row>
+    <row r="7"/>
+  </sheetData>
+</worksheet>"""
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    filename = tmp_path / "raw.xlsx"
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _WORKBOOK)
+        archive.writestr("xl/_rels/workbook.xml.rels", _RELS)
+        archive.writestr("xl/sharedStrings.xml", _SHARED_STRINGS)
+        archive.writestr("xl/styles.xml", _STYLES)
+        archive.writestr("xl/worksheets/sheet1.xml", _SHEET)
+    return filename
+
+
+@pytest.mark.filterwarnings("ignore:Workbook contains no default style")
+def test_shared_strings_and_styles(raw_file):
+    expected = _as_tuples(parse_sheets(str(raw_file)))
+    assert _as_tuples(parse_xlsx(str(raw_file))) == expected
+
+    values = [e.value for e in parse_xlsx(raw_file) if isinstance(e, events.Cell) and e.value is not None]
+    assert values[:3] == ["plain", "rich text", "escaped_x0041_"]
@@ -1,8 +1,13 @@
+import asyncio
 from io import StringIO
 from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+
+import pytest
 
 from sfdata_stream_parser.events import StartElement, EndElement, TextNode, CommentNode, ProcessingInstructionNode
-from sfdata_stream_parser.parser.xml import parse
+from sfdata_stream_parser.parser.xml import parse, parse_async, XmlFeedParser, ENGINE_EXPAT, ENGINE_PULLDOM
+from sfdata_stream_parser.stream import skip_subtree
 
 
 def test_parse_xml():
@@ -79,3 +84,216 @@ def test_attach_node():
 
     for e in start_events:
         assert isinstance(e.node, minidom.Element)
+
+
+def test_select_rows():
+    xml = '<root><r id="0"><v>a</v></r><r id="1"><v>b</v></r>\n<r id="2"/><r id="3"/><r id="4"/></root>'
+    stream = list(parse(StringIO(xml), rows=range(1, 4, 2)))
+    assert [(type(e).__name__, e.get('tag'), e.get('attrib')) for e in stream] == [
+        ('StartElement', 'root', {}),
+        ('StartElement', 'r', {'id': '1'}),
+        ('StartElement', 'v', {}),
+        ('TextNode', None, None),
+        ('EndElement', 'v', None),
+        ('EndElement', 'r', None),
+        ('TextNode', None, None),
+        ('StartElement', 'r', {'id': '3'}),
+        ('EndElement', 'r', None),
+        ('EndElement', 'root', None),
+    ]
+
+
+@pytest.mark.parametrize("engine", [ENGINE_EXPAT, ENGINE_PULLDOM])
+def test_select_rows_element_id(engine):
+    stream = list(parse(StringIO('<a><b/><c/><d/></a>'), rows=1, element_id=True, engine=engine))
+    assert [(type(e).__name__, e.tag) for e in stream] == [
+        ('StartElement', 'a'), ('StartElement', 'b'), ('EndElement', 'b'), ('EndElement', 'a')]
+    # The root closed after the last row has the id of its start
+    assert stream[0].id == stream[-1].id != stream[1].id == stream[2].id
+
+
+def test_select_rows_stops_reading(tmp_path):
+    # Everything after the rows selected is not read, even if it is not well-formed
+    filename = tmp_path / "test.xml"
+    filename.write_text('<root><r/><r>x</r>' + '<r/>' * 10000 + '<broken></root>')
+    stream = list(parse(str(filename), rows=2))
+    assert [(type(e).__name__, e.get('tag')) for e in stream][-3:] == [
+        ('TextNode', None), ('EndElement', 'r'), ('EndElement', 'root')]
+
+
+_TRICKY_XML = (
+    '<?xml version="1.0"?><?pi before?><!DOCTYPE a [<!ENTITY e "ent">]><!-- c -->\n'
+    '<a x="1" y="&amp;"><![CDATA[cd<]]>&e;&#65;\n<b:c xmlns:b="u">t<!-- d -->u</b:c>\n<?pi inside?></a><?pi after?>\n'
+)
+
+
+@pytest.mark.parametrize("coalesce", [True, False])
+@pytest.mark.parametrize("rows", [None, 1])
+def test_expat_matches_pulldom(coalesce, rows):
+    def _parse(engine):
+        stream = parse(StringIO(_TRICKY_XML), coalesce=coalesce, rows=rows, engine=engine)
+        return [(type(event), event.as_dict()) for event in stream]
+
+    assert _parse(ENGINE_EXPAT) == _parse(ENGINE_PULLDOM)
+
+
+def test_expat_from_path(tmp_path):
+    filename = tmp_path / "test.xml"
+    filename.write_bytes('<a>ünïcödé</a>'.encode('utf-8'))
+    assert [e.get('text') for e in parse(str(filename))] == [None, 'ünïcödé', None]
+    assert [e.get('text') for e in parse(filename.open('rb'), bufsize=3)] == [None, 'ünïcödé', None]
+
+
+def test_comments():
+    stream = parse(StringIO('<a>b<!-- yeah -->c</a>'), comments=True)
+    assert [(type(event), event.as_dict()) for event in stream] == [
+        (StartElement, {'tag': 'a', 'attrib': {}}),
+        (TextNode, {'text': 'b'}),
+        (CommentNode, {'text': ' yeah '}),
+        (TextNode, {'text': 'c'}),
+        (EndElement, {'tag': 'a'}),
+    ]
+
+
+def test_engine_arguments():
+    with pytest.raises(ValueError):
+        parse(StringIO('<a/>'), engine=ENGINE_EXPAT, attach_node=True)
+    with pytest.raises(ValueError):
+        parse(StringIO('<a/>'), engine=ENGINE_PULLDOM, comments=True)
+    with pytest.raises(ValueError):
+        parse(StringIO('<a/>'), engine='sax')
+
+
+_MESSAGE = (
+    '<Message><Header><Source>LA</Source></Header>'
+    '<Children>'
+    '<Child><Id>1</Id><Episodes><Episode><Start>a</Start></Episode><Episode><Start>b</Start></Episode></Episodes></Child>'
+    '<Child><Id>2</Id><Episodes><Episode><Start>c</Start></Episode></Episodes></Child>'
+    '</Children></Message>'
+)
+
+
+def _summary(stream):
+    return [(type(e).__name__[0], e.get('tag') or e.get('text')) for e in stream]
+
+
+def test_paths():
+    stream = parse(StringIO(_MESSAGE), paths=['/Message/Children/Child/Episodes/Episode'])
+    assert _summary(stream) == [
+        ('S', 'Episode'), ('S', 'Start'), ('T', 'a'), ('E', 'Start'), ('E', 'Episode'),
+        ('S', 'Episode'), ('S', 'Start'), ('T', 'b'), ('E', 'Start'), ('E', 'Episode'),
+        ('S', 'Episode'), ('S', 'Start'), ('T', 'c'), ('E', 'Start'), ('E', 'Episode'),
+    ]
+
+
+def test_paths_with_ancestors():
+    stream = parse(StringIO(_MESSAGE), paths=['/Message/Children/*/Id', '/Message/Header'], ancestors=True)
+    assert _summary(stream) == [
+        ('S', 'Message'),
+        ('S', 'Header'), ('S', 'Source'), ('T', 'LA'), ('E', 'Source'), ('E', 'Header'),
+        ('S', 'Children'),
+        ('S', 'Child'), ('S', 'Id'), ('T', '1'), ('E', 'Id'), ('E', 'Child'),
+        ('S', 'Child'), ('S', 'Id'), ('T', '2'), ('E', 'Id'), ('E', 'Child'),
+        ('E', 'Children'),
+        ('E', 'Message'),
+    ]
+
+
+def test_relative_paths():
+    stream = parse(StringIO(_MESSAGE), paths=['Episode/Start'])
+    assert [e.text for e in stream if isinstance(e, TextNode)] == ['a', 'b', 'c']
+
+
+def test_paths_and_rows():
+    stream = parse(StringIO('<a><b><c>1</c></b><b><c>2</c></b><b><c>3</c></b></a>'), paths=['/a/b/c'],
+                   rows=range(1, 2), ancestors=True)
+    assert _summary(stream) == [('S', 'a'), ('S', 'b'), ('S', 'c'), ('T', '2'), ('E', 'c'), ('E', 'b'), ('E', 'a')]
+
+
+@pytest.mark.parametrize("path", ["", "/", "/a//b", "a/"])
+def test_invalid_paths(path):
+    with pytest.raises(ValueError):
+        list(parse(StringIO('<a/>'), paths=[path]))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+@pytest.mark.parametrize("options", [{}, {'rows': 1}, {'paths': ['Child/Id'], 'ancestors': True}])
+def test_feed_parser(chunk_size, options):
+    expected = [(type(e), e.as_dict()) for e in parse(StringIO(_MESSAGE), **options)]
+
+    data = _MESSAGE.encode('utf-8')
+    parser = XmlFeedParser(**options)
+    stream = []
+    for start in range(0, len(data), chunk_size):
+        stream += parser.feed(data[start:start + chunk_size])
+    stream += parser.close()
+    assert [(type(e), e.as_dict()) for e in stream] == expected
+
+
+def test_feed_parser_incomplete():
+    parser = XmlFeedParser()
+    assert [e.tag for e in parser.feed(b'<a><b>')] == ['a', 'b']
+    assert parser.feed(b'text') == []
+    with pytest.raises(ExpatError):
+        parser.close()
+
+
+def test_parse_async():
+    async def _chunks():
+        for start in range(0, len(_MESSAGE), 10):
+            yield _MESSAGE[start:start + 10].encode()
+
+    async def _collect(**options):
+        return [(type(e), e.as_dict()) async for e in parse_async(_chunks(), **options)]
+
+    for options in [{}, {'rows': 1}, {'paths': ['Child/Id']}]:
+        expected = [(type(e), e.as_dict()) for e in parse(StringIO(_MESSAGE), **options)]
+        assert asyncio.run(_collect(chunk_size=4, **options)) == expected
+
+
+def _skipping(stream, tags):
+    """
+    The events of stream, with the elements whose tag is in tags skipped after their StartElement. The element ids
+    are checked to pair up, and left out, as the parser does not number the elements it skips.
+    """
+    output = []
+    open_ids = []
+    for event in stream:
+        details = event.as_dict()
+        if 'id' in details:
+            element = details.pop('id')
+            if isinstance(event, StartElement):
+                open_ids.append(element)
+            elif isinstance(event, EndElement):
+                assert open_ids.pop() == element
+        output.append((type(event), details))
+        if isinstance(event, StartElement) and event.tag in tags:
+            skip_subtree(stream)
+            if open_ids:
+                open_ids.pop()
+    return output
+
+
+@pytest.mark.parametrize("bufsize", [1, 5, 1 << 16])
+@pytest.mark.parametrize("options, tags", [
+    ({}, {'Episodes', 'Header'}),
+    ({'element_id': True}, {'Episode', 'Id'}),
+    ({'paths': ['/Message/Children/Child/Episodes'], 'ancestors': True}, {'Child'}),
+    ({'paths': ['Child'], 'ancestors': True}, {'Episodes'}),
+    ({'paths': ['Episodes/Episode'], 'ancestors': True}, {'Children'}),
+    ({'paths': ['Child/Episodes']}, {'Episodes'}),
+    ({'paths': ['Episodes']}, {'Start'}),
+])
+def test_skip_subtree(bufsize, options, tags):
+    events = list(parse(StringIO(_MESSAGE), **options))
+    expected = _skipping(iter(events), tags)
+    assert len(expected) < len(events)
+    assert _skipping(parse(StringIO(_MESSAGE), bufsize=bufsize, **options), tags) == expected
+
+
+def test_skip_subtree_nested():
+    stream = parse(StringIO('<a><b><b><c/></b><c/></b><c>1</c></a>'), bufsize=3)
+    assert next(stream).tag == 'a'
+    assert next(stream).tag == 'b'
+    skip_subtree(stream)
+    assert _summary(stream) == [('S', 'c'), ('T', '1'), ('E', 'c'), ('E', 'a')]
@@ -0,0 +1,165 @@
+import asyncio
+import io
+
+import pytest
+
+from sfdata_stream_parser import aio, events
+from sfdata_stream_parser.checks import type_check
+from sfdata_stream_parser.collectors import collector, block_check
+from sfdata_stream_parser.filters.generic import filter_stream, pass_event
+from sfdata_stream_parser.parser.csv import parse_csv, parse_csv_async
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        await asyncio.sleep(0)
+        yield data[start:start + size]
+
+
+async def _collect(stream):
+    return [event async for event in stream]
+
+
+def _run(stream):
+    return asyncio.run(_collect(stream))
+
+
+def _summary(stream):
+    return [(type(e).__name__, e.get('value')) for e in stream]
+
+
+_CSV = "a,b\n1,\n3,4\n"
+
+
+def _strip(event):
+    if event.value:
+        return events.Cell.from_event(event, value=event.value.strip())
+
+
+def _sync_stream():
+    return parse_csv(io.StringIO(_CSV))
+
+
+def test_filter_stream_matches_sync():
+    expected = _summary(filter_stream(_sync_stream(), check=type_check(events.Cell), pass_function=_strip,
+                                      fail_function=pass_event))
+    stream = aio.filter_stream(parse_csv_async(_chunks(_CSV.encode(), 3)), check=type_check(events.Cell),
+                               pass_function=_strip, fail_function=pass_event)
+    assert _summary(_run(stream)) == expected
+
+
+def test_coroutine_functions():
+    async def _lookup(event):
+        await asyncio.sleep(0)
+        return events.Cell.from_event(event, value=f"<{event.value}>")
+
+    stream = aio.filter_stream(_sync_stream(), check=type_check(events.Cell), pass_function=_lookup,
+                               fail_function=pass_event)
+    assert [e.value for e in _run(stream) if isinstance(e, events.Cell)] == ["<a>", "<b>", "<1>", "<>", "<3>", "<4>"]
+
+
+def test_streamfilter_and_errors():
+    @aio.streamfilter(check=type_check(events.Cell), fail_function=pass_event,
+                      error_function=lambda event, exception: events.Cell.from_event(event, error=str(exception)))
+    def _to_int(event, base=10):
+        return events.Cell.from_event(event, value=int(event.value, base))
+
+    cells = [e for e in _run(_to_int(_sync_stream(), base=16)) if isinstance(e, events.Cell)]
+    assert [c.value for c in cells] == [10, 11, 1, "", 3, 4]
+    assert cells[3].error.startswith("invalid literal")
+
+
+def test_collector_matches_sync():
+    def _count_cells(stream):
+        cells = [event for event in stream if isinstance(event, events.Cell)]
+        yield events.StartRow(cells=len(cells))
+
+    async def _count_cells_async(stream):
+        cells = [event async for event in stream if isinstance(event, events.Cell)]
+        yield events.StartRow(cells=len(cells))
+
+    sync = collector(check=block_check(events.StartRow), receive_stream=True)(_count_cells)
+    asynchronous = aio.collector(check=block_check(events.StartRow), receive_stream=True)(_count_cells_async)
+    expected = [(type(e), e.as_dict()) for e in sync(_sync_stream())]
+    assert [(type(e), e.as_dict()) for e in _run(asynchronous(_sync_stream()))] == expected
+
+
+def test_collector_per_event():
+    @aio.collector(check=block_check(events.StartRow), iterations=1)
+    def _mark(event, first_event, last_event):
+        return event.from_event(event, first=first_event, last=last_event)
+
+    stream = _run(_mark(_sync_stream()))
+    marked = [(type(e).__name__, e.get('first'), e.get('last')) for e in stream]
+    assert marked[2:6] == [("StartRow", True, False), ("Cell", False, False), ("Cell", False, False),
+                           ("EndRow", False, True)]
+    assert marked[6] == ("StartRow", None, None)
+
+
+def test_parsers_interleave():
+    order = []
+
+    async def _parse(name):
+        async for event in parse_csv_async(_chunks(_CSV.encode() * 3, 4), name=name, chunk_size=2):
+            if isinstance(event, events.StartRow):
+                order.append(name)
+
+    async def _main():
+        await asyncio.gather(_parse("first"), _parse("second"))
+
+    asyncio.run(_main())
+    assert order.count("first") == order.count("second") == 9
+    assert order != sorted(order)
+
+
+def test_read_chunks_from_reader():
+    async def _main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"x" * 10)
+        reader.feed_eof()
+        return [chunk async for chunk in aio.read_chunks(reader, 4)]
+
+    assert asyncio.run(_main()) == [b"xxxx", b"xxxx", b"xx"]
+
+
+def test_concurrent_filter_keeps_order():
+    running = []
+    peak = []
+
+    async def _lookup(event):
+        running.append(event)
+        peak.append(len(running))
+        # Later cells finish first
+        await asyncio.sleep(0.001 * (10 - event.column_index))
+        running.remove(event)
+        if event.value == "boom":
+            raise ValueError(event.value)
+        return events.Cell.from_event(event, value=event.value.upper())
+
+    def _error(event, exception):
+        return events.Cell.from_event(event, error=str(exception))
+
+    source = ",".join(f"v{ix}" if ix != 4 else "boom" for ix in range(10)) + "\n"
+    stream = aio.filter_stream(parse_csv(io.StringIO(source)), check=type_check(events.Cell), pass_function=_lookup,
+                               fail_function=pass_event, error_function=_error, concurrency=3, window=4)
+    cells = [e for e in _run(stream) if isinstance(e, events.Cell)]
+
+    assert [c.column_index for c in cells] == list(range(10))
+    assert [c.value for c in cells[:4]] == ["V0", "V1", "V2", "V3"]
+    assert cells[4].error == "boom"
+    assert max(peak) == 3
+
+
+def test_concurrent_filter_arguments():
+    with pytest.raises(ValueError):
+        aio.filter_stream([], concurrency=0)
+    with pytest.raises(ValueError):
+        aio.filter_stream([], concurrency=4, window=2)
+
+    @aio.streamfilter(check=type_check(events.Cell), fail_function=pass_event, concurrency=2)
+    async def _upper(event):
+        return events.Cell.from_event(event, value=event.value.upper())
+
+    assert _summary(_run(_upper(_sync_stream()))) == _summary(
+        filter_stream(_sync_stream(), check=type_check(events.Cell), fail_function=pass_event,
+                      pass_function=lambda event: events.Cell.from_event(event, value=event.value.upper())))
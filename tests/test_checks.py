@@ -1,7 +1,9 @@
 from unittest.mock import MagicMock
 
+import pytest
+
 from sfdata_stream_parser import events
-from sfdata_stream_parser.checks import type_check, and_check, or_check
+from sfdata_stream_parser.checks import type_check, and_check, or_check, not_check, property_check
 
 
 def test_type_check_single():
@@ -108,4 +110,115 @@ def test_or_check():
 
     c1.assert_called_with(ev)
     assert c1.call_count == 6
-    c2.assert_called_once_with(ev)
\ No newline at end of file
+    c2.assert_called_once_with(ev)
+
+
+def test_not_check():
+    check = not_check(type_check(events.StartRow))
+    assert not check(events.StartRow())
+    assert check(events.EndRow())
+
+    c1 = MagicMock(return_value=True)
+    check = not_check(c1)
+    assert not check(events.StartRow())
+    c1.assert_called_once()
+
+
+def test_property_check():
+    check = property_check(value='a', column_index=1)
+    assert check(events.Cell(value='a', column_index=1))
+    assert not check(events.Cell(value='a', column_index=2))
+    assert not check(events.Cell(value='b', column_index=1))
+    assert not check(events.Cell(value='a'))
+
+    assert property_check(value=None)(events.Cell())
+    assert property_check()(events.Cell())
+
+
+@pytest.mark.parametrize("lookup, value, matches, fails", [
+    ('exact', 'foo', ['foo'], ['Foo', None]),
+    ('iexact', 'FOO', ['foo', 'Foo'], ['food', None]),
+    ('contains', 'oo', ['foo', 'oo'], ['OO', 'f', None]),
+    ('icontains', 'OO', ['foo', 'fOo'], ['f', None]),
+    ('in', ['a', 'b'], ['a', 'b'], ['c', None]),
+    ('in', [['a'], 'b'], ['b', ['a']], ['c']),
+    ('gt', 18, [19, 20.5], [18, 2, None]),
+    ('gte', 18, [18, 19], [17, None]),
+    ('lt', 18, [17, -1], [18, None]),
+    ('lte', 18, [18, 17], [19, None]),
+    ('startswith', 'fo', ['foo'], ['afoo', 'Foo', None]),
+    ('istartswith', 'FO', ['foo', 'Foo'], ['afoo', None]),
+    ('endswith', 'oo', ['foo'], ['fooa', 'fOO', None]),
+    ('iendswith', 'OO', ['foo', 'fOO'], ['fooa', None]),
+    ('isnull', True, [None], ['', 0]),
+    ('isnull', False, ['', 0], [None]),
+    ('regex', r'^\d+$', ['123', 123], ['12a', None]),
+    ('iregex', r'^a+$', ['aA'], ['ab', None]),
+])
+def test_property_check_lookups(lookup, value, matches, fails):
+    check = property_check(**{f'value__{lookup}': value})
+    for match in matches:
+        assert check(events.Cell(value=match)), match
+    for fail in fails:
+        assert not check(events.Cell(value=fail)), fail
+
+
+def test_property_check_lookup_names():
+    # Only a known lookup at the end of the name is treated as one
+    check = property_check(excel__sheet='Sheet1', excel__sheet__icontains='SHEET')
+    assert check(events.Cell(excel__sheet='Sheet1'))
+    assert not check(events.Cell(excel__sheet='sheet1'))
+
+    # Several lookups on the same property
+    check = property_check(value__gte=1, value__lt=10)
+    assert [check(events.Cell(value=v)) for v in (0, 1, 9, 10, None)] == [False, True, True, False, False]
+
+    assert not property_check(value__in=[])(events.Cell(value=1))
+
+
+def test_property_check_unhashable_in():
+    check = property_check(value__in=[1, [2, 3]])
+    assert check(events.Cell(value=1))
+    assert check(events.Cell(value=[2, 3]))
+    assert not check(events.Cell(value=[1]))
+    assert not check(events.Cell(value={}))
+    assert not property_check(value__in=(1, 2))(events.Cell(value=[1]))
+
+    # Only unhashable values to look for
+    assert property_check(value__in=[[1, 2]])(events.Cell(value=[1, 2]))
+
+    # Values that are hashable types but can't be hashed
+    check = property_check(value__in=[1, (2, [3])])
+    assert check(events.Cell(value=(2, [3])))
+    assert not check(events.Cell(value=(1, [2])))
+
+
+def test_property_check_incomparable_values():
+    check = property_check(age__gt=18)
+    assert check(events.Cell(age=19))
+    assert not check(events.Cell(age='19'))
+    assert not check(events.Cell(age=None))
+    assert not_check(property_check(age__lte=18))(events.Cell(age='7'))
+
+
+def test_nested_checks():
+    check = and_check(
+        or_check(type_check(events.Cell), type_check(events.StartRow)),
+        not_check(property_check(value__isnull=True)),
+        or_check(property_check(value__startswith='x'), property_check(value__gt=5)),
+    )
+    assert check(events.Cell(value=6))
+    assert check(events.StartRow(value='xyz'))
+    assert not check(events.Cell(value=5))
+    assert not check(events.Cell())
+    assert not check(events.EndRow(value=6))
+
+
+def test_checks_are_flattened():
+    check = or_check(type_check(events.Cell), or_check(type_check(events.StartRow), type_check(events.Cell)))
+    assert check.__check_expr__.types == (events.Cell, events.StartRow)
+
+    assert and_check(type_check(events.Cell), type_check(permissive=True)).__check_expr__.types == (events.Cell,)
+    assert and_check(type_check(events.Cell), type_check()).__check_expr__.value is False
+    assert or_check(property_check(value=1), type_check(permissive=True)).__check_expr__.value is True
+    assert not_check(not_check(type_check(events.Cell))).__check_expr__.types == (events.Cell,)
@@ -3,7 +3,7 @@ from typing import Iterable, Generator
 from unittest.mock import MagicMock
 
 from sfdata_stream_parser.checks import property_check
-from sfdata_stream_parser.collectors import collector, collector_check, block_check
+from sfdata_stream_parser.collectors import collector, collector_check, block_check, xml_collector
 from sfdata_stream_parser import events
 
 
@@ -258,3 +258,49 @@ def test_class_collector():
     stream = list(stream)
 
     assert c.first_seen_events == 5
+
+
+def test_collector_block_ends_with_stream():
+    @collector(check=collector_check(property_check(value='a'), property_check(value='e')))
+    def tester(event, last_event):
+        yield event.from_event(event, last_event=last_event)
+
+    stream = tester(_get_events('nabc'))
+    assert [(e.value, e.get('last_event')) for e in stream] == [('n', None), ('a', False), ('b', False), ('c', True)]
+
+
+def test_collector_stream_peek():
+    seen = []
+
+    @collector(check=collector_check(property_check(value='a'), property_check(value='c')), receive_stream=True)
+    def tester(stream):
+        while stream:
+            seen.append(stream.peek().value)
+            yield next(stream)
+        assert stream.peek(None) is None
+
+    stream = tester(_get_events('nabcn'))
+    assert ''.join(e.value for e in stream) == 'nabcn'
+    assert seen == ['a', 'b', 'c']
+
+
+def test_collector_stream_left_unread():
+    @collector(check=collector_check(property_check(value='a'), property_check(value='c')), receive_stream=True)
+    def tester(stream):
+        yield next(stream).from_event(next(stream), value='A')
+
+    # The rest of the block is read by the collector as if it had not been collected
+    stream = tester(_get_events('nabcnabc'))
+    assert ''.join(e.value for e in stream) == 'nAcnAc'
+
+
+def test_xml_collector_nested():
+    @xml_collector
+    def tags(stream):
+        return [e.tag for e in stream if isinstance(e, events.StartElement)]
+
+    stream = iter([events.StartElement(tag='a'), events.StartElement(tag='a'), events.EndElement(tag='a'),
+                   events.StartElement(tag='b'), events.EndElement(tag='b'), events.EndElement(tag='a'),
+                   events.StartElement(tag='c')])
+    assert tags(stream) == ['a', 'a', 'b']
+    assert next(stream).tag == 'c'
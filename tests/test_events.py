@@ -1,3 +1,8 @@
+import pickle
+import weakref
+
+import pytest
+
 from sfdata_stream_parser import events
 
 
@@ -17,3 +22,180 @@ def test_event_clone():
     assert cloned_cell.value == "A new value"
     assert cloned_cell.source == cell
     assert cloned_cell.source.value == "Test Value"
+
+
+def test_event_core_and_extra_fields():
+    cell = events.Cell(value="Test Value", column_index=4, excel_type="s")
+    assert cell.value == "Test Value"
+    assert cell.excel_type == "s"
+    assert cell.get("column_index") == 4
+    assert cell.get("excel_type") == "s"
+    assert cell.get("missing", "default") == "default"
+
+    empty = events.Cell()
+    assert not hasattr(empty, "value")
+    assert not hasattr(empty, "source")
+    assert empty.get("value", "default") == "default"
+    assert empty.as_dict() == {}
+
+
+def test_event_slots():
+    cell = events.Cell(value="Test Value", column_index=4)
+    assert not hasattr(cell, "__dict__")
+    assert cell._extra is None
+
+
+def test_event_make():
+    cell = events.Cell._make("Test Value", 4)
+    assert cell == events.Cell(value="Test Value", column_index=4)
+    assert cell.get("source") is None and cell._extra is None
+
+    row = events.Row._make(1, ["a", "b"])
+    assert row.as_dict() == {"row_index": 1, "values": ["a", "b"]}
+
+
+def test_event_equality():
+    assert events.Cell(value=1, column_index=2) == events.Cell(value=1, column_index=2)
+    assert events.Cell(value=1, column_index=2) != events.Cell(value=1, column_index=3)
+    assert events.Cell(value=1, other="a") != events.Cell(value=1, other="b")
+
+
+def test_event_required_fields():
+    with pytest.raises(AssertionError, match="A tag property is required"):
+        events.StartElement(attrib={})
+
+    with pytest.raises(AssertionError, match="A text property is required"):
+        events.TextNode()
+
+
+def test_event_pickle():
+    cell = events.Cell(value="Test Value", column_index=4, context="extra")
+    cloned_cell = events.Cell.from_event(cell, value="A new value")
+
+    restored = pickle.loads(pickle.dumps(cloned_cell))
+    assert restored == cloned_cell
+    assert restored.source.value == "Test Value"
+
+
+def test_event_subclass():
+    class CustomEvent(events.ParseEvent):
+        __slots__ = ('custom',)
+
+    class CustomInitEvent(events.ParseEvent):
+        def __init__(self, headers):
+            super().__init__(headers=headers)
+
+    event = CustomEvent(custom=1, other=2)
+    assert event.as_dict() == {"custom": 1, "other": 2}
+
+    event = CustomInitEvent(["a", "b"])
+    assert event.headers == ["a", "b"]
+
+
+def test_provenance_full():
+    cell = events.Cell(value="Test Value", column_index=4)
+    derived = events.Cell.from_event(events.Cell.from_event(cell, value="First"), value="Second")
+    assert derived.source.value == "First"
+    assert derived.source.source is cell
+
+
+def test_provenance_parent_only():
+    cell = events.Cell(value="Test Value", column_index=4)
+    with events.provenance(events.PROVENANCE_PARENT):
+        first = events.Cell.from_event(cell, value="First")
+        second = events.Cell.from_event(first, value="Second")
+
+    assert first.source is cell
+    assert second.source == events.Cell(value="First", column_index=4)
+    assert second.source.get("source") is None
+
+
+def test_provenance_weakref():
+    cell = events.Cell(value="Test Value", column_index=4)
+    with events.provenance(events.PROVENANCE_WEAKREF):
+        derived = events.Cell.from_event(cell, value="A new value")
+
+    assert derived.source is cell
+    assert derived.as_dict()["source"] is cell
+
+    del cell
+    assert derived.get("source") is None
+    assert not hasattr(derived, "source")
+    assert pickle.loads(pickle.dumps(derived)).value == "A new value"
+
+
+def test_provenance_none():
+    cell = events.Cell(value="Test Value", column_index=4)
+    with events.provenance(events.PROVENANCE_NONE):
+        derived = events.Cell.from_event(events.Cell.from_event(cell, value="First"), value="Second")
+    assert derived.as_dict() == {"value": "Second", "column_index": 4}
+
+
+def test_provenance_global():
+    cell = events.Cell(value="Test Value")
+    events.set_provenance(events.PROVENANCE_NONE)
+    try:
+        assert events.get_provenance() == events.PROVENANCE_NONE
+        assert events.Cell.from_event(cell).get("source") is None
+    finally:
+        events.set_provenance(events.PROVENANCE_FULL)
+    assert events.Cell.from_event(cell).source is cell
+
+
+def test_provenance_unknown():
+    with pytest.raises(ValueError):
+        events.set_provenance("some")
+
+
+def test_from_event_overlay():
+    cell = events.Cell(value="Test Value", column_index=4, excel_type="s", excel_location="E1")
+    derived = events.Cell.from_event(cell, value="A new value", column_header="Header")
+    derived = events.Cell.from_event(derived, excel_type="n")
+
+    assert derived.value == "A new value"
+    assert derived.excel_type == "n"
+    assert derived.excel_location == "E1"
+    assert derived.get("column_header") == "Header"
+    assert derived.as_dict() == {
+        "value": "A new value",
+        "column_index": 4,
+        "excel_type": "n",
+        "excel_location": "E1",
+        "column_header": "Header",
+        "source": derived.source,
+    }
+
+    # The original is untouched
+    assert cell.as_dict() == {"value": "Test Value", "column_index": 4, "excel_type": "s", "excel_location": "E1"}
+
+
+def test_from_event_overlay_depth():
+    event = events.Cell(value=0)
+    for ix in range(50):
+        event = events.Cell.from_event(event, **{f"prop{ix}": ix})
+    assert event._extra.depth <= 8
+    assert event.prop0 == 0
+    assert event.prop49 == 49
+    assert len(event.as_dict()) == 52
+
+
+def test_from_event_does_not_keep_parent():
+    cell = events.Cell(value="Test Value", column_index=4, excel_type="s")
+    ref = weakref.ref(cell)
+    with events.provenance(events.PROVENANCE_NONE):
+        derived = events.Cell.from_event(cell, column_header="Header")
+    del cell
+    assert ref() is None
+    assert derived.excel_type == "s"
+
+
+def test_from_event_other_type():
+    start = events.StartElement(tag="a", attrib={}, extra="value")
+    end = events.EndElement.from_event(start)
+    assert end.as_dict() == {"tag": "a", "attrib": {}, "extra": "value", "source": start}
+
+    row = events.StartRow(row_index=3)
+    assert events.EndRow.from_event(row).row_index == 3
+
+    with pytest.raises(AssertionError, match="A tag property is required"):
+        events.StartElement.from_event(events.ParseEvent(value=1))
@@ -2,7 +2,7 @@ import types
 from functools import wraps
 
 from sfdata_stream_parser import events
-from sfdata_stream_parser.function_helpers import FunctionCaller
+from sfdata_stream_parser.function_helpers import FunctionCaller, call_plan, filter_caller
 
 
 def test_simple():
@@ -113,3 +113,67 @@ def test_pass_properties():
     next_event = next(stream)
     assert next_event.as_dict() == dict(value=source_event.value, prop1='VALUE1', prop3='VALUE3', prop5='value5',
                                         prop6='value6', source=source_event)
+
+
+def test_call_plan():
+    def my_filter(event, other, exception=None, *, option=1):
+        pass
+
+    plan = call_plan(my_filter)
+    assert plan.accepted == {'event', 'other', 'exception', 'option'}
+    assert plan.event_arg == 'event'
+    assert plan.exception_arg == 'exception'
+    assert plan.event_first
+    assert not plan.is_method
+
+    def my_error_handler(ex):
+        pass
+
+    plan = call_plan(my_error_handler)
+    assert plan.event_arg is None
+    assert plan.exception_arg == 'ex'
+
+
+def test_call_plan_cached():
+    def my_func(event):
+        pass
+
+    assert call_plan(my_func) is call_plan(my_func)
+
+    class MyClass:
+        def my_method(self, event):
+            pass
+
+    assert call_plan(MyClass().my_method) is call_plan(MyClass().my_method)
+    assert call_plan(MyClass().my_method).is_method
+
+
+def test_call_plan_bind():
+    def event_only(event):
+        return event
+
+    assert call_plan(event_only).bind(event_only) is event_only
+
+    def with_kwargs(evt, exc, prop1, prop2="default"):
+        return evt, exc, prop1, prop2
+
+    call = call_plan(with_kwargs).bind(with_kwargs, prop1="value1", unknown="ignored")
+    assert call("event") == ("event", None, "value1", "default")
+
+    call = call_plan(with_kwargs).bind(with_kwargs, with_exception=True, prop1="value1")
+    assert call("event", "exception") == ("event", "exception", "value1", "default")
+
+    def no_args():
+        return "called"
+
+    assert call_plan(no_args).bind(no_args)("event") == "called"
+
+
+def test_filter_caller():
+    def my_func(event, exception, prop1):
+        return event.from_event(event, exception=exception, prop1=prop1)
+
+    event = next(filter_caller(my_func, events.ParseEvent(value='hello'), prop1='value1', prop2='value2'))
+    assert event.value == 'hello'
+    assert event.exception is None
+    assert event.prop1 == 'value1'
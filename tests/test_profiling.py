@@ -0,0 +1,89 @@
+import io
+import json
+
+from sfdata_stream_parser import events
+from sfdata_stream_parser.checks import type_check
+from sfdata_stream_parser.collectors import collector, block_check
+from sfdata_stream_parser.filters.column_headers import promote_first_row
+from sfdata_stream_parser.filters.generic import streamfilter, pass_event
+from sfdata_stream_parser.parser.csv import parse_csv
+from sfdata_stream_parser.profiling import profile, REPORT_JSON
+
+
+@streamfilter(check=type_check(events.Cell), fail_function=pass_event)
+def _drop_blank(event):
+    if event.value:
+        return event
+
+
+def _pipeline():
+    return _drop_blank(parse_csv(io.StringIO("a,b\n1,\n3,4\n")))
+
+
+def test_not_profiled_by_default():
+    # Without a profiler the parser's own generator is returned
+    assert parse_csv(io.StringIO("")).gi_code.co_name != "_time_out"
+    assert len(list(_pipeline())) == 15
+
+
+def test_stage_counts():
+    with profile() as profiler:
+        stream = _pipeline()
+    output = list(stream)
+
+    parser = profiler.stages["parse_csv"]
+    assert parser.events_in is None
+    assert parser.events_out == 16
+
+    stage = profiler.stages["_drop_blank"]
+    assert stage.calls == 1
+    assert stage.events_in == 16
+    assert stage.events_out == len(output) == 15
+    assert stage.event_types[events.Cell] == 5
+    assert stage.event_types[events.StartRow] == 3
+
+    assert 0 <= stage.self_time <= stage.cumulative
+    assert parser.cumulative <= stage.cumulative
+
+
+def test_repeated_stage_names():
+    with profile() as profiler:
+        stream = _drop_blank(_drop_blank(parse_csv(io.StringIO("a,b\n1,\n"))))
+    list(stream)
+
+    assert list(profiler.stages) == ["parse_csv", "_drop_blank", "_drop_blank#2"]
+    assert profiler.stages["_drop_blank#2"].events_in == profiler.stages["_drop_blank"].events_out
+
+
+@collector(check=block_check(events.StartTable), receive_stream=True)
+def _drop_blank_in_tables(stream):
+    yield from _drop_blank(stream)
+
+
+def test_stages_created_while_consuming():
+    with profile() as profiler:
+        stream = promote_first_row(_drop_blank_in_tables(parse_csv(io.StringIO("a,b\n1,2\n"))))
+    list(stream)
+
+    assert "promote_first_row" in profiler.stages
+    assert "_drop_blank_in_tables" in profiler.stages
+    assert "_drop_blank" in profiler.stages
+
+
+def test_report_on_close():
+    reports = []
+    with profile(report=reports.append, report_format=REPORT_JSON):
+        stream = _pipeline()
+    list(stream)
+
+    assert len(reports) == 1
+    report = json.loads(reports[0])
+    assert [stage["name"] for stage in report["stages"]] == ["parse_csv", "_drop_blank"]
+    assert report["stages"][1]["event_types"]["Cell"] == 5
+
+
+def test_sampled_out():
+    with profile(sample=0) as profiler:
+        stream = _pipeline()
+    assert len(list(stream)) == 15
+    assert profiler.stages == {}
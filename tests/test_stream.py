@@ -0,0 +1,27 @@
+from sfdata_stream_parser import events
+from sfdata_stream_parser.stream import skip_subtree, with_provenance
+
+
+def _derive(stream):
+    for event in stream:
+        yield events.Cell.from_event(event, value=event.value * 2)
+
+
+def test_with_provenance():
+    source = [events.Cell(value=1), events.Cell(value=2)]
+
+    stream = with_provenance(_derive(_derive(source)), events.PROVENANCE_NONE)
+    assert [e.as_dict() for e in stream] == [{"value": 4}, {"value": 8}]
+
+    stream = with_provenance(_derive(_derive(source)), events.PROVENANCE_FULL)
+    assert [e.source.source for e in stream] == source
+
+    # The mode only applies while the pipeline is pulling events
+    assert events.get_provenance() == events.PROVENANCE_FULL
+
+
+def test_skip_subtree():
+    stream = iter([events.StartElement(tag='b'), events.TextNode(text='x'), events.EndElement(tag='b'),
+                   events.EndElement(tag='b'), events.StartElement(tag='c')])
+    skip_subtree(stream)
+    assert next(stream).tag == 'c'